@@ -1,300 +1,312 @@
-import re
 import os
 import sys
 import json
 import tqdm
 import subprocess
-import dockerfile
-
-# Helper function to process embedded bash
+import bash_filters
+from bash_pool import get_pool, get_enrich_pool
+from bash_worker import BASH_PARSER
+from cache import get_cache, content_key
+from dependencies import extract_dependencies
+from directives import build_ast, split_stages, stage_graph, stage_key
+from layer_rules import classify_tag, classify_image, classify_run
+from telemetry import get_logger, timed
+
+log = get_logger('app')
+
+FILTER_DIR = os.environ.get('BASH_FILTER_DIR', '/filters')
+
+# 'regex': dependencies are scraped from the raw RUN text by extract_layers.
+# 'semantic': every RUN is parsed and enriched once, and dependencies are
+# typed records read off the SC-* nodes (see dependencies.py).
+DEPENDENCY_MODE = os.environ.get('DEPENDENCY_MODE', 'regex')
+
+# Results keyed by content hash; bump a version when its producer changes.
+# Cached ASTs are shared between callers and must not be mutated.
+DOCKERFILE_CACHE = get_cache('dockerfile', version=2)
+LAYERS_CACHE = get_cache('layers', version=2)
+BASH_CACHE = get_cache('bash', version=1)
+ENRICHED_CACHE = get_cache('enriched', version=1)
+# Per build stage, keyed by the hash of the stage's resolved directives
+STAGE_LAYERS_CACHE = get_cache('stage-layers', version=1)
+STAGE_PACKAGES_CACHE = get_cache('stage-packages', version=1)
+
+# Helper function to process embedded bash (persistent parser pool + in-process filters)
 def parse_within(bash_str):
+    key = content_key(bash_str)
+    cached = BASH_CACHE.get(key)
+    if cached is not None:
+        return cached
+    try:
+        with timed('bash_parse'):
+            raw = get_pool().parse(bash_str)
+        if raw is None:
+            return {'type': 'UNKNOWN', 'children': []}
+        with timed('jq_filters'):
+            parsed = bash_filters.upgrade(raw)
+    except Exception:
+        log.debug('bash parse failed', extra={'bash': bash_str}, exc_info=True)
+        return {'type': 'UNKNOWN', 'children': []}
+    BASH_CACHE.put(key, parsed)
+    return parsed
+
+# Original three-process pipeline (parser, then jq twice), kept for benchmarking
+def parse_within_pipeline(bash_str):
     parsed = {'type': 'UNKNOWN', 'children': []}  # Start with nothing
     try:
-        step1 = subprocess.check_output(
-            '/build/app',
-            stderr=subprocess.DEVNULL,
-            input=bash_str.encode('utf-8')
-        )
-        step2 = subprocess.check_output(
-            ['jq', '-c', '--from-file', '/filters/filter-1.jq'],
-            stderr=subprocess.DEVNULL,
-            input=step1
-        )
-        step3 = subprocess.check_output(
-            ['jq', '-c', '--from-file', '/filters/filter-2.jq'],
-            stderr=subprocess.DEVNULL,
-            input=step2
-        )
+        with timed('bash_parse'):
+            step1 = subprocess.check_output(
+                BASH_PARSER,
+                stderr=subprocess.DEVNULL,
+                input=bash_str.encode('utf-8')
+            )
+        with timed('jq_filters'):
+            step2 = subprocess.check_output(
+                ['jq', '-c', '--from-file', os.path.join(FILTER_DIR, 'filter-1.jq')],
+                stderr=subprocess.DEVNULL,
+                input=step1
+            )
+            step3 = subprocess.check_output(
+                ['jq', '-c', '--from-file', os.path.join(FILTER_DIR, 'filter-2.jq')],
+                stderr=subprocess.DEVNULL,
+                input=step2
+            )
         parsed = json.loads(step3.decode('utf-8'))
     except Exception:
         return {'type': 'UNKNOWN', 'children': []}
     return parsed
 
-# Function to process Dockerfile and generate AST
-def process_dockerfile(dockerfile_path):
-    VALID_DIRECTIVES = [
-        'from', 'run', 'cmd', 'label', 'maintainer', 'expose', 'env', 'add', 'copy',
-        'entrypoint', 'volume', 'user', 'workdir', 'arg', 'onbuild', 'stopsignal', 'healthcheck', 'shell'
-    ]
-
+# Parse and enrich RUN bodies into SC-* trees, one tree per input string,
+# through the long-lived app.ts --stream enrichers
+def enrich_within(bash_strs):
+    trees = []
+    for bash_str in bash_strs:
+        key = content_key(bash_str)
+        tree = ENRICHED_CACHE.get(key)
+        if tree is None:
+            tree = parse_within(bash_str)
+            if tree['type'] != 'UNKNOWN':
+                try:
+                    with timed('enrich'):
+                        enriched = get_enrich_pool().parse(tree)
+                except Exception as e:
+                    log.warning('enrich failed', extra={'error': str(e)})
+                    enriched = None
+                if enriched is not None and enriched['type'] != 'UNKNOWN':
+                    tree = enriched
+                    ENRICHED_CACHE.put(key, tree)
+        trees.append(tree)
+    return trees
+
+# Function to process Dockerfile and generate AST (every directive; see directives.py)
+def process_dockerfile(dockerfile_path, content=None):
     try:
-        with open(dockerfile_path) as dfh:
-            content = dfh.read()
-            print(f"Dockerfile content:\n{content}")  # Debugging line
-            parsed = dockerfile.parse_string(content)
-            print(f"Parsed Dockerfile: {parsed}")  # Debugging line
-
-        dockerfile_ast = {
-            'type': 'DOCKER-FILE',
-            'children': []
-        }
-
-        for directive in parsed:
-            if directive.cmd.lower() not in VALID_DIRECTIVES:
-                raise Exception(f'Found invalid directive {directive.cmd}')
-
-            if directive.cmd.lower() == 'run':
-                dockerfile_ast['children'].append({
-                    'type': 'DOCKER-RUN',
-                    'children': [{
-                        'type': 'MAYBE-BASH',
-                        'value': directive.value[0],
-                        'children': []
-                    }]
-                })
-            elif directive.cmd.lower() == 'from':
-                from_node = {
-                    'type': 'DOCKER-FROM',
-                    'children': []
-                }
-
-                value = directive.value[0]
-                name = value.split('/')[-1].strip() if '/' in value else value
-                name = name.split(':')[0].strip() if ':' in name else name
-
-                from_node['children'].append({
-                    'type': 'DOCKER-IMAGE-NAME',
-                    'value': name,
-                    'children': []
-                })
-
-                if '/' in value:
-                    from_node['children'].append({
-                        'type': 'DOCKER-IMAGE-REPO',
-                        'value': value.split('/')[0].strip(),
-                        'children': []
-                    })
-
-                if ':' in value:
-                    from_node['children'].append({
-                        'type': 'DOCKER-IMAGE-TAG',
-                        'value': value.split(':')[-1].strip(),
-                        'children': []
-                    })
-
-                dockerfile_ast['children'].append(from_node)
-
-        print(f"Dockerfile AST: {dockerfile_ast}")  # Debugging line
+        if content is None:
+            with open(dockerfile_path) as dfh:
+                content = dfh.read()
+        log.debug('dockerfile content', extra={'path': dockerfile_path, 'content': content})
+
+        key = content_key(content)
+        cached = DOCKERFILE_CACHE.get(key)
+        if cached is not None:
+            return cached
+
+        with timed('dockerfile_parse'):
+            dockerfile_ast = build_ast(content)
+        log.debug('dockerfile ast', extra={'path': dockerfile_path, 'ast': dockerfile_ast})
+        DOCKERFILE_CACHE.put(key, dockerfile_ast)
         return dockerfile_ast
 
     except Exception as e:
-        print(f"Error processing {dockerfile_path}: {str(e)}")
+        log.warning('dockerfile processing failed', extra={'path': dockerfile_path, 'error': str(e)})
         return None
 
 
-# Tree traversal to extract OS, Language, and Dependencies
+# Tree traversal to extract OS, Language, and Dependencies (rule tables in layer_rules.py)
 def extract_layers(ast):
+    scan = scan_layers(ast)
+    language_list = scan['language']
+    # If no language was detected, default to 'c'
+    if not scan['detected']:
+        language_list.append('c')
+    return scan['os'], language_list, scan['dependencies']
+
+
+# extract_layers without the default language. 'probe' is the position of the
+# language taken from a RUN line because nothing had been detected yet; when
+# scans of consecutive stages are merged, it is dropped if an earlier stage
+# already detected a language (see merge_layers).
+def scan_layers(ast):
     os_list = []
     language_list = []
     dependencies_list = []
     language_detected = False
+    probe = None
 
-    def traverse(node):
-        nonlocal language_detected
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        node_type = node['type']
 
-        # Extract OS from 'DOCKER-FROM'
-        if node['type'] == 'DOCKER-FROM':
+        # Extract OS and language from 'DOCKER-FROM'
+        if node_type == 'DOCKER-FROM':
+            children = node.get('children', [])
             os_detected = False
-            for child in node.get('children', []):
-                if child['type'] == 'DOCKER-IMAGE-TAG' and not os_detected:
-                    tag_value = child['value'].lower()
-                    # Identify OS from tag (e.g., alpine, ubuntu)
-                    if 'alpine' in tag_value:
-                        os_list.append('alpine')
-                        os_detected = True
-                    elif 'ubuntu' in tag_value:
-                        os_list.append('ubuntu')
-                        os_detected = True
-                    elif 'debian' in tag_value:
-                        os_list.append('debian')
-                        os_detected = True
-                    elif 'slim' in tag_value:
-                        os_list.append('debian-slim')
-                        os_detected = True
-                    elif 'centos' in tag_value:
-                        os_list.append('centos')
-                        os_detected = True
-                    elif 'fedora' in tag_value:
-                        os_list.append('fedora')
+            for child in children:
+                child_type = child['type']
+                if child_type == 'DOCKER-IMAGE-TAG':
+                    if not os_detected:
+                        os_name = classify_tag(child['value'])
+                        if os_name:
+                            os_list.append(os_name)
+                            os_detected = True
+                elif child_type == 'DOCKER-IMAGE-NAME':
+                    os_name, language = classify_image(child['value'])
+                    if os_name and not os_detected:
+                        os_list.append(os_name)
                         os_detected = True
+                    if language:
+                        # Combine with tag for version detection (3.9 from 3.9-alpine)
+                        tag = next((c for c in children if c['type'] == 'DOCKER-IMAGE-TAG'), None)
+                        if tag:
+                            language += tag['value'].lower().split('-')[0]
+                        language_list.append(language)
+                        language_detected = True
+            continue
+
+        # Extract language and dependencies from 'DOCKER-RUN'
+        if node_type == 'DOCKER-RUN':
+            language, dependencies, dependency_languages = classify_run(node['children'][0]['value'])
+            if language and not language_detected:
+                probe = len(language_list)
+                language_list.append(language)
+                language_detected = True
+            dependencies_list.extend(dependencies)
+            if dependency_languages:
+                language_list.extend(dependency_languages)
+                language_detected = True
+            continue
+
+        # Visit child nodes in document order; FROM and RUN subtrees only hold
+        # image parts and bash, so they are not descended into
+        children = node.get('children')
+        if children:
+            stack.extend(reversed(children))
+
+    return {
+        'os': os_list,
+        'language': language_list,
+        'dependencies': dependencies_list,
+        'detected': language_detected,
+        'probe': probe
+    }
 
-                elif child['type'] == 'DOCKER-IMAGE-NAME' and not os_detected:
-                    base_image = child['value'].lower()
-                    if base_image in ['alpine', 'ubuntu', 'debian', 'centos', 'fedora']:
-                        os_list.append(base_image)
-                        os_detected = True
 
-                # Detect language and version from base image
-                if child['type'] == 'DOCKER-IMAGE-NAME':
-                    base_image = child['value'].lower()
-                    if 'python' in base_image:
-                        # Combine with tag for version detection
-                        language_version = 'python'
-                        if 'DOCKER-IMAGE-TAG' in [c['type'] for c in node.get('children', [])]:
-                            tag_node = next(c for c in node['children'] if c['type'] == 'DOCKER-IMAGE-TAG')
-                            version = tag_node['value'].lower().split('-')[0]  # e.g., 3.9 from 3.9-alpine
-                            language_version += version
-                        language_list.append(language_version)
-                        language_detected = True
-                    elif 'node' in base_image:
-                        language_version = 'nodejs'
-                        if 'DOCKER-IMAGE-TAG' in [c['type'] for c in node.get('children', [])]:
-                            tag_node = next(c for c in node['children'] if c['type'] == 'DOCKER-IMAGE-TAG')
-                            version = tag_node['value'].lower().split('-')[0]
-                            language_version += version
-                        language_list.append(language_version)
-                        language_detected = True
-                    elif 'openjdk' in base_image:
-                        language_version = 'java'
-                        if 'DOCKER-IMAGE-TAG' in [c['type'] for c in node.get('children', [])]:
-                            tag_node = next(c for c in node['children'] if c['type'] == 'DOCKER-IMAGE-TAG')
-                            version = tag_node['value'].lower().split('-')[0]
-                            language_version += version
-                        language_list.append(language_version)
-                        language_detected = True
-                    elif 'golang' in base_image:
-                        language_version = 'golang'
-                        if 'DOCKER-IMAGE-TAG' in [c['type'] for c in node.get('children', [])]:
-                            tag_node = next(c for c in node['children'] if c['type'] == 'DOCKER-IMAGE-TAG')
-                            version = tag_node['value'].lower().split('-')[0]
-                            language_version += version
-                        language_list.append(language_version)
-                        language_detected = True
-        # Extract dependencies from 'DOCKER-RUN'
-        elif node['type'] == 'DOCKER-RUN':
-            run_command = node['children'][0]['value'].lower()
-
-            # Detect language from run command if not already detected
-            if not language_detected:
-                if 'openjdk' in run_command or 'java' in run_command:
-                    language_list.append('java')
-                    language_detected = True
-                elif 'python' in run_command:
-                    if 'python3' in run_command:
-                        language_list.append('python3')
-                    else:
-                        language_list.append('python')
-                    language_detected = True
-                elif 'python3' in run_command:
-                    language_list.append('python3')
-                    language_detected = True
-                elif 'node' in run_command:
-                    language_list.append('nodejs')
-                    language_detected = True
-                elif 'golang' in run_command:
-                    language_list.append('golang')
-                    language_detected = True
-                elif 'ruby' in run_command:
-                    language_list.append('ruby')
-                    language_detected = True
-                elif 'gcc' in run_command or 'g++' in run_command:
-                    language_list.append('c')
-                    language_detected = True
-            # Extract dependencies from package installation commands
-            if 'apt-get install' in run_command:
-                dependencies = re.findall(r'apt-get install\s+-y\s+([\w\s\-\.]+)', run_command)
-                dependencies_list.extend(dependencies)
-                # 检测可能的语言
-                for dep in dependencies:
-                    dep = dep.strip().lower()
-                    if 'python3' in dep or 'python' in dep:
-                        if 'python3-pip' in dep:  # 检查具体的 Python 工具链
-                            language_list.append('python3')
-                        else:
-                            language_list.append('python')
-                        language_detected = True
-                    elif 'nodejs' in dep or 'node' in dep:
-                        language_list.append('nodejs')
-                        language_detected = True
-                    elif 'openjdk' in dep or 'java' in dep:
-                        language_list.append('java')
-                        language_detected = True
-                    elif 'golang' in dep or 'go' in dep:
-                        language_list.append('golang')
-                        language_detected = True
-                    elif 'ruby' in dep:
-                        language_list.append('ruby')
-                        language_detected = True
-                    elif 'gcc' in dep or 'g++' in dep:
-                        language_list.append('c/c++')
-                        language_detected = True
-            elif 'pip install' in run_command or 'pip3 install' in run_command:
-                dependencies = re.findall(r'pip(?:3)? install\s+([\w\s\-\.]+)', run_command)
-                dependencies_list.extend(dependencies)
-            elif 'npm install' in run_command:
-                dependencies = re.findall(r'npm install\s+([\w\s\-\.]+)', run_command)
-                dependencies_list.extend(dependencies)
-            elif 'gem install' in run_command:
-                dependencies = re.findall(r'gem install\s+([\w\s\-\.]+)', run_command)
-                dependencies_list.extend(dependencies)
-        # Recursively traverse child nodes
-        for child in node.get('children', []):
-            traverse(child)
-
-    traverse(ast)
+# Stage scans in document order -> the same lists extract_layers returns for
+# the whole file
+def merge_layers(scans):
+    os_list = []
+    language_list = []
+    dependencies_list = []
+    language_detected = False
+    for scan in scans:
+        languages = scan['language']
+        probe = scan['probe']
+        if language_detected and probe is not None:
+            languages = languages[:probe] + languages[probe + 1:]
+        os_list.extend(scan['os'])
+        language_list.extend(languages)
+        dependencies_list.extend(scan['dependencies'])
+        language_detected = language_detected or scan['detected']
 
-    # If no language was detected, default to 'c'
     if not language_detected:
         language_list.append('c')
-
     return os_list, language_list, dependencies_list
 
 
+# (content key, stage AST) per build stage, global ARGs first
+def stage_asts(ast):
+    return [
+        (content_key(stage_key(nodes)), {'type': 'DOCKER-FILE', 'children': nodes})
+        for nodes in split_stages(ast) if nodes
+    ]
+
 
+# extract_layers, one stage at a time, memoized per stage: when only the last
+# stage of a multi-stage build changes, only that stage is scanned again
+def extract_stage_layers(stages):
+    scans = []
+    for key, stage in stages:
+        scan = STAGE_LAYERS_CACHE.get(key)
+        if scan is None:
+            scan = scan_layers(stage)
+            STAGE_LAYERS_CACHE.put(key, scan)
+        scans.append(scan)
+    return merge_layers(scans)
 
 
 
 
 
+
+
+
+# Typed dependency records from the enriched RUN bodies (one parse per RUN)
+def extract_packages(ast):
+    runs = [
+        node['children'][0]['value']
+        for node in ast['children'] if node['type'] == 'DOCKER-RUN'
+    ]
+    return extract_dependencies(enrich_within(runs))
+
+# extract_packages per stage, memoized like extract_stage_layers
+def extract_stage_packages(stages):
+    packages = []
+    for key, stage in stages:
+        records = STAGE_PACKAGES_CACHE.get(key)
+        if records is None:
+            records = extract_packages(stage)
+            STAGE_PACKAGES_CACHE.put(key, records)
+        packages.extend(records)
+    return packages
+
 # Main function to process Dockerfiles sequentially
-def process(line):
-    print(f"Processing {line}")  # Debugging line
-    ast = process_dockerfile(line.strip())
+def process(line, content=None, dependency_mode=None):
+    dependency_mode = dependency_mode or DEPENDENCY_MODE
+    log.debug('processing', extra={'path': line.strip()})
+    dockerfile_path = line.strip()
+    if content is None:
+        try:
+            with open(dockerfile_path) as dfh:
+                content = dfh.read()
+        except Exception as e:
+            log.warning('dockerfile read failed', extra={'path': dockerfile_path, 'error': str(e)})
+            return None
+
+    ast = process_dockerfile(dockerfile_path, content)
     if ast:
-        os_list, language_list, dependencies_list = extract_layers(ast)
-        print(f"AST: {ast}")  # Debugging line
-        return {
+        key = content_key(content)
+        layers = LAYERS_CACHE.get(key)
+        stages = None
+        if layers is None:
+            with timed('extract_layers'):
+                stages = stage_asts(ast)
+                layers = [list(layer) for layer in extract_stage_layers(stages)]
+            LAYERS_CACHE.put(key, layers)
+        # Copies, callers extend the dependency list in place
+        os_list, language_list, dependencies_list = (list(layer) for layer in layers)
+        result = {
         'ast': ast,
         'os': os_list,
         'language': language_list,
-        'dependencies': dependencies_list
+        'dependencies': dependencies_list,
+        'stages': stage_graph(ast)
     }
+        if dependency_mode == 'semantic':
+            packages = extract_stage_packages(stages or stage_asts(ast))
+            result['packages'] = packages
+            result['dependencies'] = [record['package'] for record in packages]
+        return result
     return None
 
-#dockerfile_paths = ['/home/comp/csxtchen/group/dockerfile_analyzer/binnacle-icse2020/datasets/3-phase-3-dockerfile-asts/generate/Dockerfile']  # Hardcoded paths for testing
-
-# # Process Dockerfiles sequentially (single thread)
-# with open('dockerfile_ast.txt', mode='w') as ast_file, \
-#      open('dockerfile_summary.txt', mode='w') as summary_file:
-    
-#     for line in tqdm.tqdm(dockerfile_paths, total=len(dockerfile_paths), desc="Processing"):
-#         result = process(line)
-#         if result is None:
-#             continue
-#         ast_file.write('{}\n'.format(json.dumps(result['ast'])))
-#         summary = {
-#             'os': result['os'],
-#             'language': result['language'],
-#             'dependencies': result['dependencies']
-#         }
-#     summary_file.write('{}\n'.format(json.dumps(summary)))
+# Batch processing of Dockerfile corpora (parallel, checkpointed): see batch.py
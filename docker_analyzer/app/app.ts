@@ -1,10 +1,19 @@
 import * as fs from 'fs';
 import * as process from 'process';
+import * as readline from 'readline';
 import { EnrichPass } from './enrich';
 import { IdentityPass, DopsNode, stringifyBash, Edit } from './ast';
 
 const DEBUG = true;
 
+// --stream: answer each stdin line as soon as it arrives, for a long-lived
+// client that keeps this process open (see bash_pool.get_enrich_pool)
+const STREAM = process.argv.includes('--stream');
+
+// --verify: also run the original full-tree loop over every input line and
+// report the lines where it disagrees with enrichToFixpoint (exit status 1)
+const VERIFY = process.argv.includes('--verify');
+
 // Prints in a format graphviz accepts for debugging!
 const vizify = (root: any, id: number = 0) => {
   if (!root || !root.children) {
@@ -38,16 +47,24 @@ const vizify = (root: any, id: number = 0) => {
   return id;
 };
 
-const hasMaybeSemanticCommand = (cur) => {
-  if (!cur) {
-    return false;
-  }
+interface Slot { holder: DopsNode[]; index: number; node: DopsNode; };
 
-  if (cur.type === 'MAYBE-SEMANTIC-COMMAND') {
-    return true;
+// Topmost MAYBE-SEMANTIC-COMMAND nodes below cur, with the array slot that
+// holds each of them so an enriched subtree can be put back in place
+const collectMaybeSemanticCommands = (cur, slots: Slot[] = []) => {
+  if (!cur || !cur.children) {
+    return slots;
   }
 
-  return cur.children.some(x => hasMaybeSemanticCommand(x));
+  cur.children.forEach((child, index) => {
+    if (child && child.type === 'MAYBE-SEMANTIC-COMMAND') {
+      slots.push({ holder: cur.children, index, node: child });
+    } else {
+      collectMaybeSemanticCommands(child, slots);
+    }
+  });
+
+  return slots;
 };
 
 class UnparsePass extends IdentityPass {
@@ -65,27 +82,144 @@ class UnparsePass extends IdentityPass {
 
 const enrich = new EnrichPass();
 
-fs.readFileSync(0, 'utf8')
-  .toString()
-  .split('\n')
-  .forEach(line => {
-    if (line.trim().length === 0) {
-      return;
-    }
+// Enriched payloads carry the original (unwalked) command arguments, so they
+// can hold more MAYBE-SEMANTIC-COMMANDs. The first pass walks the whole tree;
+// later passes only walk those leftover subtrees, which were all introduced
+// by the previous pass, and splice the results back in.
+const enrichToFixpoint = (root: DopsNode): DopsNode => {
+  let result = enrich.walk(root);
+
+  while (result && result.type === 'MAYBE-SEMANTIC-COMMAND') {
+    result = enrich.walk(result);
+  }
+
+  let frontier = collectMaybeSemanticCommands(result);
+  const pruned = new Set<DopsNode[]>();
 
-    try {
-      let result = enrich.walk(JSON.parse(line));
+  while (frontier.length > 0) {
+    // The same argument node can be shared by several payloads
+    const enriched = new Map<DopsNode, DopsNode | null>();
+    const next: Slot[] = [];
 
-      while (hasMaybeSemanticCommand(result)) {
-        result = enrich.walk(result);
+    frontier.forEach(({ holder, index, node }) => {
+      const seen = enriched.has(node);
+      if (!seen) {
+        enriched.set(node, enrich.walk(node));
       }
 
-      console.log(JSON.stringify(result));
-    } catch (ex) {
-      if (DEBUG) {
-        console.log(JSON.stringify({ type: 'UNKNOWN', children: [{ type: 'DEBUG', value: ex.toString(), children: [] }]}));
-      } else {
-        console.log(JSON.stringify({ type: 'UNKNOWN', children: [] }));
+      const replacement = enriched.get(node);
+      holder[index] = replacement;
+
+      if (replacement === null) {
+        pruned.add(holder);
+      } else if (replacement.type === 'MAYBE-SEMANTIC-COMMAND') {
+        next.push({ holder, index, node: replacement });
+      } else if (!seen) {
+        collectMaybeSemanticCommands(replacement, next);
       }
+    });
+
+    frontier = next;
+  }
+
+  // Deleted subtrees are dropped last so that no slot index goes stale
+  pruned.forEach(holder => {
+    const kept = holder.filter(x => x !== null);
+    holder.length = 0;
+    holder.push(...kept);
+  });
+
+  return result;
+};
+
+const hasMaybeSemanticCommand = (cur) => {
+  if (!cur || !cur.children) {
+    return false;
+  }
+
+  return cur.type === 'MAYBE-SEMANTIC-COMMAND' || cur.children.some(hasMaybeSemanticCommand);
+};
+
+// The loop enrichToFixpoint replaces: re-walk the whole tree until nothing
+// is left to enrich
+const enrichFullTree = (root: DopsNode): DopsNode => {
+  let result = enrich.walk(root);
+
+  while (hasMaybeSemanticCommand(result)) {
+    result = enrich.walk(result);
+  }
+
+  return result;
+};
+
+// JSON with sorted keys: re-walked nodes come back with their keys in a
+// different order, which is not a difference in the tree
+const canonical = (root) => JSON.stringify(root, (key, value) => {
+  if (!value || typeof value !== 'object' || Array.isArray(value)) {
+    return value;
+  }
+
+  return Object.keys(value).sort().reduce((obj, k) => ({ ...obj, [k]: value[k] }), {});
+});
+
+const enrichCanonical = (enricher, line: string): string => {
+  try {
+    return canonical(enricher(JSON.parse(line)));
+  } catch (ex) {
+    return `error: ${ex}`;
+  }
+};
+
+const enrichLine = (line: string): string => {
+  try {
+    return JSON.stringify(enrichToFixpoint(JSON.parse(line)));
+  } catch (ex) {
+    if (DEBUG) {
+      return JSON.stringify({ type: 'UNKNOWN', children: [{ type: 'DEBUG', value: ex.toString(), children: [] }]});
+    } else {
+      return JSON.stringify({ type: 'UNKNOWN', children: [] });
+    }
+  }
+};
+
+if (STREAM) {
+  // Diagnostics go to stderr so stdout stays exactly one result per line
+  console.log = console.error;
+
+  readline.createInterface({ input: process.stdin, crlfDelay: Infinity })
+    .on('line', line => {
+      if (line.trim().length === 0) {
+        return;
+      }
+
+      process.stdout.write(enrichLine(line) + '\n');
+    });
+} else if (VERIFY) {
+  const lines = fs.readFileSync(0, 'utf8')
+    .toString()
+    .split('\n')
+    .filter(line => line.trim().length !== 0);
+
+  let mismatches = 0;
+
+  lines.forEach((line, index) => {
+    if (enrichCanonical(enrichToFixpoint, line) !== enrichCanonical(enrichFullTree, line)) {
+      console.error(`line ${index + 1}: incremental and full-tree results differ`);
+      mismatches += 1;
     }
   });
+
+  console.log(JSON.stringify({ lines: lines.length, mismatches }));
+  process.exit(mismatches === 0 ? 0 : 1);
+} else {
+  fs.readFileSync(0, 'utf8')
+    .toString()
+    .split('\n')
+    .forEach(line => {
+      if (line.trim().length === 0) {
+        return;
+      }
+
+      console.log(enrichLine(line));
+    });
+}
@@ -0,0 +1,352 @@
+import os
+import sys
+import json
+import mmap
+import zlib
+import bisect
+import struct
+import argparse
+from collections import OrderedDict
+
+# Compact output formats for batch runs.
+#
+# AstStore: a chunked, zlib-compressed container for ASTs with an offset
+# index, replacing dockerfile_ast.txt for large corpora.
+#
+#   'DAST1\n'
+#   chunk*    'CHNK' u32 header_len u32 payload_len header payload
+#               header:  JSON {"paths": [...], "lengths": [...]}
+#               payload: zlib(concatenated AST JSON texts)
+#   index     'INDX' u32 index_len zlib(JSON {"chunks": [[offset, records], ...]})
+#   footer    u64 index_offset 'DAST'
+#
+# Chunk headers are enough to rebuild the index, so a file whose writer was
+# interrupted (no index yet) can still be read, and batch.py can truncate it
+# back to a checkpoint and keep appending. Readers mmap the file and
+# decompress only the chunk that holds the requested AST.
+#
+# SummaryTable: dockerfile_summary rows as a Parquet dataset (a directory of
+# part files, one per flush) with path/os/language/dependencies/packages
+# columns. Needs pyarrow, an optional dependency (requirements-parquet.txt).
+#
+#   python ast_store.py get dockerfile_ast.dast 42
+#   python ast_store.py get dockerfile_ast.dast /data/x/Dockerfile
+#   python ast_store.py relayer dockerfile_ast.dast --out summary.txt
+
+MAGIC = b'DAST1\n'
+FOOTER = struct.Struct('<Q4s')
+SECTION = struct.Struct('<4sII')
+CHUNK_RECORDS = 256
+CHUNK_BYTES = 4 * 1024 * 1024  # uncompressed
+
+
+PYARROW_MISSING = 'Parquet summaries need pyarrow (pip install -r requirements-parquet.txt)'
+
+
+class AstStoreError(Exception):
+    pass
+
+
+class AstStoreWriter:
+    def __init__(self, path, offset=None, chunk_records=CHUNK_RECORDS, level=6):
+        self.path = path
+        self.chunk_records = chunk_records
+        self.level = level
+        self.chunks = []  # [offset, records]
+        self.pending = []
+        self.pending_paths = []
+        self.pending_bytes = 0
+
+        if offset is None:
+            self.fh = open(path, 'wb')
+            self.fh.write(MAGIC)
+        else:
+            # Resume: keep the chunks before `offset`, drop everything after
+            self.chunks = [[chunk_offset, len(paths)] for chunk_offset, paths, _ in _scan_chunks(path, offset)]
+            self.fh = open(path, 'r+b')
+            self.fh.truncate(offset)
+            self.fh.seek(offset)
+
+    def add(self, path, ast_json):
+        data = ast_json.encode('utf-8')
+        self.pending.append(data)
+        self.pending_paths.append(path)
+        self.pending_bytes += len(data)
+        if len(self.pending) >= self.chunk_records or self.pending_bytes >= CHUNK_BYTES:
+            self.flush()
+
+    # Writes buffered ASTs as one chunk; tell() is then a safe resume point
+    def flush(self):
+        if self.pending:
+            header = json.dumps({
+                'paths': self.pending_paths,
+                'lengths': [len(data) for data in self.pending],
+            }).encode('utf-8')
+            payload = zlib.compress(b''.join(self.pending), self.level)
+            self.chunks.append([self.fh.tell(), len(self.pending)])
+            self.fh.write(SECTION.pack(b'CHNK', len(header), len(payload)))
+            self.fh.write(header)
+            self.fh.write(payload)
+            self.pending = []
+            self.pending_paths = []
+            self.pending_bytes = 0
+        self.fh.flush()
+
+    # flush() and make it durable; used before checkpointing tell()
+    def sync(self):
+        self.flush()
+        os.fsync(self.fh.fileno())
+
+    def tell(self):
+        return self.fh.tell()
+
+    def close(self):
+        self.flush()
+        index = zlib.compress(json.dumps({'chunks': self.chunks}).encode('utf-8'))
+        index_offset = self.fh.tell()
+        self.fh.write(SECTION.pack(b'INDX', len(index), 0))
+        self.fh.write(index)
+        self.fh.write(FOOTER.pack(index_offset, b'DAST'))
+        self.fh.close()
+
+
+# (offset, paths, lengths) for every complete chunk before `end`
+def _scan_chunks(path, end=None):
+    chunks = []
+    with open(path, 'rb') as fh:
+        if fh.read(len(MAGIC)) != MAGIC:
+            raise AstStoreError(f'{path} is not an AST store')
+        size = os.fstat(fh.fileno()).st_size if end is None else end
+        offset = len(MAGIC)
+        while offset + SECTION.size <= size:
+            fh.seek(offset)
+            kind, header_len, payload_len = SECTION.unpack(fh.read(SECTION.size))
+            if kind != b'CHNK' or offset + SECTION.size + header_len + payload_len > size:
+                break
+            header = json.loads(fh.read(header_len))
+            chunks.append((offset, header['paths'], header['lengths']))
+            offset += SECTION.size + header_len + payload_len
+    return chunks
+
+
+class AstStoreReader:
+    def __init__(self, path, cached_chunks=4):
+        self.filename = path
+        self.fh = open(path, 'rb')
+        self.map = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise AstStoreError(f'{path} is not an AST store')
+        self.cache = OrderedDict()
+        self.cached_chunks = cached_chunks
+
+        self.offsets = self._read_index()
+        self.starts = []  # index of the first record in each chunk
+        count = 0
+        for _, records in self.offsets:
+            self.starts.append(count)
+            count += records
+        self.count = count
+        self._paths = None
+
+    def _read_index(self):
+        if len(self.map) >= len(MAGIC) + FOOTER.size:
+            index_offset, tag = FOOTER.unpack_from(self.map, len(self.map) - FOOTER.size)
+            if tag == b'DAST':
+                kind, index_len, _ = SECTION.unpack_from(self.map, index_offset)
+                if kind == b'INDX':
+                    start = index_offset + SECTION.size
+                    return json.loads(zlib.decompress(self.map[start:start + index_len]))['chunks']
+        # No index (interrupted writer): rebuild it from the chunk headers
+        return [[offset, len(paths)] for offset, paths, _ in _scan_chunks(self.filename)]
+
+    def __len__(self):
+        return self.count
+
+    def _chunk(self, number):
+        chunk = self.cache.get(number)
+        if chunk is not None:
+            self.cache.move_to_end(number)
+            return chunk
+        offset = self.offsets[number][0]
+        _, header_len, payload_len = SECTION.unpack_from(self.map, offset)
+        start = offset + SECTION.size
+        header = json.loads(self.map[start:start + header_len])
+        payload = zlib.decompress(self.map[start + header_len:start + header_len + payload_len])
+        bounds = [0]
+        for length in header['lengths']:
+            bounds.append(bounds[-1] + length)
+        chunk = (header['paths'], payload, bounds)
+        self.cache[number] = chunk
+        while len(self.cache) > self.cached_chunks:
+            self.cache.popitem(last=False)
+        return chunk
+
+    def _locate(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        number = bisect.bisect_right(self.starts, index) - 1
+        return number, index - self.starts[number]
+
+    def path(self, index):
+        number, position = self._locate(index)
+        return self._chunk(number)[0][position]
+
+    def get_json(self, index):
+        number, position = self._locate(index)
+        _, payload, bounds = self._chunk(number)
+        return payload[bounds[position]:bounds[position + 1]].decode('utf-8')
+
+    def get(self, index):
+        return json.loads(self.get_json(index))
+
+    # Record number of a Dockerfile path (reads every chunk header once)
+    def find(self, path):
+        if self._paths is None:
+            self._paths = {}
+            for number, (offset, paths, _) in enumerate(_scan_chunks(self.filename)):
+                for position, chunk_path in enumerate(paths):
+                    self._paths.setdefault(chunk_path, self.starts[number] + position)
+        return self._paths.get(path)
+
+    def __iter__(self):
+        for number in range(len(self.offsets)):
+            paths, payload, bounds = self._chunk(number)
+            for position, path in enumerate(paths):
+                yield path, json.loads(payload[bounds[position]:bounds[position + 1]])
+
+    def close(self):
+        self.map.close()
+        self.fh.close()
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise AstStoreError(PYARROW_MISSING)
+    return pyarrow
+
+
+def summary_schema(pa):
+    strings = pa.list_(pa.string())
+    return pa.schema([
+        ('path', pa.string()),
+        ('os', strings),
+        ('language', strings),
+        ('dependencies', strings),
+        ('packages', pa.list_(pa.struct([
+            ('manager', pa.string()), ('package', pa.string()), ('version', pa.string())
+        ]))),
+    ])
+
+
+class SummaryTableWriter:
+    # Summary rows as a Parquet dataset directory; every flush writes one
+    # part file, so a resumed run only has to drop the parts after its checkpoint
+    def __init__(self, path, parts=None, row_group=50000):
+        self.pa = _pyarrow()
+        self.schema = summary_schema(self.pa)
+        self.path = path
+        self.row_group = row_group
+        self.rows = []
+        os.makedirs(path, exist_ok=True)
+        existing = sorted(name for name in os.listdir(path) if name.startswith('part-'))
+        if parts is None:
+            parts = 0
+        for name in existing[parts:]:
+            os.remove(os.path.join(path, name))
+        self.parts = parts
+
+    def add(self, summary):
+        self.rows.append(summary)
+        if len(self.rows) >= self.row_group:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        columns = {name: [row.get(name) for row in self.rows] for name in self.schema.names}
+        table = self.pa.Table.from_pydict(columns, schema=self.schema)
+        target = os.path.join(self.path, f'part-{self.parts:05d}.parquet')
+        self.pa.parquet.write_table(table, target + '.tmp', compression='zstd')
+        os.replace(target + '.tmp', target)
+        self.parts += 1
+        self.rows = []
+
+    def sync(self):
+        self.flush()
+
+    def tell(self):
+        return self.parts
+
+    def close(self):
+        self.flush()
+
+
+def read_summary_table(path):
+    pa = _pyarrow()
+    return pa.parquet.read_table(path, schema=summary_schema(pa))
+
+
+# Re-runs layer extraction over stored ASTs with the current rules; no
+# Dockerfile is read or parsed again
+def relayer(store_path):
+    from app import extract_layers
+
+    reader = AstStoreReader(store_path)
+    try:
+        for path, ast in reader:
+            os_list, language_list, dependencies_list = extract_layers(ast)
+            yield {'path': path, 'os': os_list, 'language': language_list, 'dependencies': dependencies_list}
+    finally:
+        reader.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Read AST stores written by batch.py --ast-format store')
+    commands = parser.add_subparsers(dest='command', required=True)
+    get = commands.add_parser('get', help='print one AST by record number or path')
+    get.add_argument('store')
+    get.add_argument('key')
+    again = commands.add_parser('relayer', help='re-run extract_layers over every stored AST')
+    again.add_argument('store')
+    again.add_argument('--out', default='-', help='summary JSON lines (default: stdout)')
+    again.add_argument('--parquet', help='write a Parquet summary dataset instead')
+    args = parser.parse_args(argv)
+
+    try:
+        return _run(args)
+    except AstStoreError as e:
+        print(f'ast_store.py: error: {e}', file=sys.stderr)
+        return 1
+
+
+def _run(args):
+    if args.command == 'get':
+        reader = AstStoreReader(args.store)
+        index = int(args.key) if args.key.isdigit() else reader.find(args.key)
+        if index is None:
+            print(f'{args.key} is not in {args.store}', file=sys.stderr)
+            return 1
+        print(reader.get_json(index))
+        return 0
+
+    if args.parquet:
+        writer = SummaryTableWriter(args.parquet)
+        for summary in relayer(args.store):
+            writer.add(summary)
+        writer.close()
+        return 0
+    out = sys.stdout if args.out == '-' else open(args.out, 'w')
+    try:
+        for summary in relayer(args.store):
+            out.write(json.dumps(summary) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
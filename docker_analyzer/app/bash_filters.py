@@ -0,0 +1,639 @@
+import json
+
+# In-process port of filter-1.jq and filter-2.jq.
+#
+# parse_within used to pipe the parser output through two `jq` processes;
+# these functions apply the same `upgrade` transforms to the decoded JSON so
+# the output is identical without paying for two extra process launches per
+# RUN line. jq quirks are kept on purpose (e.g. the `=` typo in the
+# FD_REDIRECT branch of filter-2.jq makes every other IO_FILE op a
+# BASH-REDIRECT-STDIN), since enrich/ and extract_layers expect them.
+
+
+class _Empty(Exception):
+    # jq `empty`: `.tag?` on a string/number/array yields no output at all
+    pass
+
+
+def _get(node, key):
+    # jq `.key?`
+    if node is None:
+        return None
+    if isinstance(node, dict):
+        return node.get(key)
+    raise _Empty()
+
+
+def _at(value, index):
+    # jq `.[n]`, out of range and null yield null
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        raise TypeError('Cannot index object with number')
+    try:
+        return value[index]
+    except IndexError:
+        return None
+
+
+def _length(value):
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return abs(value)
+    return len(value)
+
+
+def _map(fn, values):
+    # jq `map(f)`, elements for which f yields empty are dropped
+    if isinstance(values, dict):
+        values = list(values.values())
+    elif not isinstance(values, list):
+        raise TypeError(f'Cannot iterate over {type(values).__name__}')
+    result = []
+    for value in values:
+        try:
+            result.append(fn(value))
+        except _Empty:
+            continue
+    return result
+
+
+def _collect(fn, value):
+    # jq `[ f ]`
+    try:
+        return [fn(value)]
+    except _Empty:
+        return []
+
+
+def _flatten(values):
+    result = []
+    for value in values:
+        if isinstance(value, list):
+            result.extend(_flatten(value))
+        else:
+            result.append(value)
+    return result
+
+
+# filter-1.jq: ShellCheck tokens ({tag, contents}) to intermediate nodes
+
+# Tags that upgrade to a bare {type: ...}
+_PLAIN_TAGS = {
+    'TC_Group': 'CONDITION_GROUP',
+    'TC_Empty': 'CONDITION_EMPTY',
+    'T_Arithmetic': 'ARITHMETIC',
+    'T_IndexedElement': 'INDEXED_ELEMENT',
+    'T_UnparsedIndex': 'UNPARSED_INDEX',
+    'T_Bang': 'BANG',
+    'T_CLOBBER': 'CLOBBER',
+    'T_Case': 'CASE',
+    'T_DGREAT': 'DOUBLE_GREATER',
+    'T_DLESS': 'DOUBLE_LESS',
+    'T_DLESSDASH': 'DLESSDASH',
+    'T_DSEMI': 'DSEMI',
+    'T_Do': 'DO',
+    'T_DollarBracket': 'DOLLAR_BRACKET',
+    'T_DollarDoubleQuoted': 'DOLLAR_DOUBLE_QUOTED',
+    'T_DollarBraceCommandExpansion': 'DOLLAR_BRACE_COMMAND_EXPANSION',
+    'T_Done': 'DONE',
+    'T_EOF': 'EOF',
+    'T_Elif': 'ELSE_IF',
+    'T_Else': 'ELSE',
+    'T_Esac': 'ESAC',
+    'T_Extglob': 'EXT_GLOB',
+    'T_Fi': 'FI',
+    'T_For': 'FOR',
+    'T_ForArithmetic': 'FOR_ARITHMETIC',
+    'T_Function': 'FUNCTION',
+    'T_GREATAND': 'GREAT_AND',
+    'T_Greater': 'GREATER',
+    'T_HereDoc': 'HERE_DOC',
+    'T_HereString': 'HERE_STRING',
+    'T_If': 'IF',
+    'T_In': 'IN',
+    'T_LESSAND': 'LESS_AND',
+    'T_LESSGREAT': 'LESS_GREAT',
+    'T_Lbrace': 'L_BRACE',
+    'T_Less': 'LESS',
+    'T_Lparen': 'L_PAREN',
+    'T_NEWLINE': 'NEWLINE',
+    'T_OR_IF': 'OTHER_OR_IF',
+    'T_ParamSubSpecialChar': 'PARAM_SUB_SPECIAL_CHAR',
+    'T_Rbrace': 'R_BRACE',
+    'T_Rparen': 'R_PAREN',
+    'T_Select': 'SELECT',
+    'T_SelectIn': 'SELECT_IN',
+    'T_Semi': 'SEMI',
+    'T_Then': 'THEN',
+    'T_Until': 'UNTIL',
+    'T_While': 'WHILE',
+    'T_WhileExpression': 'WHILE_EXPRESSION',
+    'T_Pipe': 'PIPE',
+    'T_CoProc': 'CO_PROC',
+    'T_CoProcBody': 'CO_PROC_BODY',
+    'T_Include': 'INCLUDE',
+    'T_SourceCommand': 'SOURCE_COMMAND',
+    'T_BatsTest': 'BATS_TEST',
+}
+
+
+def _dollar_braced(node, c):
+    word = _at(c, 2)
+    if _get(word, 'tag') == 'T_NormalWord':
+        first = _at(_at(word['contents'], 1), 0)
+        if _get(first, 'tag') == 'T_Literal':
+            return {'type': 'VARIABLE', 'name': _at(first['contents'], 1)}
+    return {**node, 'type': 'UNKNOWN'}
+
+
+def _if_expression(node, c):
+    if _length(_at(c, 1)) == 1:
+        return {
+            'type': 'IF_EXPRESSION',
+            'condition': _map(upgrade_1, _at(_at(_at(c, 1), 0), 0)),
+            'the_then': _map(upgrade_1, _at(_at(_at(c, 1), 0), 1)),
+            'the_else': _map(upgrade_1, _at(c, 2)),
+        }
+    return {
+        'type': 'IF_ELSE_IF_EXPRESSION',
+        'checks': _map(lambda x: {
+            'condition': _map(upgrade_1, _at(x, 0)),
+            'the_then': _map(upgrade_1, _at(x, 1)),
+        }, _at(c, 1)),
+        'the_else': _map(upgrade_1, _at(c, 2)),
+    }
+
+
+def _normal_word(node, c):
+    if _length(_at(c, 1)) == 1:
+        return upgrade_1(_at(_at(c, 1), 0))
+    return {'type': 'CONCAT', 'parts': _map(upgrade_1, _at(c, 1))}
+
+
+def _pipeline(node, c):
+    if _at(c, 1) == []:
+        return upgrade_1(_at(_at(c, 2), 0))
+    return {
+        'type': 'PIPELINE',
+        'pipes': _map(upgrade_1, _at(c, 1)),
+        'commands': _map(upgrade_1, _at(c, 2)),
+    }
+
+
+def _redirecting(node, c):
+    if _at(c, 1) == []:
+        return upgrade_1(_at(c, 2))
+    return {
+        'type': 'REDIRECT',
+        'redirects': _map(upgrade_1, _at(c, 1)),
+        'command': upgrade_1(_at(c, 2)),
+    }
+
+
+def _simple_command(node, c):
+    words = _at(c, 2)
+    return {
+        'type': 'COMMAND',
+        'prefix': _map(upgrade_1, _at(c, 1)),
+        'command': upgrade_1(_at(words, 0)),
+        'arguments': _map(upgrade_1, None if words is None else words[1:]),
+    }
+
+
+_TAG_UPGRADES = {
+    'TA_Assignment': lambda n, c: {
+        'type': 'ARITHMETIC_ASSIGN', 'op': _at(c, 1),
+        'left': upgrade_1(_at(c, 2)), 'right': upgrade_1(_at(c, 3))},
+    'TA_Variable': lambda n, c: {
+        'type': 'ARITHMETIC_VARIABLE', 'name': _at(c, 1),
+        'others': _map(upgrade_1, _at(c, 2))},
+    'TA_Expansion': lambda n, c: {
+        'type': 'ARITHMETIC_EXPANSION', 'items': _map(upgrade_1, _at(c, 1))},
+    'TA_Sequence': lambda n, c: {
+        'type': 'ARITHMETIC_SEQUENCE', 'items': _map(upgrade_1, _at(c, 1))},
+    'TA_Trinary': lambda n, c: {
+        'type': 'ARITHMETIC_TRINARY', 'op1': upgrade_1(_at(c, 1)),
+        'op2': upgrade_1(_at(c, 2)), 'op3': upgrade_1(_at(c, 3))},
+    'TA_Binary': lambda n, c: {
+        'type': 'ARITHMETIC_BINARY', 'op': _at(c, 1),
+        'left': upgrade_1(_at(c, 2)), 'right': upgrade_1(_at(c, 3))},
+    'TA_Unary': lambda n, c: {
+        'type': 'ARITHMETIC_UNARY', 'op': _at(c, 1), 'expr': upgrade_1(_at(c, 2))},
+    'TC_And': lambda n, c: {
+        'type': 'CONDITION_AND', 'lhs': upgrade_1(_at(c, 2)), 'rhs': upgrade_1(_at(c, 3))},
+    'TC_Binary': lambda n, c: {
+        'type': 'CONDITION_BINARY', 'op': _at(c, 2),
+        'lhs': upgrade_1(_at(c, 3)), 'rhs': upgrade_1(_at(c, 4))},
+    'TC_Nullary': lambda n, c: {
+        'type': 'CONDITION_NULLARY', 'expr': upgrade_1(_at(c, 2))},
+    'TC_Or': lambda n, c: {
+        'type': 'CONDITION_OR', 'lhs': upgrade_1(_at(c, 3)), 'rhs': upgrade_1(_at(c, 4))},
+    'TC_Unary': lambda n, c: {
+        'type': 'CONDITION_UNARY', 'op': _at(c, 2), 'expr': upgrade_1(_at(c, 3))},
+    'T_AndIf': lambda n, c: {
+        'type': 'AND_IF', 'left': upgrade_1(_at(c, 1)), 'right': upgrade_1(_at(c, 2))},
+    'T_Array': lambda n, c: {
+        'type': 'ARRAY', 'items': _map(upgrade_1, _at(c, 1))},
+    'T_Assignment': lambda n, c: {
+        'type': 'ASSIGN', 'left': _at(c, 2), 'right': upgrade_1(_at(c, 4)),
+        'indices': _map(upgrade_1, _at(c, 3))},
+    'T_Backgrounded': lambda n, c: {
+        'type': 'BACKGROUNDED', 'expression': upgrade_1(_at(c, 1))},
+    'T_Backticked': lambda n, c: {
+        'type': 'BACKTICKED', 'expressions': _map(upgrade_1, _at(c, 1))},
+    'T_Banged': lambda n, c: {
+        'type': 'BANGED', 'expression': upgrade_1(_at(c, 1))},
+    'T_BraceExpansion': lambda n, c: {
+        'type': 'BRACE_EXPANSION', 'items': _map(upgrade_1, _at(c, 1))},
+    'T_BraceGroup': lambda n, c: {
+        'type': 'BRACE_GROUP', 'items': _map(upgrade_1, _at(c, 1))},
+    'T_CaseExpression': lambda n, c: {
+        'type': 'CASE_EXPRESSION', 'target': upgrade_1(_at(c, 1)),
+        'cases': _map(lambda x: {
+            'kind': _at(x, 0),
+            'labels': _map(upgrade_1, _at(x, 1)),
+            'expressions': _map(upgrade_1, _at(x, 2)),
+        }, _at(c, 2))},
+    'T_Condition': lambda n, c: {
+        'type': 'CONDITION', 'op': _at(c, 1), 'expression': upgrade_1(_at(c, 2))},
+    'T_DollarArithmetic': lambda n, c: {
+        'type': 'DOLLAR_ARITHMETIC', 'expression': upgrade_1(_at(c, 1))},
+    'T_DollarBraced': _dollar_braced,
+    'T_DollarExpansion': lambda n, c: {
+        'type': 'DOLLAR_PARENS', 'expressions': _map(upgrade_1, _at(c, 1))},
+    'T_DollarSingleQuoted': lambda n, c: {
+        'type': 'DOLLAR_SINGLE_QUOTED', 'value': _at(c, 1)},
+    'T_DoubleQuoted': lambda n, c: {
+        'type': 'DOUBLE_QUOTED', 'pieces': _map(upgrade_1, _at(c, 1))},
+    'T_FdRedirect': lambda n, c: {
+        'type': 'FD_REDIRECT', 'name': _at(c, 1), 'value': upgrade_1(_at(c, 2))},
+    'T_ForIn': lambda n, c: {
+        'type': 'FOR_IN', 'variable': _at(c, 1),
+        'items': _map(upgrade_1, _at(c, 2)), 'body': _map(upgrade_1, _at(c, 3))},
+    'T_Glob': lambda n, c: {
+        'type': 'GLOB', 'pattern': _at(c, 1)},
+    'T_IfExpression': _if_expression,
+    'T_IoFile': lambda n, c: {
+        'type': 'IO_FILE', 'op': upgrade_1(_at(c, 1)), 'file': upgrade_1(_at(c, 2))},
+    'T_IoDuplicate': lambda n, c: {
+        'type': 'IO_DUPLICATE', 'op': upgrade_1(_at(c, 1)), 'num': _at(c, 2)},
+    'T_Literal': lambda n, c: {
+        'type': 'LITERAL', 'value': _at(c, 1)},
+    'T_NormalWord': _normal_word,
+    'T_OrIf': lambda n, c: {
+        'type': 'OR_IF', 'left': upgrade_1(_at(c, 1)), 'right': upgrade_1(_at(c, 2))},
+    'T_Pipeline': _pipeline,
+    'T_ProcSub': lambda n, c: {
+        'type': 'PROC_SUB', 'op': _at(c, 1), 'statements': _map(upgrade_1, _at(c, 2))},
+    'T_Redirecting': _redirecting,
+    'T_Script': lambda n, c: {
+        'type': 'SCRIPT', 'statements': _map(upgrade_1, _at(c, 2))},
+    'T_SimpleCommand': _simple_command,
+    'T_SingleQuoted': lambda n, c: {
+        'type': 'SINGLE_QUOTED', 'value': _at(c, 1)},
+    'T_Subshell': lambda n, c: {
+        'type': 'SUBSHELL', 'expressions': _map(upgrade_1, _at(c, 1))},
+    'T_UntilExpression': lambda n, c: {
+        'type': 'UNTIL_EXPRESSION', 'condition': _map(upgrade_1, _at(c, 1)),
+        'statements': _map(upgrade_1, _at(c, 2))},
+    'T_Annotation': lambda n, c: upgrade_1(_at(c, 2)),
+}
+
+
+def upgrade_1(node):
+    tag = _get(node, 'tag')
+    plain = _PLAIN_TAGS.get(tag)
+    if plain is not None:
+        return {'type': plain}
+    handler = _TAG_UPGRADES.get(tag)
+    if handler is None:
+        return node
+    return handler(node, node.get('contents'))
+
+
+# filter-2.jq: intermediate nodes to the DOCKER-/BASH- node vocabulary of ast.ts
+
+def _semantic_command(prefix, command, arguments):
+    return {
+        'type': 'MAYBE-SEMANTIC-COMMAND',
+        'children': [{
+            'type': 'BASH-COMMAND-PREFIX',
+            'children': prefix,
+        }, {
+            'type': 'BASH-COMMAND-COMMAND',
+            'children': command,
+        }, {
+            'type': 'BASH-COMMAND-ARGS',
+            'children': arguments,
+        }]
+    }
+
+
+def _command(node):
+    prefix = node.get('prefix')
+    if node.get('command') is None:
+        if _length(prefix) == 1:
+            if _get(_at(prefix, 0), 'type') == 'ASSIGN':
+                return upgrade_2(_at(prefix, 0))
+            return _semantic_command(
+                _map(upgrade_2, prefix),
+                _collect(upgrade_2, node.get('command')),
+                _map(upgrade_2, node.get('arguments')),
+            )
+        return _semantic_command(
+            _map(upgrade_2, prefix), [], _map(upgrade_2, node.get('arguments'))
+        )
+    return _semantic_command(
+        _map(upgrade_2, prefix),
+        _collect(upgrade_2, node.get('command')),
+        _map(upgrade_2, node.get('arguments')),
+    )
+
+
+def _path(kind, file):
+    return {
+        'type': kind,
+        'children': [{
+            'type': 'BASH-PATH',
+            'children': _collect(upgrade_2, file),
+        }]
+    }
+
+
+def _fd_redirect(node):
+    value = node.get('value')
+    value_type = _get(value, 'type')
+    if value_type == 'IO_FILE':
+        op_type = _get(value.get('op'), 'type')
+        if op_type == 'GREATER':
+            return _path('BASH-REDIRECT-OVERWRITE', value.get('file'))
+        if op_type == 'DOUBLE_GREATER':
+            return _path('BASH-REDIRECT-APPEND', value.get('file'))
+        # filter-2.jq tests `.value.op.type? = "LESS"`, which is always truthy
+        return _path('BASH-REDIRECT-STDIN', value.get('file'))
+    if value_type == 'IO_DUPLICATE':
+        if _get(value.get('op'), 'type') == 'GREAT_AND':
+            if value.get('num') == '2':
+                return {'type': 'BASH-IO-DUPE-STDERR', 'children': []}
+            if value.get('num') == '1':
+                return {'type': 'BASH-IO-DUPE-STDOUT', 'children': []}
+    return {'type': 'UNKNOWN', 'children': []}
+
+
+def _chain(kind, member):
+    def upgrade_chain(node):
+        return {
+            'type': kind,
+            'children': _flatten(_map(upgrade_2, [
+                {'type': member, 'children': _collect(upgrade_2, node.get('left'))},
+                {'type': member, 'children': _collect(upgrade_2, node.get('right'))},
+            ]))
+        }
+    return upgrade_chain
+
+
+def _chain_member(kind):
+    def upgrade_member(node):
+        first = _at(node.get('children'), 0)
+        if _get(first, 'type') == kind:
+            return first['children']
+        return node
+    return upgrade_member
+
+
+def _op(kind, op):
+    return {
+        'type': kind,
+        'children': [{'type': 'BASH-OP', 'value': op, 'children': []}]
+    }
+
+
+def _variable(name):
+    return {'type': 'BASH-VARIABLE', 'value': name, 'children': []}
+
+
+def _leaf(kind, key):
+    return lambda n: {'type': kind, 'value': n.get(key), 'children': []}
+
+
+def _list(kind, key):
+    return lambda n: {'type': kind, 'children': _map(upgrade_2, n.get(key))}
+
+
+def _case_expression(node):
+    return {
+        'type': 'BASH-CASE-EXPRESSION',
+        'children': [{
+            'type': 'BASH-CASE-EXP-TARGET',
+            'children': _collect(upgrade_2, node.get('target')),
+        }, {
+            'type': 'BASH-CASE-EXP-CASES',
+            'children': _map(lambda case: {
+                'type': 'BASH-CASE-EXP-CASE',
+                'children': [{
+                    'type': 'BASH-CASE-KIND',
+                    'value': _get(case, 'kind'),
+                    'children': [],
+                }, {
+                    'type': 'BASH-CASE-LABELS',
+                    'children': _map(upgrade_2, _get(case, 'labels')),
+                }, {
+                    'type': 'BASH-CASE-EXPRESSIONS',
+                    'children': _map(upgrade_2, _get(case, 'expressions')),
+                }]
+            }, node.get('cases')),
+        }]
+    }
+
+
+def _if_else_if_expression(node):
+    return {
+        'type': 'BASH-IF-ELSE-IF-EXPRESSION',
+        'children': [
+            {'type': 'BASH-IF-ELSE', 'children': _map(upgrade_2, node.get('the_else'))}
+        ] + _map(lambda check: {
+            'type': 'BASH-IF-ELSE-IF-EXP-CHECK',
+            'children': [{
+                'type': 'BASH-IF-CONDITION',
+                'children': _map(upgrade_2, _get(check, 'condition')),
+            }, {
+                'type': 'BASH-IF-THEN',
+                'children': _map(upgrade_2, _get(check, 'the_then')),
+            }]
+        }, node.get('checks'))
+    }
+
+
+_TYPE_UPGRADES = {
+    'COMMAND': _command,
+    'FD_REDIRECT': _fd_redirect,
+    'SCRIPT': _list('BASH-SCRIPT', 'statements'),
+    'VARIABLE': _leaf('BASH-VARIABLE', 'name'),
+    'FOR_IN': lambda n: {
+        'type': 'BASH-FOR-IN',
+        'children': [{
+            'type': 'BASH-FOR-IN-VARIABLE',
+            'children': [_variable(n.get('variable'))],
+        }, {
+            'type': 'BASH-FOR-IN-ITEMS',
+            'children': _map(upgrade_2, n.get('items')),
+        }, {
+            'type': 'BASH-FOR-IN-BODY',
+            'children': _map(upgrade_2, n.get('body')),
+        }]
+    },
+    'AND_IF': _chain('BASH-AND-IF', 'BASH-AND-MEM'),
+    'BASH-AND-MEM': _chain_member('BASH-AND-IF'),
+    'OR_IF': _chain('BASH-OR-IF', 'BASH-OR-MEM'),
+    'BASH-OR-MEM': _chain_member('BASH-OR-IF'),
+    'CONCAT': _list('BASH-CONCAT', 'parts'),
+    'SINGLE_QUOTED': _leaf('BASH-SINGLE-QUOTED', 'value'),
+    'EXT_GLOB': _leaf('BASH-EXT-GLOB', 'pattern'),
+    'GLOB': _leaf('BASH-GLOB', 'pattern'),
+    'ASSIGN': lambda n: {
+        'type': 'BASH-ASSIGN',
+        'children': [{
+            'type': 'BASH-ASSIGN-LHS',
+            'children': [_variable(n.get('left'))],
+        }, {
+            'type': 'BASH-ASSIGN-RHS',
+            'children': _collect(upgrade_2, n.get('right')),
+        }]
+    },
+    'CONDITION': lambda n: {
+        'type': 'BASH-CONDITION',
+        'children': [
+            _op('BASH-CONDITION-OP', n.get('op')),
+            {'type': 'BASH-CONDITION-EXP', 'children': _collect(upgrade_2, n.get('expression'))},
+        ]
+    },
+    'LITERAL': _leaf('BASH-LITERAL', 'value'),
+    'ARITHMETIC_SEQUENCE': _list('BASH-ARITHMETIC-SEQUENCE', 'items'),
+    'ARITHMETIC_EXPANSION': _list('BASH-ARITHMETIC-EXPANSION', 'items'),
+    'ARITHMETIC_VARIABLE': lambda n: {
+        'type': 'BASH-ARITHMETIC-VARIABLE',
+        'children': [_variable(n.get('name'))],
+    },
+    'ARITHMETIC_BINARY': lambda n: {
+        'type': 'BASH-ARITHMETIC-BINARY',
+        'children': [
+            _op('BASH-ARITHMETIC-BINARY-OP', n.get('op')),
+            {'type': 'BASH-ARITHMETIC-BINARY-LHS', 'children': _collect(upgrade_2, n.get('left'))},
+            # Misspelling carried over from filter-2.jq
+            {'type': 'BASH-ARITHEMTIC-BINARY-RHS', 'children': _collect(upgrade_2, n.get('right'))},
+        ]
+    },
+    'DOLLAR_PARENS': _list('BASH-DOLLAR-PARENS', 'expressions'),
+    'DOLLAR_ARITHMETIC': lambda n: {
+        'type': 'BASH-DOLLAR-ARITHMETIC',
+        'children': upgrade_2(n.get('expression')),
+    },
+    'UNTIL_EXPRESSION': lambda n: {
+        'type': 'BASH-UNTIL-EXPRESSION',
+        'children': [
+            {'type': 'BASH-UNTIL-CONDITION', 'children': _map(upgrade_2, n.get('condition'))},
+            {'type': 'BASH-UNTIL-BODY', 'children': _map(upgrade_2, n.get('statements'))},
+        ]
+    },
+    'PROC_SUB': lambda n: {
+        'type': 'BASH-PROC-SUB',
+        'children': [
+            {'type': 'BASH-PROC-SUB-OP', 'value': n.get('op'), 'children': []},
+            {'type': 'BASH-PROC-SUB-BODY', 'children': _map(upgrade_2, n.get('statements'))},
+        ]
+    },
+    'DOUBLE_QUOTED': _list('BASH-DOUBLE-QUOTED', 'pieces'),
+    'REDIRECT': lambda n: {
+        'type': 'BASH-REDIRECT',
+        'children': [
+            {'type': 'BASH-REDIRECT-COMMAND', 'children': _collect(upgrade_2, n.get('command'))},
+            {'type': 'BASH-REDIRECT-REDIRECTS', 'children': _map(upgrade_2, n.get('redirects'))},
+        ]
+    },
+    'PIPELINE': _list('BASH-PIPELINE', 'commands'),
+    'FUNCTION': lambda n: {'type': 'BASH-FUNCTION', 'children': []},
+    'CONDITION_EMPTY': lambda n: {'type': 'BASH-CONDITION-EMPTY', 'children': []},
+    'CONDITION_UNARY': lambda n: {
+        'type': 'BASH-CONDITION-UNARY',
+        'children': [
+            _op('BASH-CONDITION-UNARY-OP', n.get('op')),
+            {'type': 'BASH-CONDITION-UNARY-EXP', 'children': _collect(upgrade_2, n.get('expr'))},
+        ]
+    },
+    'DOLLAR_SINGLE_QUOTED': _leaf('BASH-DOLLAR-SINGLE-QUOTED', 'value'),
+    'CONDITION_BINARY': lambda n: {
+        'type': 'BASH-CONDITION-BINARY',
+        'children': [
+            _op('BASH-CONDITION-BINARY-OP', n.get('op')),
+            {'type': 'BASH-CONDITION-BINARY-LHS', 'children': _collect(upgrade_2, n.get('lhs'))},
+            {'type': 'BASH-CONDITION-BINARY-RHS', 'children': _collect(upgrade_2, n.get('rhs'))},
+        ]
+    },
+    'CONDITION_NULLARY': lambda n: {
+        'type': 'BASH-CONDITION-NULLARY',
+        'children': _collect(upgrade_2, n.get('expr')),
+    },
+    'IF_EXPRESSION': lambda n: {
+        'type': 'BASH-IF-EXPRESSION',
+        'children': [
+            {'type': 'BASH-IF-CONDITION', 'children': _map(upgrade_2, n.get('condition'))},
+            {'type': 'BASH-IF-THEN', 'children': _map(upgrade_2, n.get('the_then'))},
+            {'type': 'BASH-IF-ELSE', 'children': _map(upgrade_2, n.get('the_else'))},
+        ]
+    },
+    'BRACE_EXPANSION': _list('BASH-BRACE-EXPANSION', 'items'),
+    'BRACE_GROUP': _list('BASH-BRACE-GROUP', 'items'),
+    'BACKGROUNDED': lambda n: {
+        'type': 'BASH-BACKGROUNDED',
+        'children': _collect(upgrade_2, n.get('expression')),
+    },
+    'BACKTICKED': _list('BASH-BACKTICKED', 'expressions'),
+    'BANGED': lambda n: {
+        'type': 'BASH-BANGED',
+        'children': _collect(upgrade_2, n.get('expression')),
+    },
+    'SUBSHELL': _list('BASH-SUBSHELL', 'expressions'),
+    'CASE_EXPRESSION': _case_expression,
+    'IF_ELSE_IF_EXPRESSION': _if_else_if_expression,
+    'WHILE_EXPRESSION': lambda n: {'type': 'BASH-WHILE-EXPRESSION', 'children': []},
+    'CONDITION_AND': lambda n: {
+        'type': 'BASH-CONDITION-AND',
+        'children': [
+            {'type': 'BASH-CONDITION-AND-LHS', 'children': _collect(upgrade_2, n.get('lhs'))},
+            {'type': 'BASH-CONDITION-AND-RHS', 'children': _collect(upgrade_2, n.get('rhs'))},
+        ]
+    },
+    'CONDITION_OR': lambda n: {
+        'type': 'BASH-CONDITION-OR',
+        'children': [
+            {'type': 'BASH-CONDITION-OR-LHS', 'children': _collect(upgrade_2, n.get('lhs'))},
+            {'type': 'BASH-CONDITION-OR-RHS', 'children': _collect(upgrade_2, n.get('rhs'))},
+        ]
+    },
+    'ARRAY': _list('BASH-ARRAY', 'items'),
+    'UNKNOWN': lambda n: {'type': 'UNKNOWN', 'children': []},
+}
+
+
+def upgrade_2(node):
+    handler = _TYPE_UPGRADES.get(_get(node, 'type'))
+    if handler is None:
+        return node
+    return handler(node)
+
+
+class FilterError(ValueError):
+    pass
+
+
+# Equivalent of `jq -f filter-1.jq | jq -f filter-2.jq` on one parser document
+def upgrade(raw):
+    if isinstance(raw, (bytes, str)):
+        raw = json.loads(raw)
+    try:
+        return upgrade_2(upgrade_1(raw))
+    except _Empty:
+        # jq would have printed nothing, which json.loads rejected
+        raise FilterError('filters produced no output')
@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import queue
+import shlex
+import atexit
+import select
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Pool of long-lived bash parser processes.
+#
+# Every worker speaks a line protocol: one JSON-encoded bash string per line
+# on stdin, one JSON document per line on stdout (`null` when the string
+# could not be parsed). Workers that die or stop answering within `timeout`
+# seconds are killed and started again on the next request.
+
+DEFAULT_WORKER = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bash_worker.py')]
+
+
+def worker_command():
+    command = os.environ.get('BASH_PARSER_WORKER')
+    return shlex.split(command) if command else list(DEFAULT_WORKER)
+
+
+class WorkerError(Exception):
+    pass
+
+
+class _Worker:
+    def __init__(self, command):
+        self.command = command
+        self.proc = None
+        self.buffer = b''
+        self.restarts = -1
+
+    def start(self):
+        self.stop()
+        self.proc = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0
+        )
+        self.buffer = b''
+        self.restarts += 1
+
+    def stop(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=5)
+        except Exception:
+            pass
+        for stream in (self.proc.stdin, self.proc.stdout):
+            try:
+                stream.close()
+            except Exception:
+                pass
+        self.proc = None
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def request(self, payload, timeout):
+        if not self.alive():
+            self.start()
+
+        try:
+            self.proc.stdin.write(payload)
+        except (BrokenPipeError, OSError) as e:
+            self.stop()
+            raise WorkerError(f'worker died: {e}')
+
+        fd = self.proc.stdout.fileno()
+        deadline = time.monotonic() + timeout
+        while b'\n' not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.stop()
+                raise WorkerError('worker timed out')
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                self.stop()
+                raise WorkerError('worker exited')
+            self.buffer += chunk
+
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return line
+
+
+class BashParserPool:
+    def __init__(self, size=None, command=None, timeout=30.0, retries=1):
+        self.size = size or os.cpu_count() or 1
+        self.command = command or worker_command()
+        self.timeout = timeout
+        self.retries = retries
+        self.workers = [_Worker(self.command) for _ in range(self.size)]
+        self.idle = queue.LifoQueue()
+        for worker in self.workers:
+            self.idle.put(worker)
+        self.closed = False
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.pid = os.getpid()
+
+    @property
+    def restarts(self):
+        return sum(max(worker.restarts, 0) for worker in self.workers)
+
+    # Returns the parser's JSON document for bash_str, or None on failure
+    def parse(self, bash_str):
+        if self.closed:
+            raise WorkerError('pool is closed')
+
+        payload = json.dumps(bash_str).encode('utf-8') + b'\n'
+        worker = self.idle.get()
+        try:
+            for _ in range(self.retries + 1):
+                try:
+                    line = worker.request(payload, self.timeout)
+                except WorkerError:
+                    with self.lock:
+                        self.failures += 1
+                    continue
+                return json.loads(line)
+            return None
+        finally:
+            self.idle.put(worker)
+
+    # Starts every worker process now instead of on its first request
+    def start(self):
+        taken = [self.idle.get() for _ in range(self.size)]
+        try:
+            for worker in taken:
+                if not worker.alive():
+                    worker.start()
+        finally:
+            for worker in taken:
+                self.idle.put(worker)
+
+    def map(self, bash_strs):
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            return list(executor.map(self.parse, bash_strs))
+
+    def close(self):
+        self.closed = True
+        # A forked child must not kill the parent's workers
+        if self.pid != os.getpid():
+            return
+        for worker in self.workers:
+            worker.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Streaming enricher (compiled app.ts in --stream mode): one JSON tree per
+# line in, one enriched tree per line out, so it can share the worker pool
+ENRICH_COMMAND = shlex.split(os.environ.get('ENRICH_COMMAND', 'node /build/app.js --stream'))
+
+_POOLS = {}
+_POOL_LOCK = threading.Lock()
+
+
+def _shared_pool(name, size_var, command=None):
+    with _POOL_LOCK:
+        pool = _POOLS.get(name)
+        if pool is None or pool.closed or pool.pid != os.getpid():
+            size = int(os.environ.get(size_var, '0')) or None
+            pool = _POOLS[name] = BashParserPool(size=size, command=command)
+            atexit.register(pool.close)
+        return pool
+
+
+# Process-wide pool, started on first use and sized by BASH_POOL_SIZE
+def get_pool():
+    return _shared_pool('parser', 'BASH_POOL_SIZE')
+
+
+# Process-wide pool of enrichers, sized by ENRICH_POOL_SIZE
+def get_enrich_pool():
+    return _shared_pool('enrich', 'ENRICH_POOL_SIZE', ENRICH_COMMAND)
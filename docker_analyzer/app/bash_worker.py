@@ -0,0 +1,48 @@
+import os
+import sys
+import json
+import shlex
+import subprocess
+
+# Default worker for BashParserPool.
+#
+# Reads one JSON-encoded bash string per line on stdin and answers each with
+# exactly one line on stdout: the parser's JSON document, or `null` if the
+# parser failed. The bash parser itself (/build/app) only parses a whole
+# stdin per run, so this adapter still executes it once per request; set
+# BASH_PARSER_WORKER to a parser that speaks this line protocol natively to
+# drop that last exec as well.
+
+BASH_PARSER = shlex.split(os.environ.get('BASH_PARSER', '/build/app'))
+BASH_PARSER_TIMEOUT = float(os.environ.get('BASH_PARSER_TIMEOUT', '10'))
+
+
+def parse_one(bash_str):
+    try:
+        output = subprocess.check_output(
+            BASH_PARSER,
+            stderr=subprocess.DEVNULL,
+            input=bash_str.encode('utf-8'),
+            timeout=BASH_PARSER_TIMEOUT
+        )
+    except Exception:
+        return b'null'
+    # The reply must stay on one line; JSON never needs a raw newline
+    output = output.strip().replace(b'\r', b'').replace(b'\n', b'')
+    return output or b'null'
+
+
+def serve(stdin=sys.stdin.buffer, stdout=sys.stdout.buffer):
+    for line in stdin:
+        try:
+            bash_str = json.loads(line)
+        except ValueError:
+            reply = b'null'
+        else:
+            reply = parse_one(bash_str)
+        stdout.write(reply + b'\n')
+        stdout.flush()
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,317 @@
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import tqdm
+
+from dockerfiles import is_dockerfile
+
+# Batch analysis of Dockerfile corpora.
+#
+# Paths come from a list file (one path per line, like dockerfile_list.txt) or
+# from walking a directory tree. Work is fanned out over a process pool in
+# chunks, with a bounded number of chunks in flight, and results are appended
+# to dockerfile_ast.txt / dockerfile_summary.txt in input order as soon as
+# they are ready. A checkpoint records how many inputs have been written and
+# the matching output offsets, so an interrupted run can be resumed with
+# --resume. A run that finishes removes its checkpoint.
+#
+# --index adds every summary to a layer index (layer_index.py) as it is
+# written, committed together with each checkpoint.
+#
+# --ast-format store writes the ASTs to a compressed, indexed AST store and
+# --summary-format parquet writes the summaries as a Parquet dataset (needs
+# pyarrow); see ast_store.py for the formats and for re-running
+# extract_layers over a stored corpus.
+#
+#   python batch.py --list dockerfile_list.txt --workers 8
+#   python batch.py --dir /data/dockerfiles --resume
+#   python batch.py --dir /data/dockerfiles --ast-format store --summary-format parquet
+
+CHECKPOINT_EVERY = 30.0  # seconds
+
+# Default output names per format
+AST_OUTPUTS = {'jsonl': 'dockerfile_ast.txt', 'store': 'dockerfile_ast.dast'}
+SUMMARY_OUTPUTS = {'jsonl': 'dockerfile_summary.txt', 'parquet': 'dockerfile_summary.parquet'}
+
+
+# Yields paths in a stable order so that a resumed run sees the same sequence
+def iter_paths(list_file=None, directory=None):
+    if list_file:
+        with open(list_file) as fh:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    yield line
+    if directory:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                if is_dockerfile(name):
+                    yield os.path.join(root, name)
+
+
+def _init_worker(quiet):
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')
+
+
+# ASTs go back to the parent as one compact forest per chunk (compact_ast.py),
+# which is much smaller to pickle and to hold while earlier chunks finish
+def _process_chunk(paths):
+    from app import process
+    from compact_ast import Forest
+
+    forest = Forest()
+    results = []
+    for path in paths:
+        try:
+            result = process(path)
+        except Exception:
+            result = None
+        if result is None:
+            results.append((path, None, None))
+        else:
+            results.append((path, forest.add(result['ast']), _summary(path, result)))
+    return forest, results
+
+
+def _summary(path, result):
+    summary = {
+        'path': path,
+        'os': result['os'],
+        'language': result['language'],
+        'dependencies': result['dependencies']
+    }
+    if 'packages' in result:
+        summary['packages'] = result['packages']
+    return summary
+
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return None
+        with open(self.path) as fh:
+            return json.load(fh)
+
+    def save(self, state):
+        if not self.path:
+            return
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump(state, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _JsonLines:
+    def __init__(self, path, offset):
+        self.fh = open(path, 'ab' if offset is not None else 'wb')
+        if offset is not None:
+            # Drop anything written after the last checkpoint
+            self.fh.truncate(offset)
+            self.fh.seek(offset)
+
+    def write(self, text):
+        self.fh.write(text.encode('utf-8') + b'\n')
+
+    def sync(self):
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+
+    def tell(self):
+        return self.fh.tell()
+
+    def close(self):
+        self.fh.close()
+
+
+class _AstLines(_JsonLines):
+    def add(self, path, ast_json):
+        self.write(ast_json)
+
+
+class _SummaryLines(_JsonLines):
+    def add(self, summary):
+        self.write(json.dumps(summary))
+
+
+# Output sinks share add / sync / tell / close; tell() after sync() is the
+# offset stored in the checkpoint and handed back on resume
+def open_ast_output(path, ast_format='jsonl', offset=None):
+    if ast_format == 'store':
+        from ast_store import AstStoreWriter
+        return AstStoreWriter(path, offset)
+    return _AstLines(path, offset)
+
+
+def open_summary_output(path, summary_format='jsonl', offset=None):
+    if summary_format == 'parquet':
+        from ast_store import SummaryTableWriter
+        return SummaryTableWriter(path, offset)
+    return _SummaryLines(path, offset)
+
+
+def run_batch(paths, ast_path='dockerfile_ast.txt', summary_path='dockerfile_summary.txt',
+              workers=None, max_in_flight=None, chunk_size=16, checkpoint_path=None,
+              resume=False, quiet=True, progress=True, ast_format='jsonl', summary_format='jsonl',
+              index_path=None):
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 4
+    checkpoint = Checkpoint(checkpoint_path)
+
+    state = checkpoint.load() if resume else None
+    done = state['done'] if state else 0
+    failed = state['failed'] if state else 0
+
+    ast_file = open_ast_output(ast_path, ast_format, state['ast_offset'] if state else None)
+    summary_file = open_summary_output(summary_path, summary_format, state['summary_offset'] if state else None)
+    # Re-adding a path replaces it, so summaries indexed after the last
+    # checkpoint are simply indexed again on resume
+    index = None
+    if index_path:
+        from layer_index import LayerIndex
+        index = LayerIndex(index_path)
+
+    def save_checkpoint():
+        ast_file.sync()
+        summary_file.sync()
+        if index is not None:
+            index.commit()
+        checkpoint.save({
+            'done': done,
+            'failed': failed,
+            'ast_offset': ast_file.tell(),
+            'summary_offset': summary_file.tell()
+        })
+
+    paths = itertools.islice(paths, done, None)
+    chunks = iter(lambda: list(itertools.islice(paths, chunk_size)), [])
+
+    bar = tqdm.tqdm(initial=done, desc='Processing', unit='file', disable=not progress)
+    pending = {}   # future -> chunk index
+    finished = {}  # chunk index -> results, waiting for earlier chunks
+    next_submit = 0
+    next_write = 0
+    last_save = time.monotonic()
+    finished_run = False
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(quiet,)) as executor:
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) + len(finished) < max_in_flight:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                        break
+                    pending[executor.submit(_process_chunk, chunk)] = next_submit
+                    next_submit += 1
+
+                if not pending:
+                    break
+
+                completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    finished[pending.pop(future)] = future.result()
+
+                # Write out every chunk whose predecessors are already written
+                while next_write in finished:
+                    forest, results = finished.pop(next_write)
+                    for path, root, summary in results:
+                        done += 1
+                        if root is None:
+                            failed += 1
+                            continue
+                        ast_file.add(path, forest.dumps(root))
+                        summary_file.add(summary)
+                        if index is not None:
+                            index.add(summary)
+                    bar.update(done - bar.n)
+                    next_write += 1
+
+                if time.monotonic() - last_save >= CHECKPOINT_EVERY:
+                    save_checkpoint()
+                    last_save = time.monotonic()
+        finished_run = True
+    finally:
+        save_checkpoint()
+        ast_file.close()
+        summary_file.close()
+        if index is not None:
+            index.close()
+        bar.close()
+        # Only an interrupted run keeps its checkpoint; after a finished one,
+        # --resume on the same outputs starts over instead of skipping everything
+        if finished_run:
+            checkpoint.clear()
+
+    return {'done': done, 'failed': failed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyze a corpus of Dockerfiles')
+    parser.add_argument('--list', help='file with one Dockerfile path per line')
+    parser.add_argument('--dir', help='directory tree to search for Dockerfiles')
+    parser.add_argument('--ast-out', default=None)
+    parser.add_argument('--summary-out', default=None)
+    parser.add_argument('--ast-format', choices=('jsonl', 'store'), default='jsonl',
+                        help='store: chunked compressed AST store with random access (ast_store.py)')
+    parser.add_argument('--summary-format', choices=('jsonl', 'parquet'), default='jsonl',
+                        help='parquet: Parquet dataset directory (needs pyarrow)')
+    parser.add_argument('--index', default=None, help='also add the summaries to this layer index (SQLite)')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-in-flight', type=int, default=None, help='chunks queued or running at once')
+    parser.add_argument('--chunk-size', type=int, default=16)
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file (default: <summary-out>.checkpoint)')
+    parser.add_argument('--resume', action='store_true', help='continue from the last checkpoint')
+    parser.add_argument('--verbose', action='store_true', help='keep debug output from the workers')
+    parser.add_argument('--no-progress', action='store_true')
+    args = parser.parse_args(argv)
+
+    if not args.list and not args.dir:
+        parser.error('one of --list or --dir is required')
+    if args.summary_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            from ast_store import PYARROW_MISSING
+            parser.error(PYARROW_MISSING)
+
+    ast_out = args.ast_out or AST_OUTPUTS[args.ast_format]
+    summary_out = args.summary_out or SUMMARY_OUTPUTS[args.summary_format]
+
+    stats = run_batch(
+        iter_paths(args.list, args.dir),
+        ast_path=ast_out,
+        summary_path=summary_out,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        chunk_size=args.chunk_size,
+        checkpoint_path=args.checkpoint or f'{summary_out}.checkpoint',
+        resume=args.resume,
+        quiet=not args.verbose,
+        progress=not args.no_progress,
+        ast_format=args.ast_format,
+        summary_format=args.summary_format,
+        index_path=args.index
+    )
+    print(f"Processed {stats['done']} Dockerfiles ({stats['failed']} failed)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
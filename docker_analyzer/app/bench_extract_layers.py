@@ -0,0 +1,323 @@
+import gc
+import re
+import sys
+import time
+import random
+import argparse
+
+import app
+from app import extract_layers
+from compact_ast import Forest
+from layer_rules import classify_tag, classify_image, classify_run
+
+# Micro-benchmark: table-driven extract_layers versus the substring/elif
+# version it replaced, over a synthetic corpus of Dockerfile ASTs. Both
+# implementations must agree on every AST. --compact also runs extract_layers
+# on compact_ast.Forest views of the same corpus.
+#
+# The classifiers are memoized, so timings depend on how often a corpus
+# repeats itself. "cold" empties the memo tables before every run and is the
+# number to compare; "warm" only applies to a process that sees the same
+# content again. --sweep prints the cold speedup per corpus size and where it
+# breaks even.
+#
+#   python bench_extract_layers.py --dockerfiles 100000 --compact
+#   python bench_extract_layers.py --sweep 1000,5000,20000,100000
+
+IMAGES = [
+    ('python', ['3.9-alpine', '3.8-slim', '3.11', '2.7-slim-buster', 'latest']),
+    ('node', ['14-alpine', '16', '18-bullseye-slim', 'lts']),
+    ('openjdk', ['11-jdk-slim', '8-jre-alpine', '17']),
+    ('golang', ['1.19-alpine', '1.20', 'latest']),
+    ('ubuntu', ['20.04', '22.04', 'focal']),
+    ('debian', ['buster-slim', 'bullseye', '11']),
+    ('alpine', ['3.12', '3.18', 'edge']),
+    ('centos', ['7', 'centos8']),
+    ('fedora', ['38']),
+    ('nginx', ['1.25-alpine', 'stable']),
+    ('ruby', ['3.2-slim', '2.7']),
+]
+REPOS = [None, None, None, 'library', 'registry.example.com', 'gcr.io']
+
+APT_PACKAGES = ['curl', 'wget', 'git', 'ca-certificates', 'build-essential', 'gcc', 'g++', 'make',
+                'python3', 'python3-pip', 'nodejs', 'openjdk-11-jdk', 'golang-go', 'ruby-full',
+                'libssl-dev', 'libffi-dev', 'zlib1g-dev', 'unzip', 'openssh-client', 'mongodb-clients']
+PIP_PACKAGES = ['flask', 'requests', 'numpy', 'pandas', 'torch', 'gunicorn', 'django', 'boto3']
+NPM_PACKAGES = ['express', 'yarn', 'typescript', 'pm2', 'lodash', 'react']
+GEM_PACKAGES = ['bundler', 'rails', 'puma', 'nokogiri']
+
+
+def _pick(rng, items, low, high):
+    return ' '.join(rng.sample(items, rng.randint(low, min(high, len(items)))))
+
+
+def random_run(rng):
+    kind = rng.randrange(8)
+    if kind == 0:
+        return f'apt-get update && apt-get install -y {_pick(rng, APT_PACKAGES, 1, 8)} && rm -rf /var/lib/apt/lists/*'
+    if kind == 1:
+        return f'pip{rng.choice(["", "3"])} install {_pick(rng, PIP_PACKAGES, 1, 5)}'
+    if kind == 2:
+        return f'npm install {_pick(rng, NPM_PACKAGES, 1, 4)}'
+    if kind == 3:
+        return f'gem install {_pick(rng, GEM_PACKAGES, 1, 3)}'
+    if kind == 4:
+        return 'cd /src && ./configure && make -j"$(nproc)" && make install'
+    if kind == 5:
+        return 'mkdir -p /app && chown -R app:app /app && chmod 755 /app/entrypoint.sh'
+    if kind == 6:
+        return 'curl -fsSL https://example.com/install.sh | sh && echo done'
+    return f'apk add --no-cache {_pick(rng, APT_PACKAGES, 1, 4)}'
+
+
+def random_from(rng):
+    name, tags = rng.choice(IMAGES)
+    children = [{'type': 'DOCKER-IMAGE-NAME', 'value': name, 'children': []}]
+    repo = rng.choice(REPOS)
+    if repo:
+        children.append({'type': 'DOCKER-IMAGE-REPO', 'value': repo, 'children': []})
+    if rng.random() < 0.9:
+        children.append({'type': 'DOCKER-IMAGE-TAG', 'value': rng.choice(tags), 'children': []})
+    return {'type': 'DOCKER-FROM', 'children': children}
+
+
+def random_ast(rng):
+    children = []
+    for _ in range(1 if rng.random() < 0.7 else rng.randint(2, 4)):  # some multi-stage builds
+        children.append(random_from(rng))
+        for _ in range(rng.randint(1, 8)):
+            children.append({
+                'type': 'DOCKER-RUN',
+                'children': [{'type': 'MAYBE-BASH', 'value': random_run(rng), 'children': []}]
+            })
+    return {'type': 'DOCKER-FILE', 'children': children}
+
+
+def corpus(count, seed=0):
+    rng = random.Random(seed)
+    return [random_ast(rng) for _ in range(count)]
+
+
+# extract_layers as it was before the rule tables (the FROM language chain
+# condensed into a loop), kept as the baseline
+def legacy_extract_layers(ast):
+    os_list = []
+    language_list = []
+    dependencies_list = []
+    language_detected = False
+
+    def traverse(node):
+        nonlocal language_detected
+
+        if node['type'] == 'DOCKER-FROM':
+            os_detected = False
+            for child in node.get('children', []):
+                if child['type'] == 'DOCKER-IMAGE-TAG' and not os_detected:
+                    tag_value = child['value'].lower()
+                    if 'alpine' in tag_value:
+                        os_list.append('alpine')
+                        os_detected = True
+                    elif 'ubuntu' in tag_value:
+                        os_list.append('ubuntu')
+                        os_detected = True
+                    elif 'debian' in tag_value:
+                        os_list.append('debian')
+                        os_detected = True
+                    elif 'slim' in tag_value:
+                        os_list.append('debian-slim')
+                        os_detected = True
+                    elif 'centos' in tag_value:
+                        os_list.append('centos')
+                        os_detected = True
+                    elif 'fedora' in tag_value:
+                        os_list.append('fedora')
+                        os_detected = True
+
+                elif child['type'] == 'DOCKER-IMAGE-NAME' and not os_detected:
+                    base_image = child['value'].lower()
+                    if base_image in ['alpine', 'ubuntu', 'debian', 'centos', 'fedora']:
+                        os_list.append(base_image)
+                        os_detected = True
+
+                if child['type'] == 'DOCKER-IMAGE-NAME':
+                    base_image = child['value'].lower()
+                    for needle, language in (('python', 'python'), ('node', 'nodejs'),
+                                             ('openjdk', 'java'), ('golang', 'golang')):
+                        if needle in base_image:
+                            language_version = language
+                            if 'DOCKER-IMAGE-TAG' in [c['type'] for c in node.get('children', [])]:
+                                tag_node = next(c for c in node['children'] if c['type'] == 'DOCKER-IMAGE-TAG')
+                                version = tag_node['value'].lower().split('-')[0]
+                                language_version += version
+                            language_list.append(language_version)
+                            language_detected = True
+                            break
+        elif node['type'] == 'DOCKER-RUN':
+            run_command = node['children'][0]['value'].lower()
+
+            if not language_detected:
+                if 'openjdk' in run_command or 'java' in run_command:
+                    language_list.append('java')
+                    language_detected = True
+                elif 'python' in run_command:
+                    if 'python3' in run_command:
+                        language_list.append('python3')
+                    else:
+                        language_list.append('python')
+                    language_detected = True
+                elif 'node' in run_command:
+                    language_list.append('nodejs')
+                    language_detected = True
+                elif 'golang' in run_command:
+                    language_list.append('golang')
+                    language_detected = True
+                elif 'ruby' in run_command:
+                    language_list.append('ruby')
+                    language_detected = True
+                elif 'gcc' in run_command or 'g++' in run_command:
+                    language_list.append('c')
+                    language_detected = True
+            if 'apt-get install' in run_command:
+                dependencies = re.findall(r'apt-get install\s+-y\s+([\w\s\-\.]+)', run_command)
+                dependencies_list.extend(dependencies)
+                for dep in dependencies:
+                    dep = dep.strip().lower()
+                    if 'python3' in dep or 'python' in dep:
+                        if 'python3-pip' in dep:
+                            language_list.append('python3')
+                        else:
+                            language_list.append('python')
+                        language_detected = True
+                    elif 'nodejs' in dep or 'node' in dep:
+                        language_list.append('nodejs')
+                        language_detected = True
+                    elif 'openjdk' in dep or 'java' in dep:
+                        language_list.append('java')
+                        language_detected = True
+                    elif 'golang' in dep or 'go' in dep:
+                        language_list.append('golang')
+                        language_detected = True
+                    elif 'ruby' in dep:
+                        language_list.append('ruby')
+                        language_detected = True
+                    elif 'gcc' in dep or 'g++' in dep:
+                        language_list.append('c/c++')
+                        language_detected = True
+            elif 'pip install' in run_command or 'pip3 install' in run_command:
+                dependencies = re.findall(r'pip(?:3)? install\s+([\w\s\-\.]+)', run_command)
+                dependencies_list.extend(dependencies)
+            elif 'npm install' in run_command:
+                dependencies = re.findall(r'npm install\s+([\w\s\-\.]+)', run_command)
+                dependencies_list.extend(dependencies)
+            elif 'gem install' in run_command:
+                dependencies = re.findall(r'gem install\s+([\w\s\-\.]+)', run_command)
+                dependencies_list.extend(dependencies)
+        for child in node.get('children', []):
+            traverse(child)
+
+    traverse(ast)
+
+    if not language_detected:
+        language_list.append('c')
+
+    return os_list, language_list, dependencies_list
+
+
+def clear_memos():
+    for classifier in (classify_tag, classify_image, classify_run):
+        classifier.cache_clear()
+
+
+# Best of `repeat` runs; `before` runs ahead of each one, outside the timing
+def measure(label, fn, asts, repeat, before=None):
+    timings = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        gc.collect()
+        start = time.perf_counter()
+        results = [fn(ast) for ast in asts]
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    if label:
+        print(f'{label:<16} {best:6.2f}s  {len(asts) / best:10.0f} Dockerfiles/s')
+    return best, results
+
+
+# Points app's classifiers at their unmemoized functions; returns the originals
+def _unmemoized():
+    saved = {name: getattr(app, name) for name in ('classify_tag', 'classify_image', 'classify_run')}
+    for name, classifier in saved.items():
+        setattr(app, name, classifier.__wrapped__)
+    return saved
+
+
+def sweep(sizes, repeat, seed):
+    # Cold speedup per corpus size: the memo tables only pay off once a
+    # corpus repeats enough tags, images and RUN lines
+    print(f'{"Dockerfiles":>11} {"legacy":>9} {"cold":>9} {"speedup":>8}')
+    speedups = []
+    for size in sizes:
+        asts = corpus(size, seed)
+        legacy, _ = measure(None, legacy_extract_layers, asts, repeat)
+        cold, _ = measure(None, extract_layers, asts, repeat, before=clear_memos)
+        speedups.append((size, legacy / cold))
+        print(f'{size:>11} {legacy:8.3f}s {cold:8.3f}s {legacy / cold:7.2f}x')
+    even = next((size for i, (size, _) in enumerate(speedups)
+                 if all(speedup >= 1 for _, speedup in speedups[i:])), None)
+    if even is None:
+        print(f'no break-even up to {sizes[-1]} Dockerfiles')
+    else:
+        print(f'cold run breaks even from {even} Dockerfiles')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark extract_layers')
+    parser.add_argument('--dockerfiles', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compact', action='store_true', help='also run on compact_ast views')
+    parser.add_argument('--sweep', default=None,
+                        help='comma-separated corpus sizes: print the cold speedup for each and the break-even size')
+    args = parser.parse_args()
+
+    if args.sweep:
+        sweep([int(size) for size in args.sweep.split(',')], args.repeat, args.seed)
+        return 0
+
+    asts = corpus(args.dockerfiles, args.seed)
+    runs = sum(len(ast['children']) for ast in asts)
+    print(f'{len(asts)} Dockerfiles, {runs} FROM/RUN directives')
+
+    # legacy:      the old substring/elif extract_layers
+    # unmemoized:  table-driven, every classification computed
+    # cold:        table-driven, memo tables emptied before every run (one
+    #              batch run over this corpus)
+    # warm:        table-driven, memo tables filled by the previous run (a
+    #              long-lived process seeing the same content again)
+    legacy, expected = measure('legacy', legacy_extract_layers, asts, args.repeat)
+    saved = _unmemoized()
+    try:
+        unmemoized, plain = measure('unmemoized', extract_layers, asts, args.repeat)
+    finally:
+        for name, classifier in saved.items():
+            setattr(app, name, classifier)
+    cold, actual = measure('cold', extract_layers, asts, args.repeat, before=clear_memos)
+    warm, _ = measure('warm', extract_layers, asts, args.repeat)
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if tuple(a) != tuple(b))
+    mismatches += sum(1 for a, b in zip(expected, plain) if tuple(a) != tuple(b))
+    if args.compact:
+        forest = Forest()
+        nodes = [forest.node(forest.add(ast)) for ast in asts]
+        print(f'compact forest: {len(forest)} nodes, {forest.nbytes() / 2 ** 20:.1f} MiB of arrays, '
+              f'{len(forest.values)} distinct values')
+        _, compact = measure('compact view', extract_layers, nodes, args.repeat, before=clear_memos)
+        mismatches += sum(1 for a, b in zip(expected, compact) if tuple(a) != tuple(b))
+    print(f'speedup over legacy: {legacy / unmemoized:.2f}x unmemoized, {legacy / cold:.2f}x cold, '
+          f'{legacy / warm:.2f}x warm, {mismatches} mismatching results')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
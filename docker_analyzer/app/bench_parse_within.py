@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import argparse
+
+# Benchmark: RUN lines per second through the old three-process pipeline
+# (parser | jq filter-1 | jq filter-2) versus the persistent parser pool with
+# in-process filters. The pool is timed without app.parse_within's result
+# cache, which would answer every repeated line from memory (or from a disk
+# cache left by an earlier run).
+#
+#   python bench_parse_within.py --lines 500 --pool-size 4
+
+RUN_LINES = [
+    'apt-get update && apt-get install -y --no-install-recommends curl ca-certificates && rm -rf /var/lib/apt/lists/*',
+    'pip install --no-cache-dir flask==2.1.1 requests',
+    'npm install -g yarn && yarn install --frozen-lockfile',
+    'apk add --no-cache git openssh && git clone https://example.com/repo.git /src',
+    'cd /src && make -j"$(nproc)" && make install',
+    'mkdir -p /app && chown -R app:app /app',
+    'curl -fsSL https://example.com/install.sh | sh',
+    'echo "deb http://deb.debian.org/debian stable main" > /etc/apt/sources.list',
+]
+
+
+def run_lines(count):
+    return [RUN_LINES[i % len(RUN_LINES)] for i in range(count)]
+
+
+def measure(label, fn, lines):
+    start = time.perf_counter()
+    results = fn(lines)
+    elapsed = time.perf_counter() - start
+    unknown = sum(1 for r in results if not r or r.get('type') == 'UNKNOWN')
+    print(f'{label:<28} {len(lines) / elapsed:10.1f} lines/s  ({elapsed:.2f}s, {unknown} UNKNOWN)')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parse_within')
+    parser.add_argument('--lines', type=int, default=200)
+    parser.add_argument('--pool-size', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--parser', help='bash parser command (default: $BASH_PARSER or /build/app)')
+    parser.add_argument('--filters', help='directory holding filter-1.jq and filter-2.jq (default: $BASH_FILTER_DIR or /filters)')
+    args = parser.parse_args()
+
+    if args.parser:
+        os.environ['BASH_PARSER'] = args.parser
+    if args.filters:
+        os.environ['BASH_FILTER_DIR'] = args.filters
+    os.environ['BASH_POOL_SIZE'] = str(args.pool_size)
+
+    import app
+    import bash_filters
+    from bash_pool import get_pool
+
+    lines = run_lines(args.lines)
+    print(f'{len(lines)} RUN lines, pool size {args.pool_size}')
+
+    before = measure('pipeline (3 processes)', lambda ls: [app.parse_within_pipeline(l) for l in ls], lines)
+
+    pool = get_pool()
+    pool.parse(lines[0])  # start one worker outside the timing
+
+    def parse_uncached(line):
+        raw = pool.parse(line)
+        return bash_filters.upgrade(raw) if raw is not None else None
+
+    after = measure('pool, sequential', lambda ls: [parse_uncached(l) for l in ls], lines)
+    concurrent = measure('pool, concurrent', lambda ls: _concurrent(parse_uncached, ls, args.pool_size), lines)
+
+    print(f'speedup: {before / after:.1f}x sequential, {before / concurrent:.1f}x concurrent')
+    pool.close()
+
+
+def _concurrent(fn, lines, workers):
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fn, lines))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
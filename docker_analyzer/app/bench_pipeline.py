@@ -0,0 +1,373 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+
+from bench_extract_layers import IMAGES, REPOS, APT_PACKAGES, PIP_PACKAGES, NPM_PACKAGES, GEM_PACKAGES
+
+# End-to-end benchmark of the analysis pipeline.
+#
+# A seeded generator builds a corpus of projects (Dockerfile + manifests):
+# multi-stage builds, long `&&` RUN chains and commands drawn from the
+# enrich/commands vocabulary (providers, scenarios and their boolean flags).
+# Every project is then run
+#   - in process, through analyze_buffers, collecting the per-stage timings
+#     (dockerfile_parse, bash_parse, jq_filters, enrich, extract_layers,
+#     manifests; see telemetry.py), and
+#   - through POST /analyze with Flask's test client (no network).
+# The report has p50/p95/p99 latencies, throughput and peak RSS, and can be
+# saved as a baseline and compared against later runs.
+#
+#   python bench_pipeline.py --projects 500 --save-baseline bench_baseline.json
+#   python bench_pipeline.py --projects 500 --baseline bench_baseline.json
+#   python bench_pipeline.py --write-corpus /tmp/corpus   # for batch.py
+#
+# bash_parse, jq_filters and enrich only run with --dependency-mode semantic,
+# which needs the bash parser and app.js (see the Dockerfile). Unset
+# DOCKER_ANALYZER_CACHE_DB so that results do not come from the disk cache.
+
+COMMANDS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'enrich', 'commands')
+
+# Words for positional arguments, picked by the argument's name in the scenario
+PACKAGES_BY_PROVIDER = {
+    'apt-get': APT_PACKAGES, 'apt': APT_PACKAGES, 'apk': APT_PACKAGES,
+    'yum': APT_PACKAGES, 'dnf': APT_PACKAGES,
+    'pip': PIP_PACKAGES, 'pip2': PIP_PACKAGES, 'pip3': PIP_PACKAGES,
+    'npm': NPM_PACKAGES, 'yarn': NPM_PACKAGES, 'gem': GEM_PACKAGES,
+    'go': ['github.com/spf13/cobra', 'golang.org/x/tools/cmd/goimports', 'github.com/gin-gonic/gin'],
+}
+PATHS = ['/app', '/src', '/usr/local/bin', '/etc/nginx/nginx.conf', '/tmp/build', '/var/lib/apt/lists/*']
+URLS = ['https://example.com/install.sh', 'https://github.com/example/repo.git', 'https://deb.example.com/key.gpg']
+WORDS = ['app', 'build', 'www-data', '755', 'main', 'release', 'install', 'all']
+
+# Used when neither a commands bundle nor PyYAML is available
+FALLBACK_COMMANDS = [
+    {'providerFor': ['apt-get'], 'scenarios': [{'cmd': '$0 update'}, {'cmd': '$0 install [packages...]',
+                                                 'options': {'booleans': ['-y', '--no-install-recommends']}}]},
+    {'providerFor': ['pip', 'pip3'], 'scenarios': [{'cmd': '$0 install [targets...]',
+                                                    'options': {'booleans': ['--no-cache-dir', '-U, --upgrade']}}]},
+    {'providerFor': ['npm'], 'scenarios': [{'cmd': '$0 install [packages...]', 'options': {'booleans': ['-g']}}]},
+    {'providerFor': ['apk'], 'scenarios': [{'cmd': '$0 add [packages...]', 'options': {'booleans': ['--no-cache']}}]},
+    {'providerFor': ['mkdir'], 'scenarios': [{'cmd': '$0 [paths...]', 'options': {'booleans': ['-p']}}]},
+    {'providerFor': ['rm'], 'scenarios': [{'cmd': '$0 [paths...]', 'options': {'booleans': ['-r', '-f']}}]},
+    {'providerFor': ['curl'], 'scenarios': [{'cmd': '$0 [url]', 'options': {'booleans': ['-f', '-s', '-L']}}]},
+]
+
+
+# Command specs as app.ts loads them: the ENRICH_COMMANDS_BUNDLE bundle if
+# one is set, else the YAML files
+def load_vocabulary(commands_dir=COMMANDS_DIR):
+    bundle = os.environ.get('ENRICH_COMMANDS_BUNDLE')
+    if bundle and os.path.exists(bundle):
+        with open(bundle) as fh:
+            return json.load(fh)['commands']
+    try:
+        import yaml
+    except ImportError:
+        return FALLBACK_COMMANDS
+    commands = []
+    for name in sorted(os.listdir(commands_dir)):
+        if name.endswith('.yml'):
+            with open(os.path.join(commands_dir, name)) as fh:
+                commands.append(yaml.safe_load(fh)['command'])
+    return commands
+
+
+def _booleans(options):
+    if not isinstance(options, dict):
+        return []
+    flags = list(options.get('booleans') or [])
+    for merged in options.get('merge') or []:
+        flags.extend(_booleans(merged))
+    return flags
+
+
+def _argument(rng, provider, name, variadic):
+    name = name.lower()
+    if 'package' in name or 'module' in name or 'target' in name or 'gem' in name:
+        pool = PACKAGES_BY_PROVIDER.get(provider, WORDS)
+    elif 'url' in name or 'repository' in name:
+        pool = URLS
+    elif 'path' in name or 'file' in name or 'dir' in name or name in ('dest', 'src', 'folder'):
+        pool = PATHS
+    else:
+        pool = WORDS
+    count = rng.randint(1, min(5, len(pool))) if variadic else 1
+    return rng.sample(pool, count)
+
+
+class CommandGenerator:
+    def __init__(self, commands):
+        self.invocations = []
+        for command in commands:
+            for scenario in command.get('scenarios') or []:
+                flags = [flag.split(',')[-1].strip() for flag in _booleans(scenario.get('options'))]
+                for provider in command.get('providerFor') or []:
+                    self.invocations.append((provider, scenario['cmd'].split(), flags))
+
+    def command(self, rng):
+        provider, tokens, flags = rng.choice(self.invocations)
+        words = [provider]
+        if flags and rng.random() < 0.6:
+            words.extend(rng.sample(flags, rng.randint(1, min(3, len(flags)))))
+        for token in tokens[1:]:
+            if token[0] in '<[':
+                optional = token[0] == '['
+                if optional and rng.random() < 0.3:
+                    continue
+                name = token.strip('<>[]')
+                variadic = name.endswith('...')
+                words.extend(_argument(rng, provider, name.rstrip('.'), variadic))
+            else:
+                words.append(token)
+        return ' '.join(words)
+
+
+def random_image(rng):
+    name, tags = rng.choice(IMAGES)
+    repo = rng.choice(REPOS)
+    image = f'{repo}/{name}' if repo else name
+    return f'{image}:{rng.choice(tags)}' if rng.random() < 0.9 else image
+
+
+def random_dockerfile(rng, commands):
+    lines = []
+    stages = 1 if rng.random() < 0.6 else rng.randint(2, 4)
+    for stage in range(stages):
+        last = stage == stages - 1
+        lines.append(f'FROM {random_image(rng)}' + ('' if last else f' AS stage{stage}'))
+        if rng.random() < 0.4:
+            lines.append('ARG DEBIAN_FRONTEND=noninteractive')
+        lines.append(f'WORKDIR {rng.choice(["/app", "/src", "/build"])}')
+        for _ in range(rng.randint(1, 6)):
+            # Long `&&` chains with line continuations, as in real Dockerfiles
+            chain = [commands.command(rng) for _ in range(rng.randint(1, 12))]
+            lines.append('RUN ' + ' \\\n    && '.join(chain))
+        if stage:
+            lines.append(f'COPY --from=stage{stage - 1} /app /app')
+        lines.append('COPY . /app')
+        if rng.random() < 0.5:
+            lines.append(f'ENV APP_ENV={rng.choice(["production", "staging"])}')
+    lines.append(f'EXPOSE {rng.choice([80, 5000, 8080])}')
+    lines.append(f'CMD ["{rng.choice(["python", "node", "./server"])}"]')
+    return '\n'.join(lines) + '\n'
+
+
+def random_manifests(rng):
+    manifests = {}
+    if rng.random() < 0.5:
+        manifests['requirements.txt'] = '\n'.join(
+            f'{name}=={rng.randint(0, 3)}.{rng.randint(0, 20)}.{rng.randint(0, 9)}'
+            for name in rng.sample(PIP_PACKAGES, rng.randint(1, len(PIP_PACKAGES)))
+        ) + '\n'
+    if rng.random() < 0.3:
+        manifests['package.json'] = json.dumps({
+            'name': 'app',
+            'dependencies': {name: f'^{rng.randint(1, 9)}.0.0' for name in rng.sample(NPM_PACKAGES, 3)}
+        }, indent=2)
+    if rng.random() < 0.1:
+        manifests['pom.xml'] = '<project><dependencies>' + ''.join(
+            f'<dependency><groupId>org.example</groupId><artifactId>{name}</artifactId></dependency>'
+            for name in ('spring-core', 'guava', 'junit')
+        ) + '</dependencies></project>'
+    return manifests
+
+
+# [{path: bytes}] per project, laid out like an upload (proj<N>/Dockerfile, ...)
+def corpus(count, seed=0, commands=None):
+    rng = random.Random(seed)
+    generator = CommandGenerator(commands if commands is not None else load_vocabulary())
+    projects = []
+    for index in range(count):
+        root = f'proj{index}'
+        files = {f'{root}/Dockerfile': random_dockerfile(rng, generator).encode()}
+        for name, text in random_manifests(rng).items():
+            files[f'{root}/{name}'] = text.encode()
+        projects.append(files)
+    return projects
+
+
+def write_corpus(projects, directory):
+    for files in projects:
+        for path, data in files.items():
+            full_path = os.path.join(directory, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'wb') as fh:
+                fh.write(data)
+
+
+def percentiles(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+
+    def at(q):
+        return values[min(len(values) - 1, max(0, int(round(q * len(values))) - 1))]
+
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values), 3),
+        'p50_ms': round(at(0.50), 3),
+        'p95_ms': round(at(0.95), 3),
+        'p99_ms': round(at(0.99), 3),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS; children are the parser workers
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return {'self': round(own / 2 ** 20, 1), 'children': round(children / 2 ** 20, 1)}
+
+
+def clear_caches():
+    from cache import _CACHES
+
+    for cache in _CACHES.values():
+        cache.clear()
+
+
+def run_pipeline(projects, analyze_buffers):
+    latencies = []
+    stages = {}
+    failed = 0
+    start = time.perf_counter()
+    for files in projects:
+        begin = time.perf_counter()
+        try:
+            result = analyze_buffers(files)
+        except Exception:
+            failed += 1
+            continue
+        latencies.append((time.perf_counter() - begin) * 1000)
+        for stage, ms in result['timings'].items():
+            if stage != 'total':
+                stages.setdefault(stage, []).append(ms)
+    elapsed = time.perf_counter() - start
+    report = percentiles(latencies)
+    report.update(throughput=round(len(projects) / elapsed, 1), failed=failed)
+    return report, {stage: percentiles(values) for stage, values in sorted(stages.items())}
+
+
+def run_endpoint(projects, client):
+    latencies = []
+    failed = 0
+    start = time.perf_counter()
+    for files in projects:
+        data = {'folder_files': [(io.BytesIO(content), path) for path, content in files.items()]}
+        begin = time.perf_counter()
+        response = client.post('/analyze', data=data, content_type='multipart/form-data')
+        latencies.append((time.perf_counter() - begin) * 1000)
+        if response.status_code != 200:
+            failed += 1
+    elapsed = time.perf_counter() - start
+    report = percentiles(latencies)
+    report.update(throughput=round(len(projects) / elapsed, 1), failed=failed)
+    return report
+
+
+# metric name -> (value, higher_is_better)
+def _metrics(report):
+    metrics = {'peak_rss_mb.self': (report['peak_rss_mb']['self'], False)}
+    for section in ('pipeline', 'analyze'):
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if key in report[section]:
+                metrics[f'{section}.{key}'] = (report[section][key], False)
+        metrics[f'{section}.throughput'] = (report[section]['throughput'], True)
+    for stage, values in report['stages'].items():
+        for key in ('p50_ms', 'p95_ms'):
+            if key in values:
+                metrics[f'stages.{stage}.{key}'] = (values[key], False)
+    return metrics
+
+
+def compare(report, baseline, tolerance):
+    regressions = 0
+    current = _metrics(report)
+    previous = _metrics(baseline)
+    print(f'\n{"metric":<36} {"baseline":>12} {"current":>12} {"change":>9}')
+    for name, (value, higher_is_better) in current.items():
+        if name not in previous:
+            continue
+        old = previous[name][0]
+        change = (value - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        flag = ''
+        if worse > tolerance:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f'{name:<36} {old:>12} {value:>12} {change:>+8.1%}{flag}')
+    if baseline.get('config') != report.get('config'):
+        print('note: baseline was recorded with a different configuration')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analysis pipeline end to end')
+    parser.add_argument('--projects', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dependency-mode', choices=('regex', 'semantic'), default='regex')
+    parser.add_argument('--warm', action='store_true', help='keep result caches between phases')
+    parser.add_argument('--write-corpus', metavar='DIR', help='write the corpus to DIR and exit')
+    parser.add_argument('--save-baseline', metavar='FILE')
+    parser.add_argument('--baseline', metavar='FILE', help='compare against a saved report')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed slowdown before flagging (0.10 = 10%%)')
+    args = parser.parse_args()
+
+    projects = corpus(args.projects, args.seed)
+    if args.write_corpus:
+        write_corpus(projects, args.write_corpus)
+        print(f'Wrote {len(projects)} projects to {args.write_corpus}')
+        return 0
+
+    os.environ['DEPENDENCY_MODE'] = args.dependency_mode
+    import main as server
+
+    runs = sum(files[f'proj{i}/Dockerfile'].count(b'\nRUN ') for i, files in enumerate(projects))
+    print(f'{len(projects)} projects, {runs} RUN directives, dependency mode {args.dependency_mode}')
+
+    pipeline, stages = run_pipeline(projects, server.analyze_buffers)
+    if not args.warm:
+        clear_caches()
+    analyze = run_endpoint(projects, server.app.test_client())
+
+    report = {
+        'config': {
+            'projects': args.projects, 'seed': args.seed,
+            'dependency_mode': args.dependency_mode, 'warm': args.warm,
+        },
+        'python': platform.python_version(),
+        'pipeline': pipeline,
+        'analyze': analyze,
+        'stages': stages,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+    print(f'\n{"":<18} {"count":>7} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"per s":>9}')
+    for label, values in [('pipeline', pipeline), ('POST /analyze', analyze)] + list(stages.items()):
+        print(f'{label:<18} {values["count"]:>7} {values.get("p50_ms", 0):>9} {values.get("p95_ms", 0):>9} '
+              f'{values.get("p99_ms", 0):>9} {values.get("throughput", ""):>9}')
+    print(f'peak RSS: {report["peak_rss_mb"]["self"]} MiB (parser workers {report["peak_rss_mb"]["children"]} MiB)')
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as fh:
+            json.dump(report, fh, indent=2)
+        print(f'Saved baseline to {args.save_baseline}')
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        regressions = compare(report, baseline, args.tolerance)
+        print(f'{regressions} regression(s) beyond {args.tolerance:.0%}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
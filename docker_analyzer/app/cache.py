@@ -0,0 +1,141 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Content-addressed result cache.
+#
+# Each ResultCache is a namespace ('dockerfile', 'layers', 'bash', ...) with a
+# bounded in-memory LRU tier and, when DOCKER_ANALYZER_CACHE_DB points at a
+# file, a SQLite tier shared by every process and kept across restarts.
+# Values must be JSON-serializable. Keys carry the namespace version, so
+# bumping `version` when the producing code changes invalidates old entries.
+
+CACHE_DB = os.environ.get('DOCKER_ANALYZER_CACHE_DB')
+CACHE_SIZE = int(os.environ.get('DOCKER_ANALYZER_CACHE_SIZE', '10000'))
+
+
+def content_key(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+class _DiskTier:
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+                'PRIMARY KEY (namespace, key)) WITHOUT ROWID'
+            )
+            conn.commit()
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace, key):
+        row = self._conn().execute(
+            'SELECT value FROM cache WHERE namespace = ? AND key = ?', (namespace, key)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, namespace, key, value):
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (namespace, key, value) VALUES (?, ?, ?)',
+            (namespace, key, json.dumps(value))
+        )
+        conn.commit()
+
+
+class ResultCache:
+    def __init__(self, namespace, version=1, maxsize=None, path=None):
+        self.namespace = namespace
+        self.version = version
+        self.maxsize = CACHE_SIZE if maxsize is None else maxsize
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        path = CACHE_DB if path is None else path
+        self.disk = _DiskTier(path) if path else None
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+    def _key(self, key):
+        return f'{self.version}:{key}'
+
+    def get(self, key):
+        key = self._key(key)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return self.memory[key]
+
+        value = None
+        if self.disk is not None:
+            try:
+                value = self.disk.get(self.namespace, key)
+            except sqlite3.Error:
+                value = None
+
+        with self.lock:
+            if value is None:
+                self.counters['misses'] += 1
+                return None
+            self.counters['disk_hits'] += 1
+            self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        key = self._key(key)
+        with self.lock:
+            self._remember(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.put(self.namespace, key, value)
+            except sqlite3.Error:
+                pass
+
+    def _remember(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['size'] = len(self.memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (lookups - stats['misses']) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+
+
+_CACHES = {}
+
+
+def get_cache(namespace, version=1):
+    cache = _CACHES.get(namespace)
+    if cache is None or cache.version != version:
+        cache = _CACHES[namespace] = ResultCache(namespace, version=version)
+    return cache
+
+
+def cache_stats():
+    return {namespace: cache.stats() for namespace, cache in _CACHES.items()}
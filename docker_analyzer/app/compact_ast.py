@@ -0,0 +1,217 @@
+import json
+from array import array
+from collections.abc import Mapping
+
+# Compact AST storage for large corpora.
+#
+# A Forest keeps any number of trees in flat arrays, one slot per node:
+#
+#   type          interned node type (index into forest.types)
+#   value         interned value (index into forest.values), -1 if absent
+#   parent, first_child, next_sibling
+#                 node indices, -1 if none
+#   flags         HAS_CHILDREN when the node has a 'children' list (even an
+#                 empty one), so absent and empty round-trip differently
+#
+# Types and values are stored once per forest however often they occur.
+# Keys other than type/value/children (bash trees carry a few) are kept in a
+# sparse side table. Children of a node get consecutive indices.
+#
+# forest.node(root) is a read-only Mapping view with the dict interface
+# ('type', 'value', 'children', get, in), so extract_layers and the other
+# tree walkers run on it unchanged. forest.dumps(root) writes the tree as JSON
+# without rebuilding dicts and forest.to_dict(root) gives back an equal tree.
+# Keys come out in a fixed order (type, value, other keys, children) rather
+# than the order they had, so the text matches json.dumps(tree) only for trees
+# built in that order, as directives.build_ast and the bash filters do.
+
+HAS_CHILDREN = 1
+NONE = -1
+
+# Children that are not nodes (null, strings, ...) are stored as nodes of
+# this type with the item as value
+SCALAR = '#scalar'
+
+_encode = json.JSONEncoder().encode
+
+
+class Forest:
+    __slots__ = ('types', 'type_ids', 'values', 'value_ids', 'type', 'value',
+                 'parent', 'first_child', 'next_sibling', 'flags', 'extras')
+
+    def __init__(self):
+        self.types = [SCALAR]
+        self.type_ids = {SCALAR: 0}
+        self.values = []
+        self.value_ids = {}
+        self.type = array('H')
+        self.value = array('i')
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.flags = array('B')
+        self.extras = {}  # node index -> {key: value}
+
+    def __len__(self):
+        return len(self.type)
+
+    def _type_id(self, name):
+        type_id = self.type_ids.get(name)
+        if type_id is None:
+            type_id = self.type_ids[name] = len(self.types)
+            self.types.append(name)
+        return type_id
+
+    def _value_id(self, value):
+        try:
+            key = (value.__class__, value)  # keeps 1, 1.0 and True apart
+            value_id = self.value_ids.get(key)
+        except TypeError:  # unhashable (list / dict value): stored as is
+            key = None
+            value_id = None
+        if value_id is None:
+            value_id = len(self.values)
+            self.values.append(value)
+            if key is not None:
+                self.value_ids[key] = value_id
+        return value_id
+
+    def _alloc(self, node, parent):
+        index = len(self.type)
+        if isinstance(node, dict):
+            self.type.append(self._type_id(node.get('type')))
+            self.value.append(self._value_id(node['value']) if 'value' in node else NONE)
+            extra = {key: item for key, item in node.items() if key not in ('type', 'value', 'children')}
+            if extra:
+                self.extras[index] = extra
+        else:
+            self.type.append(0)
+            self.value.append(self._value_id(node))
+        self.parent.append(parent)
+        self.first_child.append(NONE)
+        self.next_sibling.append(NONE)
+        self.flags.append(0)
+        return index
+
+    # Stores a dict tree; returns its root index
+    def add(self, tree):
+        root = self._alloc(tree, NONE)
+        stack = [(tree, root)]
+        while stack:
+            node, index = stack.pop()
+            children = node.get('children') if isinstance(node, dict) else None
+            if not isinstance(children, list):
+                if children is not None:  # not a list: keep it verbatim
+                    self.extras.setdefault(index, {})['children'] = children
+                continue
+            self.flags[index] |= HAS_CHILDREN
+            previous = NONE
+            for child in children:
+                child_index = self._alloc(child, index)
+                if previous == NONE:
+                    self.first_child[index] = child_index
+                else:
+                    self.next_sibling[previous] = child_index
+                previous = child_index
+                stack.append((child, child_index))
+        return root
+
+    def add_json(self, text):
+        return self.add(json.loads(text))
+
+    def child_indices(self, index):
+        child = self.first_child[index]
+        while child != NONE:
+            yield child
+            child = self.next_sibling[child]
+
+    def node(self, index):
+        return Node(self, index) if self.type[index] else self.values[self.value[index]]
+
+    def to_dict(self, root):
+        return json.loads(self.dumps(root))
+
+    # JSON text of one tree with keys in the order type, value, extra keys,
+    # children; json.loads of it equals the tree that was added
+    def dumps(self, root):
+        parts = []
+        types = self.types
+        values = self.values
+        extras = self.extras
+        # Work items: a node index to open, or a literal string to emit
+        stack = [root]
+        while stack:
+            item = stack.pop()
+            if item.__class__ is str:
+                parts.append(item)
+                continue
+            if not self.type[item]:
+                parts.append(_encode(values[self.value[item]]))
+                continue
+            parts.append('{"type": ' + _encode(types[self.type[item]]))
+            if self.value[item] != NONE:
+                parts.append(', "value": ' + _encode(values[self.value[item]]))
+            extra = extras.get(item)
+            if extra:
+                for key, value in extra.items():
+                    parts.append(', ' + _encode(key) + ': ' + _encode(value))
+            if not self.flags[item] & HAS_CHILDREN:
+                parts.append('}')
+                continue
+            children = list(self.child_indices(item))
+            if not children:
+                parts.append(', "children": []}')
+                continue
+            parts.append(', "children": [')
+            stack.append(']}')
+            for position in range(len(children) - 1, -1, -1):
+                stack.append(children[position])
+                if position:
+                    stack.append(', ')
+        return ''.join(parts)
+
+    def nbytes(self):
+        arrays = (self.type, self.value, self.parent, self.first_child, self.next_sibling, self.flags)
+        return sum(column.itemsize * len(column) for column in arrays)
+
+
+class Node(Mapping):
+    # Read-only dict view of one forest node
+    __slots__ = ('forest', 'index')
+
+    def __init__(self, forest, index):
+        self.forest = forest
+        self.index = index
+
+    def __getitem__(self, key):
+        forest = self.forest
+        index = self.index
+        if key == 'type':
+            return forest.types[forest.type[index]]
+        if key == 'value':
+            value = forest.value[index]
+            if value == NONE:
+                raise KeyError(key)
+            return forest.values[value]
+        if key == 'children' and forest.flags[index] & HAS_CHILDREN:
+            return [forest.node(child) for child in forest.child_indices(index)]
+        extra = forest.extras.get(index)
+        if extra and key in extra:
+            return extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        forest = self.forest
+        index = self.index
+        yield 'type'
+        if forest.value[index] != NONE:
+            yield 'value'
+        yield from forest.extras.get(index, ())
+        if forest.flags[index] & HAS_CHILDREN:
+            yield 'children'
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f'Node({self.forest.dumps(self.index)})'
@@ -0,0 +1,190 @@
+import random
+import itertools
+
+import pytest
+
+# Shared fixtures for the tests beside each module.
+#
+# The bash parser (/build/app) is not part of this tree, so RUN bodies are
+# built here directly as the ShellCheck token trees it prints
+# ({"tag": ..., "contents": [id, ...]}), which is what bash_filters.upgrade
+# and the jq filters consume.
+
+_ids = itertools.count(1)
+
+
+def _token(tag, *fields):
+    return {'tag': tag, 'contents': [next(_ids), *fields]}
+
+
+def lit(value):
+    return _token('T_Literal', value)
+
+
+def word(*parts):
+    return _token('T_NormalWord', [lit(part) if isinstance(part, str) else part for part in parts])
+
+
+def sq(value):
+    return word(_token('T_SingleQuoted', value))
+
+
+def dq(*parts):
+    return _token('T_DoubleQuoted', [lit(part) if isinstance(part, str) else part for part in parts])
+
+
+def glob(pattern):
+    return _token('T_Glob', pattern)
+
+
+def var(name):
+    return _token('T_DollarBraced', False, word(name))
+
+
+def sub(*statements):
+    # $( ... )
+    return _token('T_DollarExpansion', list(statements))
+
+
+def assign(name, value):
+    return _token('T_Assignment', 'Assign', name, [], word(value))
+
+
+def cmd(*words, assigns=(), redirects=()):
+    words = [word(w) if isinstance(w, str) else w for w in words]
+    simple = _token('T_SimpleCommand', list(assigns), words)
+    return _token('T_Redirecting', list(redirects), simple)
+
+
+def to_file(path, append=False):
+    op = {'tag': 'T_DGREAT' if append else 'T_Greater', 'contents': next(_ids)}
+    return _token('T_FdRedirect', '', _token('T_IoFile', op, word(path)))
+
+
+def and_if(*commands):
+    tree = commands[0]
+    for command in commands[1:]:
+        tree = _token('T_AndIf', tree, command)
+    return tree
+
+
+def or_if(left, right):
+    return _token('T_OrIf', left, right)
+
+
+def pipe(*commands):
+    return _token('T_Pipeline', [_token('T_Pipe', '|') for _ in commands[1:]], list(commands))
+
+
+def script(*statements):
+    return _token('T_Script', lit(''), list(statements))
+
+
+# (source, raw parser tree) for a few RUN bodies typical of Dockerfiles
+def _sample_scripts():
+    return [
+        ('apt-get update && apt-get install -y --no-install-recommends curl ca-certificates '
+         '&& rm -rf /var/lib/apt/lists/*', script(and_if(
+            cmd('apt-get', 'update'),
+            cmd('apt-get', 'install', '-y', '--no-install-recommends', 'curl', 'ca-certificates'),
+            cmd('rm', '-rf', word('/var/lib/apt/lists/', glob('*'))),
+        ))),
+        ('pip install --no-cache-dir flask==2.1.1 requests', script(
+            cmd('pip', 'install', '--no-cache-dir', 'flask==2.1.1', 'requests'),
+        )),
+        ('npm install -g yarn && yarn install --frozen-lockfile', script(and_if(
+            cmd('npm', 'install', '-g', 'yarn'),
+            cmd('yarn', 'install', '--frozen-lockfile'),
+        ))),
+        ('cd /src && make -j"$(nproc)" && make install', script(and_if(
+            cmd('cd', '/src'),
+            cmd('make', word('-j', dq(sub(cmd('nproc'))))),
+            cmd('make', 'install'),
+        ))),
+        ('curl -fsSL https://example.com/install.sh | sh', script(pipe(
+            cmd('curl', '-fsSL', 'https://example.com/install.sh'),
+            cmd('sh'),
+        ))),
+        ('echo "deb http://deb.debian.org/debian stable main" > /etc/apt/sources.list', script(
+            cmd('echo', word(dq('deb http://deb.debian.org/debian stable main')),
+                redirects=[to_file('/etc/apt/sources.list')]),
+        )),
+        ('apk add --no-cache git openssh || true', script(or_if(
+            cmd('apk', 'add', '--no-cache', 'git', 'openssh'),
+            cmd('true'),
+        ))),
+        ('PIP_NO_CACHE_DIR=1 pip3 install -r /app/requirements.txt', script(
+            cmd('pip3', 'install', '-r', '/app/requirements.txt', assigns=[assign('PIP_NO_CACHE_DIR', '1')]),
+        )),
+        ('apt-get install -y $(cat /tmp/packages | xargs) >> /log', script(
+            cmd('apt-get', 'install', '-y', word(sub(pipe(cmd('cat', '/tmp/packages'), cmd('xargs')))),
+                redirects=[to_file('/log', append=True)]),
+        )),
+        ("find / -name '*.pyc' -exec rm -f {} +", script(
+            cmd('find', '/', '-name', sq('*.pyc'), '-exec', 'rm', '-f', '{}', '+'),
+        )),
+        ('gem install bundler -v "$(tail -n 1 Gemfile.lock)"', script(
+            cmd('gem', 'install', 'bundler', '-v', word(dq(sub(cmd('tail', '-n', '1', 'Gemfile.lock'))))),
+        )),
+        ('chown -R ${APP_USER}:${APP_USER} /app', script(
+            cmd('chown', '-R', word(var('APP_USER'), ':', var('APP_USER')), '/app'),
+        )),
+    ]
+
+
+_COMMANDS = [
+    ('apt-get', 'install', '-y', 'curl', 'git'),
+    ('apt-get', 'update'),
+    ('pip', 'install', '--upgrade', 'pip', 'setuptools'),
+    ('pip3', 'install', '-r', 'requirements.txt'),
+    ('npm', 'install', '-g', 'typescript'),
+    ('apk', 'add', '--no-cache', 'bash'),
+    ('mkdir', '-p', '/app/data'),
+    ('cp', '-r', '/src', '/app'),
+    ('rm', '-rf', '/tmp/build'),
+    ('chmod', '+x', '/entrypoint.sh'),
+    ('curl', '-fsSL', '-o', '/tmp/x.tgz', 'https://example.com/x.tgz'),
+    ('tar', '-xzf', '/tmp/x.tgz', '-C', '/opt'),
+    ('git', 'clone', '--depth', '1', 'https://example.com/repo.git'),
+    ('echo', 'done'),
+    ('cat', '/etc/os-release'),
+    ('go', 'build', '-o', '/bin/app', '.'),
+    ('unknown-tool', '--flag', 'value'),
+]
+
+
+def _random_command(rng, depth):
+    words = list(rng.choice(_COMMANDS))
+    # Command substitutions in arguments nest commands inside the payloads
+    # the enricher produces, which is what the fixpoint has to handle
+    if depth < 3 and rng.random() < 0.5:
+        inner = _random_statement(rng, depth + 1)
+        words.append(word(sub(inner)) if rng.random() < 0.5 else word(dq(sub(inner))))
+    return cmd(*words)
+
+
+def _random_statement(rng, depth=0):
+    commands = [_random_command(rng, depth) for _ in range(rng.randint(1, 3))]
+    kind = rng.randrange(3)
+    if len(commands) == 1:
+        return commands[0]
+    if kind == 0:
+        return and_if(*commands)
+    if kind == 1:
+        return pipe(*commands)
+    return or_if(commands[0], and_if(*commands[1:]) if len(commands) > 2 else commands[1])
+
+
+def random_scripts(count, seed=0):
+    rng = random.Random(seed)
+    return [script(*[_random_statement(rng) for _ in range(rng.randint(1, 3))]) for _ in range(count)]
+
+
+@pytest.fixture
+def sample_scripts():
+    return _sample_scripts()
+
+
+@pytest.fixture
+def raw_scripts():
+    return [raw for _, raw in _sample_scripts()] + random_scripts(200)
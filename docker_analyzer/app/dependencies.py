@@ -0,0 +1,152 @@
+import re
+
+# Structured dependency extraction from enriched bash trees.
+#
+# EnrichPass (enrich/index.ts) rewrites every recognised command into an SC-*
+# subtree using the YAML specs in enrich/commands/. For the install commands
+# listed below, the positional package list shows up as e.g.
+#
+#   SC-APT-GET-INSTALL
+#     SC-APT-GET-PACKAGES
+#       SC-APT-GET-PACKAGE -> BASH-LITERAL 'curl=7.68.0-1'
+#
+# so options (--no-install-recommends, -y, ...), line continuations and
+# && chains are already taken care of by the bash parser and the enricher.
+# extract_dependencies walks the trees once and turns every package word
+# into a (manager, package, version) record.
+
+
+def _split_on(separator):
+    def split(word):
+        name, sep, version = word.partition(separator)
+        return (name, version) if sep and name and version else (word, None)
+    return split
+
+
+# apk accepts name=1.2, name~1.2, name>1.2, name>=1.2, name<1.2
+_APK_PIN = re.compile(r'^([^=<>~]+)((?:[<>]=?|=|~).+)$')
+# PEP 508 name, optional extras, optional version specifier
+_PIP_PIN = re.compile(r'^([A-Za-z0-9][A-Za-z0-9._-]*)(\[[^\]]*\])?\s*((?:==|>=|<=|~=|!=|===|<|>).+)?$')
+
+
+def _split_apk(word):
+    match = _APK_PIN.match(word)
+    if not match:
+        return word, None
+    name, version = match.groups()
+    return name, version[1:] if version.startswith('=') else version
+
+
+def _split_pip(word):
+    match = _PIP_PIN.match(word)
+    if not match:
+        return None, None  # paths, URLs, VCS links: not a package name
+    name, _, version = match.groups()
+    if version and version.startswith('==') and not version.startswith('==='):
+        version = version[2:]
+    return name, version
+
+
+def _split_npm(word):
+    # @scope/name@1.2.3: the version separator is the last '@' after the first char
+    at = word.rfind('@')
+    if at > 0:
+        return word[:at], word[at + 1:] or None
+    return word, None
+
+
+# SC node type -> (manager, package item node type, version splitter).
+# To cover another installer, add its enricher YAML and a row here.
+DEPENDENCY_RULES = {
+    'SC-APT-GET-INSTALL': ('apt', 'SC-APT-GET-PACKAGE', _split_on('=')),
+    'SC-APT-INSTALL': ('apt', 'SC-APT-PACKAGE', _split_on('=')),
+    'SC-APK-ADD': ('apk', 'SC-APK-PACKAGE', _split_apk),
+    'SC-YUM-INSTALL': ('yum', 'SC-YUM-PACKAGE', lambda word: (word, None)),
+    'SC-DNF-INSTALL': ('dnf', 'SC-DNF-PACKAGE', lambda word: (word, None)),
+    'SC-PIP-INSTALL': ('pip', 'SC-PIP-TARGET', _split_pip),
+    'SC-NPM-INSTALL': ('npm', 'SC-NPM-PACKAGE', _split_npm),
+    'SC-YARN-ADD': ('yarn', 'SC-YARN-MODULE', _split_npm),
+    'SC-YARN-GLOBAL-ADD': ('yarn', 'SC-YARN-MODULE', _split_npm),
+    'SC-GEM-INSTALL': ('gem', 'SC-GEM-GEM', _split_on(':')),
+    'SC-GO-GET': ('go', 'SC-GO-PACKAGE', _split_on('@')),
+    'SC-GO-INSTALL': ('go', 'SC-GO-PACKAGE', _split_on('@')),
+}
+
+# Option nodes that pin the version of every package in the command
+# (gem install rails -v 7.0.4)
+VERSION_OPTIONS = {
+    'SC-GEM-INSTALL': 'SC-GEM-VERSION',
+}
+
+
+# Static text of a bash word, without quotes; None if it depends on a
+# command substitution or anything else that is only known at build time
+def word_value(node):
+    node_type = node['type']
+    if node_type in ('BASH-LITERAL', 'BASH-SINGLE-QUOTED', 'BASH-DOLLAR-SINGLE-QUOTED', 'BASH-GLOB'):
+        value = node.get('value')
+        return None if value is None else str(value)
+    if node_type == 'BASH-VARIABLE':
+        return '${' + str(node.get('value')) + '}'
+    if node_type in ('BASH-CONCAT', 'BASH-DOUBLE-QUOTED', 'BASH-PATH'):
+        parts = [word_value(child) for child in node['children']]
+        return None if None in parts else ''.join(parts)
+    return None
+
+
+# The enricher turns an option value it cannot map back to the original
+# word into a plain literal, e.g. gem install bundler -v "$(tail -n 1 x)"
+_SUBSTITUTION = re.compile(r'\$\(|`')
+
+
+def _item_word(item):
+    children = item.get('children')
+    value = word_value(children[0]) if children else None
+    return None if value is None or _SUBSTITUTION.search(value) else value
+
+
+def _command_records(node, manager, item_type, split):
+    words = []
+    version_option = VERSION_OPTIONS.get(node['type'])
+    pinned = None
+
+    stack = list(node['children'])
+    while stack:
+        child = stack.pop()
+        child_type = child['type']
+        if child_type == item_type:
+            words.append(_item_word(child))
+        elif child_type == version_option:
+            pinned = _item_word(child)
+        else:
+            stack.extend(child.get('children') or ())
+    words.reverse()  # stack order -> argument order
+
+    records = []
+    for word in words:
+        if not word:
+            continue
+        package, version = split(word)
+        if not package:
+            continue
+        records.append({'manager': manager, 'package': package, 'version': version or pinned})
+    return records
+
+
+# One pass over any number of enriched trees (one per RUN); returns the
+# dependency records in document order
+def extract_dependencies(trees):
+    records = []
+    stack = list(reversed(trees))
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        rule = DEPENDENCY_RULES.get(node.get('type'))
+        if rule is not None:
+            records.extend(_command_records(node, *rule))
+            continue
+        children = node.get('children')
+        if isinstance(children, list):
+            stack.extend(reversed(children))
+    return records
@@ -0,0 +1,316 @@
+import re
+import json
+import shlex
+
+import dockerfile
+
+# Dockerfile -> DOCKER-* AST, covering every directive.
+#
+# The AST is flat: DOCKER-FILE holds one node per directive in document
+# order, using the node vocabulary of ast.ts (DOCKER-COPY-SOURCE,
+# DOCKER-PATH, DOCKER-NAME, DOCKER-LITERAL, ...) plus DOCKER-FLAG,
+# DOCKER-IMAGE-REGISTRY/-DIGEST/-ALIAS and nodes for LABEL, HEALTHCHECK,
+# ONBUILD, STOPSIGNAL and MAINTAINER. RUN keeps MAYBE-BASH as its first
+# child, which is what extract_layers and the bash pipeline read.
+#
+# ARG and ENV references are substituted the way the builder does it: global
+# ARGs (before the first FROM) in FROM lines, and the stage's ARGs and ENVs
+# (ENVs inherited from a parent stage) in ADD, COPY, ENV, EXPOSE, LABEL,
+# STOPSIGNAL, USER, VOLUME and WORKDIR. RUN, CMD and ENTRYPOINT are left to
+# the shell. References without a known value are kept as written.
+#
+# A new stage starts at every DOCKER-FROM; split_stages and stage_graph work
+# on that flat list.
+
+VALID_DIRECTIVES = [
+    'from', 'run', 'cmd', 'label', 'maintainer', 'expose', 'env', 'add', 'copy',
+    'entrypoint', 'volume', 'user', 'workdir', 'arg', 'onbuild', 'stopsignal', 'healthcheck', 'shell'
+]
+
+# Directives whose plain values are substituted (ADD/COPY, ARG, ENV and LABEL
+# are substituted value by value where they are built)
+SUBSTITUTED = {'expose', 'stopsignal', 'user', 'volume', 'workdir'}
+
+# \$ (escaped), ${NAME}, ${NAME:-word}, ${NAME:+word}, $NAME
+_REFERENCE = re.compile(
+    r'\\(\$)|\$(?:\{([A-Za-z_][A-Za-z0-9_]*)(?::([-+])([^}]*))?\}|([A-Za-z_][A-Za-z0-9_]*))'
+)
+# host[:port] as the first path component: has a '.' or a ':', or is localhost
+_REGISTRY = re.compile(r'^(?:localhost|[^/]*[.:][^/]*)$')
+
+
+def substitute(text, scope):
+    def replace(match):
+        if match.group(1):
+            return '$'
+        name = match.group(2) or match.group(5)
+        value = scope.get(name)
+        operator = match.group(3)
+        if operator == '-':
+            return value if value else substitute(match.group(4), scope)
+        if operator == '+':
+            return substitute(match.group(4), scope) if value else ''
+        return match.group(0) if value is None else value
+
+    return _REFERENCE.sub(replace, text) if '$' in text else text
+
+
+def unquote(text):
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in '"\'':
+        text = text[1:-1]
+    return text
+
+
+# registry[:port]/path/name[:tag][@digest] -> parts; missing parts are None
+def parse_image_ref(ref):
+    ref = ref.strip()
+    rest, _, digest = ref.partition('@')
+    path, _, name = rest.rpartition('/')
+    name, _, tag = name.partition(':')
+    registry = None
+    if path:
+        first = path.split('/', 1)[0]
+        if _REGISTRY.match(first):
+            registry = first
+    return {
+        'registry': registry,
+        'repo': path or None,
+        'name': name,
+        'tag': tag or None,
+        'digest': digest or None,
+    }
+
+
+def _leaf(node_type, value):
+    return {'type': node_type, 'value': value, 'children': []}
+
+
+def _name_value(name, value):
+    children = [_leaf('DOCKER-NAME', name)]
+    if value is not None:
+        children.append(_leaf('DOCKER-LITERAL', value))
+    return children
+
+
+def _flags(flags, scope=None):
+    nodes = []
+    for flag in flags:
+        name, _, value = flag.lstrip('-').partition('=')
+        if scope is not None:
+            value = substitute(value, scope)
+        nodes.append({'type': 'DOCKER-FLAG', 'children': _name_value(name, value)})
+    return nodes
+
+
+def _from_node(directive, global_args):
+    values = directive.value
+    ref = substitute(values[0], global_args)
+    image = parse_image_ref(ref)
+
+    children = [_leaf('DOCKER-IMAGE-NAME', image['name'])]
+    if image['repo']:
+        children.append(_leaf('DOCKER-IMAGE-REPO', image['repo']))
+    if image['tag']:
+        children.append(_leaf('DOCKER-IMAGE-TAG', image['tag']))
+    if image['digest']:
+        children.append(_leaf('DOCKER-IMAGE-DIGEST', image['digest']))
+    if image['registry']:
+        children.append(_leaf('DOCKER-IMAGE-REGISTRY', image['registry']))
+    alias = None
+    if len(values) >= 3 and values[1].lower() == 'as':
+        alias = values[2]
+        children.append(_leaf('DOCKER-IMAGE-ALIAS', alias))
+    children.extend(_flags(directive.flags, global_args))
+    return {'type': 'DOCKER-FROM', 'value': ref, 'children': children}, alias
+
+
+def _command_text(directive):
+    heredocs = getattr(directive, 'heredocs', ())
+    if heredocs and len(directive.value) == 1 and directive.value[0].startswith('<<'):
+        return heredocs[0].content
+    if directive.json:
+        return shlex.join(directive.value)
+    return directive.value[0] if directive.value else ''
+
+
+def _exec_node(node_type, directive, executable_type, arg_type):
+    if not directive.json:
+        return {'type': node_type, 'children': [_leaf('MAYBE-BASH', _command_text(directive))]}
+    children = []
+    for index, value in enumerate(directive.value):
+        item_type = executable_type if index == 0 and executable_type else arg_type
+        children.append({'type': item_type, 'children': [_leaf('DOCKER-LITERAL', value)]})
+    return {'type': node_type, 'children': children}
+
+
+def _transfer_node(cmd, directive, scope):
+    prefix = 'DOCKER-' + cmd.upper()
+    values = [substitute(value, scope) for value in directive.value]
+    children = _flags(directive.flags, scope)
+    for source in values[:-1]:
+        children.append({'type': prefix + '-SOURCE', 'children': [_leaf('DOCKER-PATH', source)]})
+    if values:
+        children.append({'type': prefix + '-TARGET', 'children': [_leaf('DOCKER-PATH', values[-1])]})
+    return {'type': prefix, 'children': children}
+
+
+class _Scope:
+    # Variable lookup inside a stage: ENV first, then the stage's ARGs
+    def __init__(self, env, args):
+        self.env = env
+        self.args = args
+
+    def get(self, name):
+        value = self.env.get(name)
+        return self.args.get(name) if value is None else value
+
+
+def build_ast(content, build_args=None):
+    build_args = build_args or {}
+    parsed = dockerfile.parse_string(content)
+
+    global_args = {}
+    stage_env = {}  # stage alias -> that stage's ENV
+    scope = global_args
+    env = None
+    children = []
+
+    for directive in parsed:
+        cmd = directive.cmd.lower()
+        if cmd not in VALID_DIRECTIVES:
+            raise Exception(f'Found invalid directive {directive.cmd}')
+
+        if cmd == 'from':
+            node, alias = _from_node(directive, global_args)
+            # FROM <earlier stage>: the new stage starts with its ENV
+            env = dict(stage_env.get(node['value'].lower(), {}))
+            scope = _Scope(env, {})
+            if alias:
+                stage_env[alias.lower()] = env
+            children.append(node)
+            continue
+
+        values = directive.value
+        if cmd in SUBSTITUTED:
+            values = [substitute(value, scope) for value in values]
+
+        if cmd == 'run':
+            node = {'type': 'DOCKER-RUN', 'children': [_leaf('MAYBE-BASH', _command_text(directive))]}
+            node['children'].extend(_flags(directive.flags))
+        elif cmd == 'arg':
+            node = {'type': 'DOCKER-ARG', 'children': []}
+            for value in values:
+                name, has_default, default = value.partition('=')
+                default = substitute(unquote(default), scope) if has_default else None
+                if name in build_args:
+                    resolved = build_args[name]
+                elif default is not None:
+                    resolved = default
+                else:
+                    resolved = global_args.get(name)
+                if env is None:
+                    global_args[name] = resolved
+                else:
+                    scope.args[name] = resolved
+                node['children'].extend(_name_value(name, default))
+        elif cmd in ('env', 'label'):
+            node = {'type': 'DOCKER-' + cmd.upper(), 'children': []}
+            for name, value in zip(values[::2], values[1::2]):
+                name = unquote(name)
+                value = substitute(unquote(value), scope)
+                if cmd == 'env' and env is not None:
+                    env[name] = value
+                node['children'].extend(_name_value(name, value))
+        elif cmd in ('copy', 'add'):
+            node = _transfer_node(cmd, directive, scope)
+        elif cmd == 'cmd':
+            node = _exec_node('DOCKER-CMD', directive, None, 'DOCKER-CMD-ARG')
+        elif cmd == 'entrypoint':
+            node = _exec_node('DOCKER-ENTRYPOINT', directive, 'DOCKER-ENTRYPOINT-EXECUTABLE', 'DOCKER-ENTRYPOINT-ARG')
+        elif cmd == 'shell':
+            node = _exec_node('DOCKER-SHELL', directive, 'DOCKER-SHELL-EXECUTABLE', 'DOCKER-SHELL-ARG')
+        elif cmd == 'expose':
+            node = {'type': 'DOCKER-EXPOSE', 'children': [_leaf('DOCKER-PORT', value) for value in values]}
+        elif cmd in ('workdir', 'volume'):
+            node = {'type': 'DOCKER-' + cmd.upper(), 'children': [_leaf('DOCKER-PATH', value) for value in values]}
+        elif cmd == 'onbuild':
+            # The trigger runs in downstream builds; kept as text so it is not
+            # mistaken for this image's own RUN/COPY
+            trigger = directive.original.split(None, 1)[1] if ' ' in directive.original else ''
+            node = {'type': 'DOCKER-ONBUILD', 'children': [_leaf('DOCKER-LITERAL', trigger)]}
+        else:
+            # user, stopsignal, maintainer, healthcheck
+            node = {'type': 'DOCKER-' + cmd.upper(), 'children': _flags(directive.flags)}
+            node['children'].extend(_leaf('DOCKER-LITERAL', value) for value in values)
+        children.append(node)
+
+    return {'type': 'DOCKER-FILE', 'children': children}
+
+
+# [preamble nodes, stage 0 nodes, stage 1 nodes, ...]; each stage list starts
+# with its DOCKER-FROM, the preamble holds the global ARGs
+def split_stages(ast):
+    groups = [[]]
+    for node in ast['children']:
+        if node['type'] == 'DOCKER-FROM':
+            groups.append([])
+        groups[-1].append(node)
+    return groups
+
+
+def stage_key(nodes):
+    return json.dumps(nodes, sort_keys=True, separators=(',', ':'))
+
+
+def _flag_values(node, name):
+    for child in node['children']:
+        if child['type'] == 'DOCKER-FLAG' and child['children'][0]['value'] == name:
+            yield child['children'][1]['value'] if len(child['children']) > 1 else ''
+
+
+# One entry per stage: its base image (or parent stage) and the stages and
+# external images it copies from
+def stage_graph(ast):
+    stages = []
+    names = {}
+
+    def resolve(ref):
+        ref = ref.lower()
+        if ref in names:
+            return names[ref]
+        if ref.isdigit() and int(ref) < len(stages):
+            return int(ref)
+        return None
+
+    for nodes in split_stages(ast)[1:]:
+        from_node = nodes[0]
+        index = len(stages)
+        alias = next((c['value'] for c in from_node['children'] if c['type'] == 'DOCKER-IMAGE-ALIAS'), None)
+        stage = {
+            'index': index,
+            'name': alias,
+            'base': from_node['value'],
+            'base_stage': resolve(from_node['value']),
+            'copies_from': [],
+            'external': [],
+        }
+        for node in nodes[1:]:
+            sources = []
+            if node['type'] in ('DOCKER-COPY', 'DOCKER-ADD'):
+                sources = list(_flag_values(node, 'from'))
+            elif node['type'] == 'DOCKER-RUN':
+                for mount in _flag_values(node, 'mount'):
+                    options = dict(part.partition('=')[::2] for part in mount.split(','))
+                    if options.get('from'):
+                        sources.append(options['from'])
+            for source in sources:
+                parent = resolve(source)
+                if parent is not None:
+                    if parent not in stage['copies_from']:
+                        stage['copies_from'].append(parent)
+                elif source not in stage['external']:
+                    stage['external'].append(source)
+        stages.append(stage)
+        if alias:
+            names[alias.lower()] = index
+    return stages
@@ -0,0 +1,10 @@
+# Which files in a project tree are Dockerfiles.
+#
+# Shared by the batch CLI (batch.py) and the upload handling
+# (upload_buffers.py); it imports nothing, so the web app can use it without
+# loading the batch process pool and its progress bar.
+
+
+def is_dockerfile(name):
+    name = name.lower()
+    return name == 'dockerfile' or name.startswith('dockerfile.') or name.endswith('.dockerfile')
@@ -1,9 +1,20 @@
 import * as fs from 'fs';
+import * as crypto from 'crypto';
 import * as yaml from 'js-yaml';
 import { stringifyBash } from '../../ast';
 
 const YAML_DIR = '/app/enrich/commands';
 
+// All command specs as one JSON document, written by running this module
+// directly (node /build/enrich/commands/index.js <out>). Only used when
+// ENRICH_COMMANDS_BUNDLE points at it, and only while it matches the YAML
+const COMMANDS_BUNDLE = process.env.ENRICH_COMMANDS_BUNDLE;
+
+// Fresh (non-singleton) yargs instances, used to compile the scenarios
+const Yargs = require('yargs/yargs');
+// The parser yargs runs underneath; scenarios are parsed with it directly
+const Parser = require('yargs-parser');
+
 const getArgsFromList = (list) => {
   return (list || []).map(arg => {
     if (arg.indexOf(',') === -1) {
@@ -68,100 +79,245 @@ const getValuedOptions = (yargs) => {
   ).flat();
 };
 
-const matchFlag = (flag, args) => {
-  if (args.indexOf(flag.trim()) !== -1) {
-    return true;
-  }
+// Copy of the option tables the post processor reads, detached from yargs
+const snapshotOptions = (yargs) => {
+  const theOpts = yargs.getOptions();
+
+  return Object.freeze({
+    alias: JSON.parse(JSON.stringify(theOpts.alias)),
+    boolean: theOpts.boolean.slice(),
+    string: theOpts.string.slice(),
+    array: theOpts.array.slice()
+  });
+};
+
+// Alias groups with every name of an option, longest name first
+const mergeAliases = (alias) => {
+  let aliases = JSON.parse(JSON.stringify(alias));
 
-  // Support -axfsfsdg style
-  for (let i = 0; i < args.length; i++) {
-    if (/^-\w/.test(args[i]) && flag.replace('-', '').trim().length === 1) {
-      if (args[i].indexOf(flag.replace('-', '').trim()) !== -1) {
-        return true;
+  Object.keys(aliases).forEach(k1 => {
+    Object.keys(aliases).forEach(k2 => {
+      if (k1 === k2) {
+        return;
       }
-    }
-  }
+      if (aliases[k1].length === aliases[k2].length && aliases[k1].every((x, i) => x === aliases[k2][i])) {
+        aliases[k1].push(k2);
+        aliases[k2].push(k1);
+      }
+    });
+  });
 
-  return false;
-};
+  Object.keys(aliases).forEach(k => aliases[k] = Object.freeze(aliases[k].sort((a, b) => b.length - a.length)));
 
-const buildScenarioParser = (scenario) => {
-  return (args) => {
-    // Save these
-    const originalArgs = args;
+  return Object.freeze(aliases);
+};
 
-    // Dirty require.cache trickery
-    delete require.cache['/usr/local/lib/node_modules/yargs/index.js'];
-    let yargs = require('yargs');
+// Compiles a mustHave list into one predicate over the args. A flag is
+// present if it is one of the args, or, for single-letter flags, if its
+// letter appears in a -abc style cluster.
+const compileFlagMatcher = (flags) => {
+  const wanted = flags.map(flag => ({
+    exact: flag.trim(),
+    letter: flag.replace('-', '').trim().length === 1 ? flag.replace('-', '').trim() : null
+  }));
 
-    // Look at scenario.cmd and do some checking
-    const checkScenarioValidity = (args) => {
-      const parts = scenario.cmd.split(/ /g);
+  return (args) => {
+    const present = new Set(args);
+    const letters = new Set();
 
-      // Check early rejection
-      if (scenario.rejectIf) {
-        if (scenario.rejectIf.some(a => args.indexOf(a) !== -1)) {
-          return false;
+    for (let i = 0; i < args.length; i++) {
+      if (/^-\w/.test(args[i])) {
+        for (const ch of args[i]) {
+          letters.add(ch);
         }
       }
+    }
 
-      let valid = true;
+    return wanted.every(
+      flag => present.has(flag.exact) || (flag.letter !== null && letters.has(flag.letter))
+    );
+  };
+};
 
-      if (parts.length > 1 && !parts[1].trim().startsWith('<') && !parts[1].trim().startsWith('[')) {
-        valid = valid && (args.indexOf(parts[1].trim()) !== -1);
-      }
+// Sets up a yargs instance for the scenario's options (compiled by
+// compileYargs, never parsed with)
+const buildYargs = (scenario, options) => {
+  // Set all of these properties up so we have controllable
+  // behavior from yargs
+  let yargs = Yargs()
+    .help(false)
+    .version(false)
+    .exitProcess(false)
+    .showHelpOnFail(false)
+    .parserConfiguration({ 'boolean-negation': false, 'camel-case-expansion': false })
+    .fail((a,b,c) => { throw new Error('Arg parsing failed.') })
+    .command(scenario.cmd);
+
+  // Go through and add the info in the yaml to the parser
+  if (options.booleans && options.booleans.length >= 1) {
+    yargs = options.booleans.reduce(
+      (yargs, arg) => addToYargs(arg, yargs.boolean), yargs
+    );
+  }
+  if (options.strings && options.strings.length >= 1) {
+    yargs = options.strings.reduce(
+      (yargs, arg) => addToYargs(arg, yargs.string), yargs
+    );
+  }
+  if (options.paths && options.paths.length >= 1) {
+    yargs = options.paths.reduce(
+      (yargs, arg) => addToYargs(arg, yargs.string), yargs
+    );
+  }
+  if (options.arrays && options.arrays.length >= 1) {
+    yargs = options.arrays.reduce(
+      (yargs, arg) => addToYargs(arg, yargs.array), yargs
+    );
+  }
+  if (options.counts && options.counts.length >= 1) {
+    yargs = options.counts.reduce(
+      (yargs, arg) => addToYargs(arg, yargs.count), yargs
+    );
+  }
 
-      if (scenario.mustHave && scenario.mustHave.length > 0) {
-        valid = valid && scenario.mustHave.every(flag => matchFlag(flag, args));
-      }
+  return yargs;
+};
 
-      return valid;
-    };
+const deepFreeze = (value) => {
+  if (value && typeof value === 'object' && !Object.isFrozen(value)) {
+    Object.values(value).forEach(deepFreeze);
+    Object.freeze(value);
+  }
+  return value;
+};
 
-    // Set all of these properties up so we have controllable
-    // behavior from yargs
-    yargs = yargs
-      .help(false)
-      .version(false)
-      .exitProcess(false)
-      .showHelpOnFail(false)
-      .parserConfiguration({ 'boolean-negation': false, 'camel-case-expansion': false })
-      .fail((a,b,c) => { throw new Error('Arg parsing failed.') })
-      .command(scenario.cmd);
-
-    // Go through and add the info in the yaml to the parser
-    const options = getOptions(scenario);
-
-    if (options.booleans && options.booleans.length >= 1) {
-      yargs = options.booleans.reduce(
-        (yargs, arg) => addToYargs(arg, yargs.boolean), yargs
-      );
+// Compiles the scenario's yargs setup into frozen yargs-parser options and
+// returns a stateless parse with the result yargs gives for
+// `.command(scenario.cmd).parse(args)`. Every scenario command is a default
+// ($0) command, for which yargs parses the flags, moves the leading non-option
+// args into the command's positionals, parses those again with the same
+// options (plus the positionals' own), and finally appends the args after
+// `--` to `_`.
+const compileYargs = (yargs, scenario) => {
+  const yargsOptions = JSON.parse(JSON.stringify(yargs.getOptions()));
+  const configuration = { ...yargs.getParserConfiguration(), 'populate--': true };
+  const commands = yargs.getCommandInstance();
+  const command = commands.getCommandHandlers()['$0'];
+  const positionals = commands.cmdToParseOptions(scenario.cmd);
+  const variadic = Object.keys(positionals.default);
+  const $0 = yargs.$0;
+
+  const flagOptions = deepFreeze({ ...yargsOptions, configuration });
+  const positionalOptions = deepFreeze({
+    ...yargsOptions,
+    configuration,
+    alias: { ...positionals.alias, ...yargsOptions.alias },
+    array: yargsOptions.array.concat(positionals.array),
+    config: undefined
+  });
+
+  return (args) => {
+    const parsed = Parser.detailed(args, flagOptions);
+    if (parsed.error) {
+      throw new Error('Arg parsing failed.');
     }
-    if (options.strings && options.strings.length >= 1) {
-      yargs = options.strings.reduce(
-        (yargs, arg) => addToYargs(arg, yargs.string), yargs
-      );
+    const argv = parsed.argv;
+    argv.$0 = $0;
+
+    if (argv._.length < command.demanded.length) {
+      throw new Error('Arg parsing failed.');
     }
-    if (options.paths && options.paths.length >= 1) {
-      yargs = options.paths.reduce(
-        (yargs, arg) => addToYargs(arg, yargs.string), yargs
-      );
+    const positionalMap = {};
+    command.demanded.concat(command.optional).forEach((positional) => {
+      const name = positional.cmd[0];
+      if (positional.variadic) {
+        positionalMap[name] = argv._.splice(0).map(String);
+      } else if (argv._.length) {
+        positionalMap[name] = [ String(argv._.shift()) ];
+      }
+    });
+    argv._ = [].concat(argv._);
+
+    const unparsed = Object.keys(positionalMap).map(
+      name => positionalMap[name].map(value => [ `--${name}`, value ]).flat()
+    ).flat();
+    if (unparsed.length) {
+      // The parser writes aliases into its defaults, which are fresh per call
+      const defaults = { ...Object.fromEntries(variadic.map(name => [ name, [] ])), ...yargsOptions.default };
+      const positional = Parser.detailed(unparsed, { ...positionalOptions, default: defaults });
+      if (positional.error) {
+        throw new Error('Arg parsing failed.');
+      }
+      const positionalKeys = Object.keys(positionalMap);
+      Object.keys(positionalMap).forEach(name => positionalKeys.push(...(positional.aliases[name] || [])));
+      Object.keys(positional.argv).forEach((key) => {
+        if (positionalKeys.indexOf(key) !== -1) {
+          argv[key] = positional.argv[key];
+        }
+      });
     }
-    if (options.arrays && options.arrays.length >= 1) {
-      yargs = options.arrays.reduce(
-        (yargs, arg) => addToYargs(arg, yargs.array), yargs
-      );
+
+    if (argv['--']) {
+      argv._.push(...argv['--']);
+      delete argv['--'];
     }
-    if (options.counts && options.counts.length >= 1) {
-      yargs = options.counts.reduce(
-        (yargs, arg) => addToYargs(arg, yargs.count), yargs
-      );
+    return argv;
+  };
+};
+
+// Everything that only depends on the scenario (option tables, valued
+// flags, alias groups, the parser options) is worked out once here; each
+// invocation only runs yargs-parser.
+const buildScenarioParser = (scenario) => {
+  const options = getOptions(scenario);
+  const yargs = buildYargs(scenario, options);
+  const parseArgs = compileYargs(yargs, scenario);
+
+  const selections = getValuedOptions(yargs);
+  const valuedOpts = selections.map(opt => [
+    `-${opt}`, `--${opt}`
+  ]).flat();
+
+  const stripSelections = selections.map(
+    selection => new RegExp(`^--?${selection}\=?`)
+  );
+
+  const spec = Object.freeze({
+    options: snapshotOptions(yargs),
+    aliases: mergeAliases(yargs.getOptions().alias),
+    paths: getArgsFromList(options.paths),
+    counts: getArgsFromList(options.counts)
+  });
+
+  const cmdParts = scenario.cmd.split(/ /g);
+  const matchMustHave = compileFlagMatcher(scenario.mustHave || []);
+
+  // Look at scenario.cmd and do some checking
+  const checkScenarioValidity = (args) => {
+    // Check early rejection
+    if (scenario.rejectIf) {
+      if (scenario.rejectIf.some(a => args.indexOf(a) !== -1)) {
+        return false;
+      }
     }
 
-    const valuedOpts = getValuedOptions(yargs).map(opt => [
-      `-${opt}`, `--${opt}`
-    ]).flat();
-    
+    let valid = true;
+
+    if (cmdParts.length > 1 && !cmdParts[1].trim().startsWith('<') && !cmdParts[1].trim().startsWith('[')) {
+      valid = valid && (args.indexOf(cmdParts[1].trim()) !== -1);
+    }
+
+    if (scenario.mustHave && scenario.mustHave.length > 0) {
+      valid = valid && matchMustHave(args);
+    }
+
+    return valid;
+  };
+
+  return (args) => {
+    // Save these
+    const originalArgs = args;
+
     // Sometimes we have a default arg if we are passed none (like cd ...)
     if (scenario.replaceEmptyArgsWith && args.length === 0) {
       args = scenario.replaceEmptyArgsWith;
@@ -172,8 +328,6 @@ const buildScenarioParser = (scenario) => {
     // WHY WHY WHY
     if (scenario.fixupNonSpacedArgs) {
       args = args.map(arg => {
-        let selections = getValuedOptions(yargs);
-
         for (let i = 0; i < selections.length; i++) {
           const matches = 
             arg !== selections[i] && (
@@ -181,7 +335,7 @@ const buildScenarioParser = (scenario) => {
             );
 
           if (matches) {
-            let leftovers = arg.replace(new RegExp(`^--?${selections[i]}\=?`), '');
+            let leftovers = arg.replace(stripSelections[i], '');
 
             if (leftovers.length === 0) {
               return [ arg ];
@@ -290,8 +444,7 @@ const buildScenarioParser = (scenario) => {
       }
     }
 
-    // console.log(JSON.stringify(yargs.getOptions(), null, 2));
-    const results = yargs.parse(args);
+    const results = parseArgs(args);
 
     // This validity predicate can't be checked until after we've tried the parse
     if (scenario.rejectIfIs) {
@@ -349,9 +502,10 @@ const buildScenarioParser = (scenario) => {
       args,
       captures,
       originalArgs,
-      paths: getArgsFromList(options.paths),
-      counts: getArgsFromList(options.counts),
-      options: yargs.getOptions(),
+      paths: spec.paths,
+      counts: spec.counts,
+      options: spec.options,
+      aliases: spec.aliases,
       name: scenario.name,
       cmd: scenario.cmd
     };
@@ -360,20 +514,22 @@ const buildScenarioParser = (scenario) => {
   };
 };
 
-const buildParser = (prefix, scenarios) => (args) => {
+const buildParser = (prefix, scenarios) => {
   const parsers = scenarios.map(buildScenarioParser);
 
-  for (let i = 0; i < parsers.length; i++) {
-    try {
-      const result = parsers[i](args);
-      result['$']['prefix'] = prefix;
-      return { scenario: scenarios[i], result };
-    } catch (_) {
-      continue;
+  return (args) => {
+    for (let i = 0; i < parsers.length; i++) {
+      try {
+        const result = parsers[i](args);
+        result['$']['prefix'] = prefix;
+        return { scenario: scenarios[i], result };
+      } catch (_) {
+        continue;
+      }
     }
-  }
 
-  return { scenario: null, result: { type: 'UNKNOWN', children: [] } };
+    return { scenario: null, result: { type: 'UNKNOWN', children: [] } };
+  };
 };
 
 const nodify = (prefix, type, key, value, opts, paths, oargs) => {
@@ -429,21 +585,7 @@ const buildPostProcessor = (parser) => (args, oargs) => {
 
   const details = output.result['$'];
 
-  let aliases = details.options.alias;
-
-  Object.keys(aliases).forEach(k1 => {
-    Object.keys(aliases).forEach(k2 => {
-      if (k1 === k2) {
-        return;
-      }
-      if (aliases[k1].length === aliases[k2].length && aliases[k1].every((x, i) => x === aliases[k2][i])) {
-        aliases[k1].push(k2);
-        aliases[k2].push(k1);
-      }
-    });
-  });
-
-  Object.keys(aliases).forEach(k => aliases[k] = aliases[k].sort((a, b) => b.length - a.length));
+  const aliases = details.aliases;
 
   const subtree = { type: details.name, children: [] };
  
@@ -495,17 +637,48 @@ const buildPostProcessor = (parser) => (args, oargs) => {
   return subtree;
 };
 
+const yamlFiles = () => fs.readdirSync(`${YAML_DIR}`)
+  .filter(x => x.endsWith('.yml'))
+  .sort();
+
+// Identifies the YAML specs a bundle was written from
+const yamlDigest = (files) => {
+  const hash = crypto.createHash('sha256');
+  files.forEach((fname) => {
+    hash.update(fname);
+    hash.update(fs.readFileSync(`${YAML_DIR}/${fname}`));
+  });
+  return hash.digest('hex');
+};
+
+const loadYamlCommands = (files) => files.map((fname) => yaml.load(
+  fs.readFileSync(`${YAML_DIR}/${fname}`, "utf8")
+).command);
+
+const loadCommands = () => {
+  const files = yamlFiles();
+
+  if (COMMANDS_BUNDLE && fs.existsSync(COMMANDS_BUNDLE)) {
+    const bundle = JSON.parse(fs.readFileSync(COMMANDS_BUNDLE, 'utf8'));
+    if (bundle.digest === yamlDigest(files)) {
+      return bundle.commands;
+    }
+    console.error(`${COMMANDS_BUNDLE} is stale, loading ${YAML_DIR}/*.yml`);
+  }
+
+  return loadYamlCommands(files);
+};
+
+// Every command's scenarios are compiled once, here; the returned
+// enrichers only run the prebuilt parsers
 export const createEnrichers = () => {
-  return fs.readdirSync(`${YAML_DIR}`)
-    .filter(x => x.endsWith('.yml'))
-    .map((fname) => {
-      const command = yaml.load(
-        fs.readFileSync(`${YAML_DIR}/${fname}`, "utf8")
-      ).command;
+  return loadCommands()
+    .map((command) => {
+      const enricher = buildPostProcessor(
+        buildParser(command.prefix, command.scenarios)
+      );
       return command.providerFor.map((name) => ({
-        [name]: buildPostProcessor(
-          buildParser(command.prefix, command.scenarios)
-        )
+        [name]: enricher
       }));
     })
     .reduce(
@@ -513,4 +686,17 @@ export const createEnrichers = () => {
         (obj, cur) => ({ ...obj, ...cur }), obj
       ), {}
     );
-};
\ No newline at end of file
+};
+
+// node /build/enrich/commands/index.js [out]: precompile the YAML specs into
+// the JSON bundle loadCommands uses when ENRICH_COMMANDS_BUNDLE names it
+if (require.main === module) {
+  const out = process.argv[2] || COMMANDS_BUNDLE;
+  if (!out) {
+    console.error('usage: index.js <out> (or set ENRICH_COMMANDS_BUNDLE)');
+    process.exit(2);
+  }
+  const files = yamlFiles();
+  fs.writeFileSync(out, JSON.stringify({ digest: yamlDigest(files), commands: loadYamlCommands(files) }));
+  console.log(`Wrote ${out}`);
+}
@@ -0,0 +1,50 @@
+import gc
+import os
+import shutil
+import tempfile
+
+# Pre-fork serving with shared warm-up:
+#
+#   gunicorn -c gunicorn.conf.py main:app
+#
+# The master imports the app once (preload_app) and runs the in-process half
+# of the warm-up before forking, so workers share those pages copy-on-write;
+# gc.freeze() keeps the collector from touching (and so copying) them. Each
+# worker then starts its own parser/enricher processes before it accepts
+# requests, so /ready is only served by warm workers. See warmup.py.
+#
+# Any worker may answer a request, so job state (GET /jobs/<id>) and stage
+# metrics (/metrics) go through a runtime directory created by the master and
+# removed when it exits, unless DOCKER_ANALYZER_JOB_DB /
+# DOCKER_ANALYZER_METRICS_DIR already point elsewhere. This file is read
+# before the app is imported, so the settings reach jobs.py and telemetry.py.
+
+bind = os.environ.get('BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('WEB_CONCURRENCY', '0')) or os.cpu_count() or 1
+threads = int(os.environ.get('WEB_THREADS', '4'))
+preload_app = True
+
+RUNTIME_DIR = tempfile.mkdtemp(prefix='docker-analyzer-')
+os.environ.setdefault('DOCKER_ANALYZER_JOB_DB', os.path.join(RUNTIME_DIR, 'jobs.sqlite'))
+if 'DOCKER_ANALYZER_METRICS_DIR' not in os.environ:
+    os.makedirs(os.path.join(RUNTIME_DIR, 'metrics'))
+    os.environ['DOCKER_ANALYZER_METRICS_DIR'] = os.path.join(RUNTIME_DIR, 'metrics')
+
+
+def when_ready(server):
+    import warmup
+
+    warmup.warm_shared()
+    gc.freeze()
+    server.log.info('shared warm-up done: %s', warmup.readiness()['phases'])
+
+
+def post_fork(server, worker):
+    import warmup
+
+    report = warmup.warm()
+    server.log.info('worker %s warm: %s', worker.pid, report)
+
+
+def on_exit(server):
+    shutil.rmtree(RUNTIME_DIR, ignore_errors=True)
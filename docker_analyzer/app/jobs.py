@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Background jobs for the HTTP API.
+#
+# A JobQueue runs submitted callables on a bounded thread pool and keeps
+# their status and results until JOB_TTL seconds after they finish. At most
+# `max_pending` jobs may be queued or running at once in a process; submit
+# raises QueueFull beyond that, so callers can push back on clients (HTTP 503
+# + Retry-After) instead of queueing without limit.
+#
+# Job state lives in memory, or, when DOCKER_ANALYZER_JOB_DB points at a
+# file, in a SQLite table shared by every process. A pre-fork server needs
+# the shared table: a job runs in the worker that accepted it, but any worker
+# may answer GET /jobs/<id> (gunicorn.conf.py sets one up). Results must then
+# be JSON-serializable.
+
+ANALYZE_WORKERS = int(os.environ.get('ANALYZE_WORKERS', '0')) or None
+ANALYZE_QUEUE_SIZE = int(os.environ.get('ANALYZE_QUEUE_SIZE', '0')) or None
+JOB_TTL = float(os.environ.get('JOB_TTL', '3600'))  # seconds
+JOB_DB = os.environ.get('DOCKER_ANALYZER_JOB_DB')
+
+STATUSES = ('queued', 'running', 'done', 'failed')
+
+
+class QueueFull(Exception):
+    pass
+
+
+class _MemoryJobs:
+    def __init__(self):
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def add(self, job):
+        with self.lock:
+            self.jobs[job['id']] = dict(job)
+
+    def update(self, job_id, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields)
+
+    def remove(self, job_id):
+        with self.lock:
+            self.jobs.pop(job_id, None)
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def counts(self):
+        counts = dict.fromkeys(STATUSES, 0)
+        with self.lock:
+            for job in self.jobs.values():
+                counts[job['status']] += 1
+        return counts
+
+    def expire(self, cutoff):
+        with self.lock:
+            expired = [
+                job_id for job_id, job in self.jobs.items()
+                if job['finished'] is not None and job['finished'] < cutoff
+            ]
+            for job_id in expired:
+                del self.jobs[job_id]
+
+
+class _SqliteJobs:
+    FIELDS = ('id', 'status', 'created', 'started', 'finished', 'result', 'error')
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self._conn()
+
+    def _conn(self):
+        # One connection per thread and process, as in cache.py
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, status TEXT NOT NULL, created REAL NOT NULL, '
+                'started REAL, finished REAL, result TEXT, error TEXT)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)')
+            conn.commit()
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def add(self, job):
+        conn = self._conn()
+        conn.execute('INSERT INTO jobs (id, status, created) VALUES (?, ?, ?)',
+                     (job['id'], job['status'], job['created']))
+        conn.commit()
+
+    def update(self, job_id, **fields):
+        if 'result' in fields:
+            fields['result'] = json.dumps(fields['result'])
+        conn = self._conn()
+        conn.execute('UPDATE jobs SET ' + ', '.join(f'{name} = ?' for name in fields) + ' WHERE id = ?',
+                     list(fields.values()) + [job_id])
+        conn.commit()
+
+    def remove(self, job_id):
+        conn = self._conn()
+        conn.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+        conn.commit()
+
+    def get(self, job_id):
+        row = self._conn().execute(
+            'SELECT ' + ', '.join(self.FIELDS) + ' FROM jobs WHERE id = ?', (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self.FIELDS, row))
+        job['result'] = None if job['result'] is None else json.loads(job['result'])
+        return job
+
+    def counts(self):
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(self._conn().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status'))
+        return counts
+
+    def expire(self, cutoff):
+        conn = self._conn()
+        conn.execute('DELETE FROM jobs WHERE finished < ?', (cutoff,))
+        conn.commit()
+
+
+class JobQueue:
+    def __init__(self, workers=None, max_pending=None, ttl=JOB_TTL, path=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.ttl = ttl
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+        self.store = _SqliteJobs(path) if path else _MemoryJobs()
+        self.active = 0  # queued or running in this process
+        self.lock = threading.Lock()
+
+    # Runs fn(*args) in the background and returns the job id
+    def submit(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            raise QueueFull(f'{self.max_pending} jobs already queued or running')
+
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'created': time.time(),
+            'started': None,
+            'finished': None,
+            'result': None,
+            'error': None
+        }
+        try:
+            self.store.expire(time.time() - self.ttl)
+            self.store.add(job)
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.active += 1
+        try:
+            self.executor.submit(self._run, job['id'], fn, args)
+        except RuntimeError:
+            self.store.remove(job['id'])
+            self._release()
+            raise
+        return job['id']
+
+    def _run(self, job_id, fn, args):
+        try:
+            self.store.update(job_id, status='running', started=time.time())
+            try:
+                result = fn(*args)
+            except Exception as e:
+                self.store.update(job_id, status='failed', error=str(e), finished=time.time())
+            else:
+                try:
+                    self.store.update(job_id, status='done', result=result, finished=time.time())
+                except (TypeError, ValueError) as e:  # result not JSON-serializable
+                    self.store.update(job_id, status='failed', error=str(e), finished=time.time())
+        finally:
+            self._release()
+
+    def _release(self):
+        with self.lock:
+            self.active -= 1
+        self.slots.release()
+
+    # Snapshot of the job, or None if it is unknown or has expired
+    def get(self, job_id):
+        self.store.expire(time.time() - self.ttl)
+        return self.store.get(job_id)
+
+    def full(self):
+        return self.pending() >= self.max_pending
+
+    # Jobs queued or running in this process
+    def pending(self):
+        with self.lock:
+            return self.active
+
+    # Job counts over the whole store (every process, if shared); workers and
+    # max_pending are per process
+    def stats(self):
+        counts = self.store.counts()
+        counts['workers'] = self.workers
+        counts['max_pending'] = self.max_pending
+        return counts
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
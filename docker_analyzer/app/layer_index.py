@@ -0,0 +1,380 @@
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import threading
+
+from manifests import is_valid_dependency
+
+# Cross-Dockerfile index over analysis summaries.
+#
+# Every summary (dockerfile_summary.txt line, /analyze/batch result) is broken
+# into terms, one per layer value:
+#
+#   ('os', 'alpine')  ('language', 'python3.9')  ('dependency', 'openssl')
+#   ('package', 'apt:openssl')     (typed records, DEPENDENCY_MODE=semantic)
+#
+# and stored in SQLite as an inverted index (term -> Dockerfiles) with
+# per-term document counts, plus co-occurrence counts between every os /
+# language term and the other terms of the same Dockerfile. Adding a path
+# again replaces its previous terms, so re-indexing (or resuming a batch run)
+# never double counts.
+#
+# Queries AND the given terms, starting from the rarest one; top-N questions
+# with a single os/language filter are answered from the co-occurrence table
+# without touching the postings:
+#
+#   python layer_index.py build --db index.sqlite dockerfile_summary.txt
+#   python layer_index.py query --db index.sqlite --os alpine --package apt:openssl
+#   python layer_index.py top --db index.sqlite package --language python3.9 --prefix pip:
+#
+# main.py serves the same queries on /query when LAYER_INDEX_DB is set, and
+# indexes /analyze/batch results, committing each one as it finishes so a
+# long streaming response never holds the write lock; batch.py takes --index.
+
+LAYER_INDEX_DB = os.environ.get('LAYER_INDEX_DB')
+
+LAYERS = ('os', 'language', 'dependency', 'package')
+# Terms whose co-occurrence with every other term is counted
+CONTEXT_LAYERS = ('os', 'language')
+MAX_LIMIT = 10000
+TERM_CACHE_SIZE = 1000000
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS dockerfiles ('
+    'id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE)',
+    'CREATE TABLE IF NOT EXISTS terms ('
+    'id INTEGER PRIMARY KEY, layer TEXT NOT NULL, value TEXT NOT NULL, '
+    'df INTEGER NOT NULL DEFAULT 0, UNIQUE (layer, value))',
+    'CREATE INDEX IF NOT EXISTS terms_df ON terms (layer, df)',
+    'CREATE TABLE IF NOT EXISTS postings ('
+    'term INTEGER NOT NULL, dockerfile INTEGER NOT NULL, '
+    'PRIMARY KEY (term, dockerfile)) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS postings_dockerfile ON postings (dockerfile, term)',
+    'CREATE TABLE IF NOT EXISTS cooccur ('
+    'a INTEGER NOT NULL, b INTEGER NOT NULL, n INTEGER NOT NULL, '
+    'PRIMARY KEY (a, b)) WITHOUT ROWID',
+)
+
+
+class QueryError(ValueError):
+    pass
+
+
+# Layer values are stripped and empty ones dropped. A dependency of several
+# words is RUN text scraped in regex mode ('curl openssl   ca-certificates'):
+# it is split into one term per word, without the flags and tool names that
+# main.py also drops. Single values, such as manifest entries
+# ('lodash@^4.17.21'), are kept whole
+def summary_terms(summary):
+    values = [
+        ('os', summary.get('os')),
+        ('language', summary.get('language')),
+        ('dependency', summary.get('dependencies')),
+        ('package', [f"{record['manager']}:{record['package']}" for record in summary.get('packages') or ()]),
+    ]
+    terms = set()
+    for layer, layer_values in values:
+        for value in layer_values or ():
+            value = str(value).strip()
+            words = value.split()
+            if layer == 'dependency' and len(words) > 1:
+                terms.update((layer, word) for word in words if is_valid_dependency(word))
+            elif value:
+                terms.add((layer, value))
+    return terms
+
+
+def _pairs(terms):
+    # terms: {(layer, value, id)}
+    pairs = set()
+    for layer, _, term_id in terms:
+        if layer in CONTEXT_LAYERS:
+            pairs.update((term_id, other_id) for other_layer, _, other_id in terms if other_layer != layer)
+    return pairs
+
+
+def _prefix_range(prefix):
+    return prefix, prefix + '\U0010ffff'
+
+
+class LayerIndex:
+    def __init__(self, path):
+        self.path = path
+        # One connection shared by the threads of a process, serialized by
+        # self.lock (the web app reads and writes from request threads)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA cache_size=-65536')  # 64 MiB
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+        self.conn.commit()
+        self.lock = threading.RLock()
+        self.term_ids = {}
+        self.pid = os.getpid()
+
+    def _term_ids(self, terms):
+        found = []
+        for layer, value in terms:
+            term_id = self.term_ids.get((layer, value))
+            if term_id is None:
+                self.conn.execute('INSERT OR IGNORE INTO terms (layer, value) VALUES (?, ?)', (layer, value))
+                term_id = self.conn.execute(
+                    'SELECT id FROM terms WHERE layer = ? AND value = ?', (layer, value)
+                ).fetchone()[0]
+                if len(self.term_ids) >= TERM_CACHE_SIZE:
+                    self.term_ids.clear()
+                self.term_ids[(layer, value)] = term_id
+            found.append((layer, value, term_id))
+        return set(found)
+
+    def _current(self, doc_id):
+        return set(self.conn.execute(
+            'SELECT t.layer, t.value, t.id FROM postings p JOIN terms t ON t.id = p.term WHERE p.dockerfile = ?',
+            (doc_id,)
+        ))
+
+    def _replace(self, doc_id, old, new):
+        conn = self.conn
+        removed = [term_id for _, _, term_id in old - new]
+        added = [term_id for _, _, term_id in new - old]
+        if removed:
+            conn.executemany('DELETE FROM postings WHERE term = ? AND dockerfile = ?',
+                             [(term_id, doc_id) for term_id in removed])
+            conn.executemany('UPDATE terms SET df = df - 1 WHERE id = ?', [(term_id,) for term_id in removed])
+        if added:
+            conn.executemany('INSERT INTO postings (term, dockerfile) VALUES (?, ?)',
+                             [(term_id, doc_id) for term_id in added])
+            conn.executemany('UPDATE terms SET df = df + 1 WHERE id = ?', [(term_id,) for term_id in added])
+
+        old_pairs = _pairs(old)
+        new_pairs = _pairs(new)
+        dropped = old_pairs - new_pairs
+        if dropped:
+            conn.executemany('UPDATE cooccur SET n = n - 1 WHERE a = ? AND b = ?', dropped)
+            conn.executemany('DELETE FROM cooccur WHERE a = ? AND b = ? AND n <= 0', dropped)
+        if new_pairs - old_pairs:
+            conn.executemany(
+                'INSERT INTO cooccur (a, b, n) VALUES (?, ?, 1) ON CONFLICT (a, b) DO UPDATE SET n = n + 1',
+                new_pairs - old_pairs
+            )
+
+    # Indexes one summary ({'path', 'os', 'language', 'dependencies',
+    # 'packages'?}), replacing what was indexed for the same path. With
+    # commit, the summary is committed on its own (or rolled back on error)
+    def add(self, summary, commit=False):
+        with self.lock:
+            try:
+                self.conn.execute('INSERT OR IGNORE INTO dockerfiles (path) VALUES (?)', (summary['path'],))
+                doc_id = self.conn.execute(
+                    'SELECT id FROM dockerfiles WHERE path = ?', (summary['path'],)
+                ).fetchone()[0]
+                self._replace(doc_id, self._current(doc_id), self._term_ids(summary_terms(summary)))
+            except Exception:
+                if commit:
+                    self.conn.rollback()
+                    self.term_ids.clear()  # may hold ids of rolled back terms
+                raise
+            if commit:
+                self.conn.commit()
+
+    def remove(self, path):
+        with self.lock:
+            row = self.conn.execute('SELECT id FROM dockerfiles WHERE path = ?', (path,)).fetchone()
+            if row is None:
+                return False
+            self._replace(row[0], self._current(row[0]), set())
+            self.conn.execute('DELETE FROM dockerfiles WHERE id = ?', (row[0],))
+            return True
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+    # [(layer, value)] -> [(id, df)] rarest first, or None if a term is unknown
+    def _resolve(self, filters):
+        resolved = []
+        for layer, value in filters:
+            row = self.conn.execute(
+                'SELECT id, df FROM terms WHERE layer = ? AND value = ?', (layer, value.strip())
+            ).fetchone()
+            if row is None or row[1] == 0:
+                return None
+            resolved.append(row)
+        return sorted(set(resolved), key=lambda row: row[1])
+
+    @staticmethod
+    def _matching(resolved, joins=''):
+        # FROM ... WHERE for the Dockerfiles (p0.dockerfile) carrying every
+        # resolved term: scan the rarest posting list, look the others up by
+        # primary key. `joins` (without parameters) go before the WHERE.
+        sql = ' FROM postings p0'
+        params = []
+        for position, (term_id, _) in enumerate(resolved[1:], 1):
+            sql += f' JOIN postings p{position} ON p{position}.term = ? AND p{position}.dockerfile = p0.dockerfile'
+            params.append(term_id)
+        sql += joins + ' WHERE p0.term = ?'
+        params.append(resolved[0][0])
+        return sql, params
+
+    def find(self, filters, limit=100, offset=0):
+        # SQLite reads a negative LIMIT as no limit
+        limit = max(1, min(limit, MAX_LIMIT))
+        offset = max(0, offset)
+        with self.lock:
+            if not filters:
+                count = self.conn.execute('SELECT COUNT(*) FROM dockerfiles').fetchone()[0]
+                rows = self.conn.execute(
+                    'SELECT path FROM dockerfiles ORDER BY id LIMIT ? OFFSET ?', (limit, offset)
+                )
+                return {'count': count, 'dockerfiles': [row[0] for row in rows]}
+            resolved = self._resolve(filters)
+            if resolved is None:
+                return {'count': 0, 'dockerfiles': []}
+            if len(resolved) == 1:
+                count = resolved[0][1]
+            else:
+                sql, params = self._matching(resolved)
+                count = self.conn.execute('SELECT COUNT(*)' + sql, params).fetchone()[0]
+            sql, params = self._matching(resolved, ' JOIN dockerfiles d ON d.id = p0.dockerfile')
+            rows = self.conn.execute(
+                'SELECT d.path' + sql + ' ORDER BY p0.dockerfile LIMIT ? OFFSET ?', params + [limit, offset]
+            )
+            return {'count': count, 'dockerfiles': [row[0] for row in rows]}
+
+    # Most frequent values of `layer`, overall or among the Dockerfiles that
+    # match `filters`; `prefix` narrows the values (package 'pip:', ...)
+    def top(self, layer, filters=(), prefix=None, limit=100):
+        if layer not in LAYERS:
+            raise QueryError(f'unknown layer {layer}')
+        limit = max(1, min(limit, MAX_LIMIT))
+        value_sql = ''
+        value_params = []
+        if prefix:
+            value_sql = ' AND t.value >= ? AND t.value < ?'
+            value_params = list(_prefix_range(prefix))
+
+        with self.lock:
+            if not filters:
+                rows = self.conn.execute(
+                    'SELECT t.value, t.df FROM terms t WHERE t.layer = ? AND t.df > 0' + value_sql
+                    + ' ORDER BY t.df DESC, t.value LIMIT ?',
+                    [layer] + value_params + [limit]
+                )
+                return [{'value': value, 'count': count} for value, count in rows]
+
+            resolved = self._resolve(filters)
+            if resolved is None:
+                return []
+            if len(filters) == 1 and filters[0][0] in CONTEXT_LAYERS and filters[0][0] != layer:
+                rows = self.conn.execute(
+                    'SELECT t.value, c.n FROM cooccur c JOIN terms t ON t.id = c.b'
+                    ' WHERE c.a = ? AND t.layer = ?' + value_sql + ' ORDER BY c.n DESC, t.value LIMIT ?',
+                    [resolved[0][0], layer] + value_params + [limit]
+                )
+            else:
+                # Count per term id first, then keep the requested layer
+                sql, params = self._matching(resolved, ' JOIN postings q ON q.dockerfile = p0.dockerfile')
+                excluded = ', '.join('?' * len(resolved))
+                rows = self.conn.execute(
+                    'SELECT t.value, g.n FROM (SELECT q.term, COUNT(*) AS n' + sql
+                    + f' AND q.term NOT IN ({excluded}) GROUP BY q.term) g JOIN terms t ON t.id = g.term'
+                    + ' WHERE t.layer = ?' + value_sql + ' ORDER BY g.n DESC, t.value LIMIT ?',
+                    params + [term_id for term_id, _ in resolved] + [layer] + value_params + [limit]
+                )
+            return [{'value': value, 'count': count} for value, count in rows]
+
+    def stats(self):
+        with self.lock:
+            dockerfiles = self.conn.execute('SELECT COUNT(*) FROM dockerfiles').fetchone()[0]
+            terms = dict(self.conn.execute('SELECT layer, COUNT(*) FROM terms WHERE df > 0 GROUP BY layer'))
+            pairs = self.conn.execute('SELECT COUNT(*) FROM cooccur').fetchone()[0]
+        return {'dockerfiles': dockerfiles, 'terms': terms, 'cooccurrences': pairs}
+
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+# Process-wide index at LAYER_INDEX_DB, or None when it is not configured
+def get_index():
+    global _INDEX
+    if not LAYER_INDEX_DB:
+        return None
+    with _INDEX_LOCK:
+        if _INDEX is None or _INDEX.pid != os.getpid():
+            _INDEX = LayerIndex(LAYER_INDEX_DB)
+        return _INDEX
+
+
+def _read_summaries(paths):
+    for path in paths:
+        fh = sys.stdin if path == '-' else open(path)
+        try:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        finally:
+            if fh is not sys.stdin:
+                fh.close()
+
+
+def _filters(args):
+    return [(layer, value) for layer in LAYERS for value in getattr(args, layer) or ()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build and query the cross-Dockerfile layer index')
+    parser.add_argument('--db', default=LAYER_INDEX_DB or 'layer_index.sqlite')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='index summary JSON lines (dockerfile_summary.txt)')
+    build.add_argument('summaries', nargs='+', help="summary files ('-' for stdin)")
+    build.add_argument('--commit-every', type=int, default=10000)
+
+    query = commands.add_parser('query', help='Dockerfiles carrying every given term')
+    top = commands.add_parser('top', help='most frequent values of a layer')
+    top.add_argument('layer', choices=LAYERS)
+    top.add_argument('--prefix', help="only values starting with this (e.g. 'pip:')")
+    for command in (query, top):
+        for layer in LAYERS:
+            command.add_argument(f'--{layer}', action='append', metavar='VALUE')
+        command.add_argument('--limit', type=int, default=100)
+    query.add_argument('--offset', type=int, default=0)
+    commands.add_parser('stats', help='index size')
+    args = parser.parse_args(argv)
+
+    index = LayerIndex(args.db)
+    try:
+        if args.command == 'build':
+            count = 0
+            for summary in _read_summaries(args.summaries):
+                index.add(summary)
+                count += 1
+                if count % args.commit_every == 0:
+                    index.commit()
+            print(f'Indexed {count} summaries', file=sys.stderr)
+            result = index.stats()
+        elif args.command == 'query':
+            result = index.find(_filters(args), args.limit, args.offset)
+        elif args.command == 'top':
+            result = index.top(args.layer, _filters(args), args.prefix, args.limit)
+        else:
+            result = index.stats()
+    finally:
+        index.close()
+    json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
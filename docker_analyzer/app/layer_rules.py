@@ -0,0 +1,162 @@
+import re
+from functools import lru_cache
+
+# Declarative rule tables for extract_layers.
+#
+# Every table is ordered: the first rule whose keywords are present wins,
+# which mirrors the if/elif chains these tables replace. To recognise a new
+# distro, language or package manager, add a row here; KEYWORDS and the
+# matcher are derived from the tables at import time.
+
+# Distro from the image tag: substring of the lowercased tag
+OS_TAG_RULES = [
+    (('alpine',), 'alpine'),
+    (('ubuntu',), 'ubuntu'),
+    (('debian',), 'debian'),
+    (('slim',), 'debian-slim'),
+    (('centos',), 'centos'),
+    (('fedora',), 'fedora'),
+]
+
+# Distro from the image name: exact match of the lowercased name
+OS_IMAGE_NAMES = {'alpine', 'ubuntu', 'debian', 'centos', 'fedora'}
+
+# Language from the image name; the tag's version prefix is appended
+# (python:3.9-alpine -> python3.9)
+IMAGE_LANGUAGE_RULES = [
+    (('python',), 'python'),
+    (('node',), 'nodejs'),
+    (('openjdk',), 'java'),
+    (('golang',), 'golang'),
+]
+
+# Language from RUN text, only used while no language has been detected
+RUN_LANGUAGE_RULES = [
+    (('openjdk', 'java'), 'java'),
+    (('python3',), 'python3'),
+    (('python',), 'python'),
+    (('node',), 'nodejs'),
+    (('golang',), 'golang'),
+    (('ruby',), 'ruby'),
+    (('gcc', 'g++'), 'c'),
+]
+
+# Language from a captured `apt-get install` package list
+APT_LANGUAGE_RULES = [
+    (('python3-pip',), 'python3'),
+    (('python3', 'python'), 'python'),
+    (('nodejs', 'node'), 'nodejs'),
+    (('openjdk', 'java'), 'java'),
+    (('golang', 'go'), 'golang'),
+    (('ruby',), 'ruby'),
+    (('gcc', 'g++'), 'c/c++'),
+]
+
+# Package installs in RUN text: (trigger keywords, pattern capturing the
+# package list, whether captured lists feed APT_LANGUAGE_RULES). Only the
+# first manager present in a RUN line is extracted.
+PACKAGE_MANAGER_RULES = [
+    (('apt-get install',), re.compile(r'apt-get install\s+-y\s+([\w\s\-\.]+)'), True),
+    (('pip install', 'pip3 install'), re.compile(r'pip(?:3)? install\s+([\w\s\-\.]+)'), False),
+    (('npm install',), re.compile(r'npm install\s+([\w\s\-\.]+)'), False),
+    (('gem install',), re.compile(r'gem install\s+([\w\s\-\.]+)'), False),
+]
+
+
+def _keywords(*tables):
+    keywords = set()
+    for table in tables:
+        for rule in table:
+            keywords.update(rule[0])
+    return keywords
+
+
+KEYWORDS = _keywords(
+    OS_TAG_RULES, IMAGE_LANGUAGE_RULES, RUN_LANGUAGE_RULES,
+    APT_LANGUAGE_RULES, PACKAGE_MANAGER_RULES
+)
+
+
+class KeywordMatcher:
+    """Finds every keyword occurring in a string with one compiled pattern.
+
+    Keywords are tried longest first, and each search resumes one character
+    after the previous match start, so keywords that overlap a match are
+    still found. A hit on a keyword also counts as a hit on every keyword it
+    contains (python3 -> python).
+    """
+
+    def __init__(self, keywords):
+        ordered = sorted(keywords, key=lambda k: (-len(k), k))
+        self.pattern = re.compile('|'.join(re.escape(k) for k in ordered))
+        self.implied = {k: frozenset(o for o in keywords if o in k) for k in keywords}
+
+    def find(self, text):
+        search = self.pattern.search
+        implied = self.implied
+        hits = frozenset()
+        match = search(text)
+        while match is not None:
+            hits = hits.union(implied[match.group()])
+            match = search(text, match.start() + 1)
+        return hits
+
+
+class RuleTable:
+    """Ordered (keywords, value) rules compiled to keyword -> first rule."""
+
+    def __init__(self, rules):
+        self.first = {}
+        for priority, (keywords, value) in enumerate(rules):
+            for keyword in keywords:
+                self.first.setdefault(keyword, (priority, value))
+
+    def match(self, hits):
+        best = None
+        for keyword in hits:
+            rule = self.first.get(keyword)
+            if rule is not None and (best is None or rule[0] < best[0]):
+                best = rule
+        return None if best is None else best[1]
+
+
+MATCHER = KeywordMatcher(KEYWORDS)
+OS_TAGS = RuleTable(OS_TAG_RULES)
+IMAGE_LANGUAGES = RuleTable(IMAGE_LANGUAGE_RULES)
+RUN_LANGUAGES = RuleTable(RUN_LANGUAGE_RULES)
+APT_LANGUAGES = RuleTable(APT_LANGUAGE_RULES)
+
+
+# The classifiers are pure functions of one string, and corpora repeat the
+# same tags, images and RUN lines constantly, so results are memoized.
+
+@lru_cache(maxsize=4096)
+def classify_tag(tag):
+    return OS_TAGS.match(MATCHER.find(tag.lower()))
+
+
+@lru_cache(maxsize=4096)
+def classify_image(name):
+    base_image = name.lower()
+    os_name = base_image if base_image in OS_IMAGE_NAMES else None
+    return os_name, IMAGE_LANGUAGES.match(MATCHER.find(base_image))
+
+
+# Returns (language, dependencies, languages implied by the dependencies)
+@lru_cache(maxsize=131072)
+def classify_run(run_command):
+    run_command = run_command.lower()
+    hits = MATCHER.find(run_command)
+    for keywords, pattern, detect_language in PACKAGE_MANAGER_RULES:
+        if hits.isdisjoint(keywords):
+            continue
+        dependencies = tuple(pattern.findall(run_command))
+        dependency_languages = ()
+        if detect_language:
+            dependency_languages = tuple(
+                language for language in (
+                    APT_LANGUAGES.match(MATCHER.find(dep.strip().lower())) for dep in dependencies
+                ) if language
+            )
+        return RUN_LANGUAGES.match(hits), dependencies, dependency_languages
+    return RUN_LANGUAGES.match(hits), (), ()
@@ -1,93 +1,73 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, url_for
 from werkzeug.utils import secure_filename
 import os
 import json
-from app import process_dockerfile, extract_layers  # 引入函数
+from app import process  # 引入函数
+from cache import cache_stats
+from telemetry import get_logger, timed, collect_timings, render_prometheus
+from jobs import JobQueue, QueueFull, ANALYZE_WORKERS, ANALYZE_QUEUE_SIZE, JOB_DB
+from manifests import find_manifests, iter_dependencies, is_valid_dependency
+from warmup import start_warmup, readiness
+from layer_index import LAYERS, QueryError, get_index
+from upload_buffers import (
+    InMemoryUploadRequest, ARCHIVE_MIMETYPES, read_request_archive,
+    read_uploads, select_project_files, is_batch_wanted, archive_items, jsonl_items
+)
+from werkzeug.exceptions import HTTPException
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import functools
 import shutil
-import re
+import tempfile
 app = Flask(__name__, static_folder='../static')
+# 上传文件在解析 multipart 时按文件名筛选：只缓冲需要的文件，其余直接丢弃
+app.request_class = InMemoryUploadRequest
 UPLOAD_FOLDER = './app/uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# 后台分析任务：有界线程池 + 有界队列，队列满时返回 503
+log = get_logger('main')
+
+JOBS = JobQueue(workers=ANALYZE_WORKERS, max_pending=ANALYZE_QUEUE_SIZE, path=JOB_DB)
+
+# 批量分析：每个请求的并发数；请求体为 JSONL 时接受的类型
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', '0')) or os.cpu_count() or 1
+JSONL_MIMETYPES = {'application/x-ndjson', 'application/jsonl', 'application/x-jsonlines'}
+
+
+class AnalysisError(Exception):
+    """分析失败（上传内容有误等），附带 HTTP 状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def read_manifests(folder_path):
+    """找到文件夹根目录下的清单文件，返回 文件名 -> 路径（解析时流式读取，不整体载入内存）"""
+    manifests = find_manifests(folder_path)
+    log.debug('found manifests', extra={'manifests': sorted(manifests), 'path': folder_path})
+    return manifests
+
+
 def extract_requirements(dependencies_layer, folder_path):
-    """从 requirements.txt、package.json 和 pom.xml 提取依赖"""
-    
-    # 处理 requirements.txt 文件
-    requirements_path = os.path.join(folder_path, 'requirements.txt')  # 确保路径是正确的
-    if os.path.exists(requirements_path):
-        print(f"Found requirements.txt at {requirements_path}")
-        with open(requirements_path, 'r') as req_file:
-            dependencies = req_file.readlines()
-            for dep in dependencies:
-                dep = dep.strip()
-                print(f"Reading line: {dep}")  # 输出每行内容进行调试
-                
-                # 过滤无关内容，确保是符合格式的依赖项（如 Flask==2.1.1）
-                if re.match(r'^[a-zA-Z0-9_-]+==[0-9\.]+$', dep):  # 仅提取符合格式的依赖项
-                    print(f"Adding to dependencies: {dep}")
-                    dependencies_layer.append(dep)
-                else:
-                    print(f"Skipping non-dependency line: {dep}")  # 输出被跳过的内容进行调试
-
-    # 处理 package.json 文件
-    package_json_path = os.path.join(folder_path, 'package.json')
-    if os.path.exists(package_json_path):
-        print(f"Found package.json at {package_json_path}")
-        with open(package_json_path, 'r') as pkg_file:
-            try:
-                package_data = json.load(pkg_file)
-                if 'dependencies' in package_data:
-                    for dep, version in package_data['dependencies'].items():
-                        dep_str = f"{dep}@{version}"
-                        print(f"Adding to dependencies: {dep_str}")
-                        dependencies_layer.append(dep_str)
-            except json.JSONDecodeError:
-                print(f"Error parsing JSON in {package_json_path}")
-
-    # 处理 pom.xml 文件
-    pom_xml_path = os.path.join(folder_path, 'pom.xml')
-    if os.path.exists(pom_xml_path):
-        print(f"Found pom.xml at {pom_xml_path}")
-        with open(pom_xml_path, 'r') as pom_file:
-            pom_data = pom_file.read()
-            # 使用正则从 XML 文件中提取所有依赖项
-            dependencies = re.findall(r'<artifactId>(.*?)</artifactId>', pom_data)
-            for dep in dependencies:
-                print(f"Adding to dependencies: {dep.strip()}")
-                dependencies_layer.append(dep.strip())
-
-    # 最后过滤无效项
-    def is_valid_dependency(dep):
-    # 定义无效关键字和无效模式
-        invalid_keywords = [
-            'requirements.txt', 'package.json', 'pom.xml', '@', '.xml', 
-            'python3', 'python3-pip', '--upgrade', '--no-cache-dir', '-y', 
-            'pip', 'apt', 'yum', 'apk', 'brew'
-        ]
-        invalid_patterns = [
-            r'^--.*',            # 过滤掉以 '--' 开头的标记，如 '--upgrade'
-            r'^-[a-zA-Z]+$',     # 过滤掉以 '-' 开头的单字符选项，如 '-y'
-            r'^\d+$',            # 过滤掉纯数字
-            r'^[^a-zA-Z0-9]+$',  # 过滤掉完全无意义的符号
-        ]
-        
-        # 检查是否包含无效关键字
-        if any(keyword in dep.lower() for keyword in invalid_keywords):
-            return False
-        
-        # 检查是否匹配无效模式
-        if any(re.match(pattern, dep) for pattern in invalid_patterns):
-            return False
-        
-        # 合法依赖
-        return True
-
-# 清理 dependencies_layer
-    dependencies_layer[:] = list(dict.fromkeys(dep for dep in dependencies_layer if is_valid_dependency(dep)))
-# 打印清理后的依赖
-#print(f"Dependencies_layer after cleanup: {dependencies_layer}")
+    """从文件夹中的清单文件（requirements.txt、package.json、pom.xml、锁文件等）提取依赖"""
+    extract_requirements_from(dependencies_layer, read_manifests(folder_path))
+
 
+def extract_requirements_from(dependencies_layer, manifests):
+    """从清单（文件名 -> 文本或路径）提取依赖"""
+    with timed('manifests'):
+        _extract_requirements_from(dependencies_layer, manifests)
+
+
+def _extract_requirements_from(dependencies_layer, manifests):
+    # 先过滤 Dockerfile 中提取出的无效项（命令选项、工具名等），
+    # 清单中的依赖在解析时已按包名校验
+    dependencies_layer[:] = [dep for dep in dependencies_layer if is_valid_dependency(dep)]
+    dependencies_layer.extend(iter_dependencies(manifests))
+    dependencies_layer[:] = list(dict.fromkeys(dependencies_layer))
+    log.debug('dependencies after cleanup', extra={'dependencies': dependencies_layer})
 
 
 def get_files_from_folder(folder_path):
@@ -103,71 +83,350 @@ def get_files_from_folder(folder_path):
 def serve_frontend():
     return send_from_directory(app.static_folder, 'index.html')
 
+def save_upload(files, scratch_dir):
+    """把上传的文件保存到本次请求独占的 scratch_dir，返回上传文件夹的路径"""
+    # 获取上传文件的根目录名（假设上传的是一个单一文件夹）
+    root_folder_name = os.path.commonpath([f.filename for f in files]).split(os.path.sep)[0]
+    folder_path = os.path.join(scratch_dir, root_folder_name)
+
+    base = os.path.realpath(scratch_dir)
+    for file in files:
+        relative_path = file.filename  # 获取相对路径
+        full_path = os.path.realpath(os.path.join(scratch_dir, relative_path))
+        # 拒绝 ../ 之类逃出 scratch 目录的路径
+        if os.path.commonpath([base, full_path]) != base:
+            raise AnalysisError(f"Invalid upload path {relative_path}")
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)  # 创建子目录
+        file.save(full_path)
+
+    # 检查文件夹是否成功保存
+    if not os.path.exists(folder_path):
+        raise AnalysisError(f"Uploaded folder {root_folder_name} not found")
+    return folder_path
+
+
+def with_timings(analyze):
+    """在结果中附带本次分析各阶段耗时（毫秒）"""
+    @functools.wraps(analyze)
+    def wrapper(*args):
+        with collect_timings() as timings:
+            result = analyze(*args)
+        result['timings'] = timings
+        return result
+    return wrapper
+
+
+@with_timings
+def analyze_folder(folder_path):
+    """分析已保存的项目文件夹，返回各层结果；失败时抛出 AnalysisError"""
+    # 查找 Dockerfile
+    all_files = get_files_from_folder(folder_path)
+    dockerfile_path = next((f for f in all_files if os.path.basename(f).lower() == 'dockerfile'), None)
+    if not dockerfile_path:
+        raise AnalysisError("No Dockerfile found in the uploaded folder")
+
+    # 调用 process 分析 Dockerfile 并提取层次信息（按内容哈希缓存）
+    analysis = process(dockerfile_path)
+    if analysis is None:
+        raise AnalysisError("Failed to parse the Dockerfile")
+    return build_result(analysis, read_manifests(folder_path))
+
+
+@with_timings
+def analyze_buffers(files):
+    """分析内存中的上传内容（路径 -> bytes），不经过磁盘"""
+    dockerfile_path, content, manifests = select_project_files(files)
+    if not dockerfile_path:
+        raise AnalysisError("No Dockerfile found in the upload")
+
+    analysis = process(dockerfile_path, content=content)
+    if analysis is None:
+        raise AnalysisError("Failed to parse the Dockerfile")
+    return build_result(analysis, manifests)
+
+
+def build_result(analysis, manifests):
+    """合并 Dockerfile 分析结果与清单依赖，组装返回结果"""
+    os_layer = analysis['os']
+    language_layer = analysis['language']
+    dependencies_layer = analysis['dependencies']
+
+    def deduplicate_layer(layer):
+        return list(dict.fromkeys(layer))
+
+    # 提取并合并其他依赖项
+    extract_requirements_from(dependencies_layer, manifests)
+    os_layer = deduplicate_layer(os_layer)
+    language_layer = deduplicate_layer(language_layer)
+
+    # 组装结果
+    result = {
+        "OS Layer": os_layer,
+        "Language Layer": language_layer,
+        "Dependencies Layer": dependencies_layer,
+    }
+    # DEPENDENCY_MODE=semantic 时附带结构化依赖记录（manager/package/version）
+    if 'packages' in analysis:
+        result["Package Records"] = analysis['packages']
+    # 多阶段构建的阶段图（FROM ... AS x、COPY --from=x）
+    if analysis.get('stages'):
+        result["Stages"] = analysis['stages']
+    return result
+
+
+def read_request_files():
+    """从请求中读取需要的文件（Dockerfile 与清单），其余内容直接丢弃"""
+    # 整个请求体就是一个归档（tar 流式读取，zip 需要缓冲）
+    if request.mimetype in ARCHIVE_MIMETYPES:
+        return read_request_archive(request)
+
+    storages = request.files.getlist('folder_files') + request.files.getlist('archive')
+    if not storages:
+        raise AnalysisError("No files uploaded")
+    return read_uploads(storages)
+
+
+@with_timings
+def analyze_item(item):
+    """分析批量请求中的一项（Dockerfile 文本 + 同目录清单）"""
+    analysis = process(item['path'], content=item['dockerfile'])
+    if analysis is None:
+        raise AnalysisError("Failed to parse the Dockerfile")
+    return build_result(analysis, item['manifests'])
+
+
+def read_batch_items():
+    """读取批量请求：JSONL 请求体、归档请求体或 multipart 中的 archive 字段"""
+    if request.mimetype in JSONL_MIMETYPES:
+        return list(jsonl_items(request.stream))
+    if request.mimetype in ARCHIVE_MIMETYPES:
+        return list(archive_items(read_request_archive(request, is_batch_wanted)))
+
+    storages = request.files.getlist('archive')
+    if not storages:
+        raise AnalysisError("No batch uploaded")
+    return list(archive_items(read_uploads(storages, is_batch_wanted)))
+
+
+def run_batch(items, source=None):
+    """并发分析各项，按完成顺序逐条产出 NDJSON；单项失败只影响该项。
+    写入层索引时以 source/路径 为键（?source=），未给 source 时只索引调用方
+    自己命名（JSONL 的 path 或 id）的项：上传内的相对路径与行号在不同批次间会重复"""
+    def line(item, **fields):
+        return json.dumps({"index": item['index'], "id": item['id'], **fields}) + '\n'
+
+    items = iter(items)
+    index = get_index()
+    executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch')
+    in_flight = {}
+    try:
+        while True:
+            # 限制同时在途的项数，客户端断开时只需等待在途的几项
+            while len(in_flight) < BATCH_WORKERS * 2:
+                item = next(items, None)
+                if item is None:
+                    break
+                if 'error' in item:
+                    yield line(item, error=item['error'])
+                    continue
+                in_flight[executor.submit(analyze_item, item)] = item
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield line(item, error=str(e))
+                    continue
+                key = f"{source}/{item['path']}" if source else item.get('key')
+                if index is not None and key is not None:
+                    index_result(index, key, result)
+                yield line(item, **result)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def index_result(index, path, result):
+    """把一项分析结果写入层索引（LAYER_INDEX_DB），同一路径再次写入时替换旧记录。
+    每项单独提交，流式响应期间不长时间占用写事务（gunicorn 多进程共享同一数据库）"""
+    try:
+        index.add({
+            'path': path,
+            'os': result['OS Layer'],
+            'language': result['Language Layer'],
+            'dependencies': result['Dependencies Layer'],
+            'packages': result.get('Package Records'),
+        }, commit=True)
+    except Exception as e:
+        log.warning('indexing failed', extra={'path': path, 'error': str(e)})
+
+
+def run_analysis_job(folder_path, scratch_dir):
+    """后台任务：分析完成后删除该任务的 scratch 目录"""
+    try:
+        return analyze_folder(folder_path)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
 @app.route('/analyze', methods=['POST'])
 def analyze_dockerfile():
+    # 内存模式：只缓冲 Dockerfile 与清单文件，不写磁盘（?in_memory=0 关闭）
+    if request.in_memory_upload or request.mimetype in ARCHIVE_MIMETYPES:
+        try:
+            return jsonify(analyze_buffers(read_request_files()))
+        except AnalysisError as e:
+            return jsonify({"error": str(e)}), e.status
+        except HTTPException:
+            raise
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    # 检查是否有文件上传
+    if 'folder_files' not in request.files:
+        return jsonify({"error": "No files uploaded"}), 400
+
+    # 每个请求使用独立的临时目录，并发上传互不干扰
+    scratch_dir = tempfile.mkdtemp(prefix='analyze-', dir=app.config['UPLOAD_FOLDER'])
     try:
-        # 检查是否有文件上传
-        if 'folder_files' not in request.files:
-            return jsonify({"error": "No files uploaded"}), 400
+        folder_path = save_upload(request.files.getlist('folder_files'), scratch_dir)
+        return jsonify(analyze_folder(folder_path))
+    except AnalysisError as e:
+        return jsonify({"error": str(e)}), e.status
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        # 清理临时文件夹
+        shutil.rmtree(scratch_dir, ignore_errors=True)
 
-        # 创建临时文件夹存储上传的文件
-        base_temp_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'temp_folder')
-        os.makedirs(base_temp_folder, exist_ok=True)
 
-        # 保存所有上传的文件
-        files = request.files.getlist('folder_files')
-        # 获取上传文件的根目录名（假设上传的是一个单一文件夹）
-        root_folder_name = os.path.commonpath([f.filename for f in files]).split(os.path.sep)[0]
-        folder_path = os.path.join(base_temp_folder, root_folder_name)
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """批量分析多个 Dockerfile，结果以 NDJSON 流式返回（每项完成即输出）"""
+    try:
+        items = read_batch_items()
+    except AnalysisError as e:
+        return jsonify({"error": str(e)}), e.status
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return Response(run_batch(items, request.args.get('source') or None), mimetype='application/x-ndjson')
 
-        for file in files:
-            relative_path = file.filename  # 获取相对路径
-            full_path = os.path.join(base_temp_folder, relative_path)
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)  # 创建子目录
-            file.save(full_path)
-
-        # 检查文件夹是否成功保存
-        if not os.path.exists(folder_path):
-            return jsonify({"error": f"Uploaded folder {root_folder_name} not found"}), 400
-
-        # 查找 Dockerfile
-        all_files = get_files_from_folder(folder_path)
-        dockerfile_path = next((f for f in all_files if os.path.basename(f).lower() == 'dockerfile'), None)
-        if not dockerfile_path:
-            return jsonify({"error": "No Dockerfile found in the uploaded folder"}), 400
-
-        # 调用 process_dockerfile 分析 Dockerfile
-        dockerfile_ast = process_dockerfile(dockerfile_path)
-        if dockerfile_ast is None:
-            return jsonify({"error": "Failed to parse the Dockerfile"}), 400
-
-        # 调用 extract_layers 提取层次信息
-        os_layer, language_layer, dependencies_layer = extract_layers(dockerfile_ast)
-        
-        def deduplicate_layer(layer):  
-            return list(dict.fromkeys(layer))
-            
-        # 提取并合并其他依赖项
-        extract_requirements(dependencies_layer, folder_path)
-        os_layer = deduplicate_layer(os_layer)
-        language_layer = deduplicate_layer(language_layer)
-
-        # 组装结果
-        result = {
-            "OS Layer": os_layer,
-            "Language Layer": language_layer,
-            "Dependencies Layer": dependencies_layer,
-        }
 
-        # 清理临时文件夹
-        shutil.rmtree(base_temp_folder)
-        return jsonify(result)
+@app.route('/jobs', methods=['POST'])
+def submit_analysis_job():
+    """异步分析：立即返回任务 id，结果通过 GET /jobs/<id> 查询"""
+    # 队列已满时直接拒绝，不再读取上传内容
+    if JOBS.full():
+        return jsonify({"error": "Too many pending jobs, retry later"}), 503, {'Retry-After': '5'}
 
+    if request.in_memory_upload or request.mimetype in ARCHIVE_MIMETYPES:
+        try:
+            job_id = JOBS.submit(analyze_buffers, read_request_files())
+        except AnalysisError as e:
+            return jsonify({"error": str(e)}), e.status
+        except QueueFull:
+            return jsonify({"error": "Too many pending jobs, retry later"}), 503, {'Retry-After': '5'}
+        except HTTPException:
+            raise
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        return job_accepted(job_id)
+
+    if 'folder_files' not in request.files:
+        return jsonify({"error": "No files uploaded"}), 400
+
+    scratch_dir = tempfile.mkdtemp(prefix='job-', dir=app.config['UPLOAD_FOLDER'])
+    try:
+        folder_path = save_upload(request.files.getlist('folder_files'), scratch_dir)
+        job_id = JOBS.submit(run_analysis_job, folder_path, scratch_dir)
+    except AnalysisError as e:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        return jsonify({"error": str(e)}), e.status
+    except QueueFull:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        return jsonify({"error": "Too many pending jobs, retry later"}), 503, {'Retry-After': '5'}
+    except HTTPException:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        raise
     except Exception as e:
-        shutil.rmtree(base_temp_folder, ignore_errors=True)
+        shutil.rmtree(scratch_dir, ignore_errors=True)
         return jsonify({"error": str(e)}), 500
+    return job_accepted(job_id)
+
+
+def job_accepted(job_id):
+    """202 响应，Location 指向任务状态地址"""
+    status_url = url_for('get_analysis_job', job_id=job_id)
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": status_url}), 202, {'Location': status_url}
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """任务状态：queued / running / done / failed，完成后附带结果"""
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job {job_id}"}), 404
+    return jsonify(job)
+
+
+@app.route('/jobs', methods=['GET'])
+def get_job_stats():
+    """任务队列概况"""
+    return jsonify(JOBS.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """各阶段耗时直方图（Prometheus 文本格式）"""
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/query', methods=['GET'])
+def query_index():
+    """查询层索引：?os=alpine&package=apt:openssl 返回匹配的 Dockerfile；
+    加 top=<layer>（可选 prefix=pip:）返回该层最常见的取值及计数"""
+    index = get_index()
+    if index is None:
+        return jsonify({"error": "No layer index configured (set LAYER_INDEX_DB)"}), 404
+    filters = [(layer, value) for layer in LAYERS for value in request.args.getlist(layer)]
+    try:
+        limit = int(request.args.get('limit', 100))
+        offset = int(request.args.get('offset', 0))
+        if offset < 0:
+            raise QueryError("offset must not be negative")
+        if 'top' in request.args:
+            values = index.top(request.args['top'], filters, request.args.get('prefix'), limit)
+            return jsonify({"top": request.args['top'], "filters": filters, "values": values})
+        return jsonify({"filters": filters, **index.find(filters, limit, offset)})
+    except (QueryError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/ready', methods=['GET'])
+def get_readiness():
+    """就绪检查：解析器与增强器预热完成前返回 503，附带启动耗时报告"""
+    # 未经预热启动的进程（其他 WSGI 服务器）在第一次探测时开始后台预热
+    start_warmup()
+    report = readiness()
+    return jsonify(report), 200 if report['ready'] else 503
+
 
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """各缓存命名空间的命中/未命中计数"""
+    return jsonify(cache_stats())
 
 
 if __name__ == '__main__':
+    # WARMUP=background（默认）边服务边预热，blocking 预热完成后再开始服务
+    start_warmup()
     app.run(host='0.0.0.0', port=5001, debug=True)
@@ -0,0 +1,432 @@
+import io
+import os
+import re
+import json
+import pathlib
+import posixpath
+import functools
+import xml.etree.ElementTree as ET
+
+from telemetry import get_logger
+
+# Dependency extraction from project manifests.
+#
+# Every parser streams its input (lines, JSON tokens, XML events) so a large
+# lockfile is read in constant memory, and stops at MANIFEST_SIZE_LIMIT bytes
+# and MANIFEST_MAX_DEPENDENCIES entries. A manifest source may be text, bytes,
+# a path (read from disk as it is parsed) or an open file. A manifest that
+# cannot be parsed is logged and contributes no dependencies.
+#
+#   requirements.txt    name[extras] <specifiers> ; markers, -r includes
+#   package.json        "dependencies"
+#   package-lock.json   "packages" (v2/v3), or nested "dependencies" (v1)
+#                       when there is no "packages"
+#   pom.xml             <project><dependencies><dependency> only, so plugin
+#                       and parent artifactIds are not picked up
+#   go.mod              require lines and blocks
+#   Gemfile.lock        resolved specs (four-space entries under "specs:")
+#   poetry.lock         [[package]] name / version
+#
+# Dependencies are reported as name==version for Python packages,
+# name@version for the other ecosystems and artifactId for Maven.
+
+log = get_logger('manifests')
+
+MANIFEST_NAMES = (
+    'requirements.txt', 'package.json', 'package-lock.json', 'pom.xml',
+    'go.mod', 'gemfile.lock', 'poetry.lock',
+)
+MANIFEST_SIZE_LIMIT = int(os.environ.get('MANIFEST_SIZE_LIMIT', str(256 * 1024 * 1024)))
+MANIFEST_MAX_DEPENDENCIES = int(os.environ.get('MANIFEST_MAX_DEPENDENCIES', '10000'))
+MAX_INCLUDE_DEPTH = 8
+READ_SIZE = 64 * 1024
+
+# requirements.txt and the files it may include (requirements-dev.txt,
+# requirements/base.txt, ...)
+_REQUIREMENTS_FILE = re.compile(r'(?:^|/)(?:requirements[^/]*|requirements/[^/]+)\.txt$')
+_COMMENT = re.compile(r'(?:^|\s)#.*$')
+_INCLUDE = re.compile(r'^(?:-r\s*|--requirement(?:\s*=\s*|\s+))(\S+)$')
+_REQUIREMENT = re.compile(r'^([A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?)\s*(?:\[[^\]]*\])?\s*(.*)$')
+_SPECIFIERS = re.compile(r'^(?:(?:===|==|!=|~=|>=|<=|>|<)[A-Za-z0-9.*+!_-]+(?:,|$))*$')
+_GO_REQUIRE = re.compile(r'^(\S+)\s+(v\S+)')
+_GEM_SPEC = re.compile(r'^    ([^\s(]+) \(([^)]+)\)$')
+_TOML_STRING = re.compile(r'^(name|version)\s*=\s*"([^"]*)"')
+_JSON_SCALAR = re.compile(r'-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?|true|false|null')
+_JSON_SPACE = re.compile(r'[\s,:]*')
+
+# Tokens picked up from Dockerfile commands that are not packages
+_INVALID_KEYWORDS = re.compile('|'.join(re.escape(keyword) for keyword in (
+    'requirements.txt', 'package.json', 'pom.xml', '@', '.xml',
+    'python3', 'python3-pip', '--upgrade', '--no-cache-dir', '-y',
+    'pip', 'apt', 'yum', 'apk', 'brew',
+)))
+_INVALID_PATTERN = re.compile(
+    r'--.*'              # options such as '--upgrade'
+    r'|-[a-zA-Z]+$'      # short options such as '-y'
+    r'|\d+$'             # bare numbers
+    r'|[^a-zA-Z0-9]+$'   # only symbols
+)
+# Package names parsed out of a manifest that are still not packages
+_INVALID_NAME = re.compile(r'-.*|\d+|[^a-zA-Z0-9]+|.*\.(?:txt|json|xml|lock|toml)', re.IGNORECASE)
+_TOOL_NAMES = frozenset({'pip', 'pip3', 'python', 'python3', 'python3-pip', 'apt', 'apt-get', 'yum', 'apk', 'brew'})
+
+
+class ManifestTooLarge(Exception):
+    pass
+
+
+def is_valid_dependency(dep):
+    return not (_INVALID_KEYWORDS.search(dep.lower()) or _INVALID_PATTERN.match(dep))
+
+
+def is_valid_name(name):
+    return bool(name) and not _INVALID_NAME.fullmatch(name) and name.lower() not in _TOOL_NAMES
+
+
+def is_requirements_file(path):
+    return bool(_REQUIREMENTS_FILE.search(path.replace('\\', '/').lower()))
+
+
+class _Bounded:
+    # Reads through to `stream`, failing once more than `limit` bytes (or
+    # characters, for text) have been read
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.count += len(data)
+        if self.count > self.limit:
+            raise ManifestTooLarge(f'larger than {self.limit} bytes')
+        return data
+
+    def __iter__(self):
+        for line in self.stream:
+            self.count += len(line)
+            if self.count > self.limit:
+                raise ManifestTooLarge(f'larger than {self.limit} bytes')
+            yield line
+
+
+def _open(source, binary=False):
+    if isinstance(source, os.PathLike):
+        stream = open(source, 'rb') if binary else open(source, encoding='utf-8', errors='replace')
+    elif isinstance(source, str):
+        stream = io.BytesIO(source.encode('utf-8')) if binary else io.StringIO(source)
+    elif isinstance(source, bytes):
+        stream = io.BytesIO(source) if binary else io.StringIO(source.decode('utf-8', errors='replace'))
+    else:
+        stream = source
+    return stream, _Bounded(stream, MANIFEST_SIZE_LIMIT)
+
+
+def _logical_lines(stream):
+    pending = ''
+    for line in stream:
+        line = line.rstrip('\r\n')
+        if line.endswith('\\'):
+            pending += line[:-1]
+            continue
+        line = _COMMENT.sub('', pending + line).strip()
+        pending = ''
+        if line:
+            yield line
+    if pending.strip():
+        yield pending.strip()
+
+
+# Yields (name, 'name<specifiers>'); include(target) -> (source, include for
+# that file) or None
+def parse_requirements(stream, include=None, depth=0):
+    for line in _logical_lines(stream):
+        match = _INCLUDE.match(line)
+        if match:
+            included = include(match.group(1)) if include and depth < MAX_INCLUDE_DEPTH else None
+            if included is None:
+                log.debug('requirements include not available', extra={'include': match.group(1)})
+                continue
+            source, nested = included
+            included_stream, bounded = _open(source)
+            with included_stream:
+                yield from parse_requirements(bounded, nested, depth + 1)
+            continue
+        if line.startswith('-'):  # -e, -c, --index-url, ...
+            continue
+        match = _REQUIREMENT.match(line)
+        if not match:  # URLs, local paths
+            continue
+        spec = re.sub(r'\s+', '', match.group(2).split(';', 1)[0])
+        if spec.startswith('@'):  # name @ url
+            spec = ''
+        if _SPECIFIERS.match(spec):
+            yield match.group(1), match.group(1) + spec
+
+
+def _json_leaves(stream):
+    # Yields (key path, value) for every scalar of a JSON document without
+    # building it; array positions are ints in the path
+    buffer = ''
+    position = 0
+    eof = False
+    stack = []  # [key or index, expecting a key]
+
+    def fill():
+        nonlocal buffer, position, eof
+        data = stream.read(READ_SIZE)
+        if not data:
+            eof = True
+        buffer = buffer[position:] + data
+        position = 0
+
+    def finish_value():
+        if stack:
+            if stack[-1][1] is None:  # array
+                stack[-1][0] += 1
+            else:
+                stack[-1][1] = True
+
+    while True:
+        position = _JSON_SPACE.match(buffer, position).end()
+        if position >= len(buffer):
+            if eof:
+                return
+            fill()
+            continue
+        char = buffer[position]
+        if char in '{[':
+            position += 1
+            stack.append([None, True] if char == '{' else [0, None])
+        elif char in '}]':
+            position += 1
+            stack.pop()
+            finish_value()
+        elif char == '"':
+            try:
+                text, end = json.decoder.scanstring(buffer, position + 1)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            position = end
+            if stack and stack[-1][1]:  # object key
+                stack[-1][0] = text
+                stack[-1][1] = False
+                continue
+            yield tuple(entry[0] for entry in stack), text
+            finish_value()
+        else:
+            # Numbers and literals are short: have the whole token buffered
+            if not eof and len(buffer) - position < 64:
+                fill()
+                continue
+            match = _JSON_SCALAR.match(buffer, position)
+            if not match:
+                raise ValueError(f'invalid JSON at {buffer[position:position + 20]!r}')
+            position = match.end()
+            yield tuple(entry[0] for entry in stack), json.loads(match.group(0))
+            finish_value()
+
+
+def parse_package_json(stream):
+    for path, value in _json_leaves(stream):
+        if len(path) == 2 and path[0] == 'dependencies' and isinstance(value, str):
+            yield path[1], f'{path[1]}@{value}'
+
+
+def parse_package_lock(stream):
+    # v2 lockfiles carry both sections; "dependencies" is read only when
+    # there is no "packages". npm writes "packages" first, so v1 entries are
+    # held back only while it has not been seen
+    has_packages = False
+    pending = []
+    for path, value in _json_leaves(stream):
+        if path[:1] == ('packages',):
+            has_packages = True
+            pending = []
+        if path[-1:] != ('version',) or not isinstance(value, str):
+            continue
+        # v2/v3: "packages": {"node_modules/a/node_modules/b": {"version": ...}}
+        if len(path) == 3 and path[0] == 'packages' and path[1]:
+            name = path[1].rpartition('node_modules/')[2]
+            yield name, f'{name}@{value}'
+        # v1: "dependencies": {"a": {"version": ..., "dependencies": {...}}}
+        elif (not has_packages and len(path) >= 3 and len(path) % 2 == 1
+              and all(key == 'dependencies' for key in path[0:-1:2])):
+            if len(pending) < MANIFEST_MAX_DEPENDENCIES:
+                pending.append((path[-2], f'{path[-2]}@{value}'))
+    yield from pending
+
+
+def parse_pom(stream):
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    tags = []
+    elements = []
+    artifact = None
+    for chunk in iter(lambda: stream.read(READ_SIZE), b''):
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            tag = element.tag.rpartition('}')[2]
+            if event == 'start':
+                tags.append(tag)
+                elements.append(element)
+                continue
+            if tags == ['project', 'dependencies', 'dependency', 'artifactId']:
+                artifact = (element.text or '').strip()
+            elif tags == ['project', 'dependencies', 'dependency']:
+                if artifact:
+                    yield artifact, artifact
+                artifact = None
+            tags.pop()
+            elements.pop()
+            # Drop finished elements so the tree never grows
+            element.clear()
+            if elements:
+                elements[-1].remove(element)
+    parser.close()
+
+
+def parse_go_mod(stream):
+    in_block = False
+    for line in stream:
+        line = line.split('//', 1)[0].strip()
+        if in_block:
+            if line == ')':
+                in_block = False
+                continue
+        elif line.startswith('require'):
+            line = line[len('require'):].strip()
+            if line == '(':
+                in_block = True
+                continue
+        else:
+            continue
+        match = _GO_REQUIRE.match(line)
+        if match:
+            yield match.group(1), f'{match.group(1)}@{match.group(2)}'
+
+
+def parse_gemfile_lock(stream):
+    in_specs = False
+    for line in stream:
+        line = line.rstrip('\r\n')
+        if line.strip() == 'specs:':
+            in_specs = True
+            continue
+        if not line.startswith('  '):  # next section
+            in_specs = False
+        if in_specs:
+            match = _GEM_SPEC.match(line)
+            if match:
+                yield match.group(1), f'{match.group(1)}@{match.group(2)}'
+
+
+def parse_poetry_lock(stream):
+    fields = None
+    for line in stream:
+        line = line.strip()
+        if line.startswith('['):
+            fields = {} if line == '[[package]]' else None
+            continue
+        if fields is None:
+            continue
+        match = _TOML_STRING.match(line)
+        if match:
+            fields[match.group(1)] = match.group(2)
+            if 'name' in fields and 'version' in fields:
+                yield fields['name'], f"{fields['name']}=={fields['version']}"
+                fields = None
+
+
+_PARSERS = {
+    'package.json': (parse_package_json, False),
+    'package-lock.json': (parse_package_lock, False),
+    'pom.xml': (parse_pom, True),
+    'go.mod': (parse_go_mod, False),
+    'gemfile.lock': (parse_gemfile_lock, False),
+    'poetry.lock': (parse_poetry_lock, False),
+}
+
+
+# -r targets of an in-memory requirements file: other entries of the same
+# manifests dict, keyed by path relative to the project root. `seen` holds the
+# files on the current include chain, so cycles are skipped
+def _dict_include(manifests, key, seen=()):
+    seen = seen + (key,)
+
+    def include(target):
+        name = posixpath.normpath(posixpath.join(posixpath.dirname(key), target.replace('\\', '/'))).lower()
+        if name in seen or name not in manifests:
+            return None
+        return manifests[name], _dict_include(manifests, name, seen)
+    return include
+
+
+# -r targets of a requirements file on disk, kept inside the project folder
+def _path_include(root, path, seen=()):
+    seen = seen + (path,)
+
+    def include(target):
+        candidate = os.path.realpath(os.path.join(os.path.dirname(path), target))
+        if candidate in seen or not candidate.startswith(root + os.sep) or not os.path.isfile(candidate):
+            return None
+        return pathlib.Path(candidate), _path_include(root, candidate, seen)
+    return include
+
+
+# Manifests in the root of a project folder: lowercased name -> path (read
+# while parsing, never loaded whole)
+def find_manifests(folder_path):
+    found = {}
+    try:
+        names = sorted(os.listdir(folder_path))
+    except OSError:
+        return found
+    for name in names:
+        path = os.path.join(folder_path, name)
+        if name.lower() in MANIFEST_NAMES and name.lower() not in found and os.path.isfile(path):
+            found[name.lower()] = pathlib.Path(path)
+    return found
+
+
+def iter_dependencies(manifests):
+    for name in MANIFEST_NAMES:
+        source = manifests.get(name)
+        if source is None:
+            continue
+        if name == 'requirements.txt':
+            if isinstance(source, os.PathLike):
+                path = os.path.realpath(source)
+                include = _path_include(os.path.dirname(path), path)
+            else:
+                include = _dict_include(manifests, name)
+            parser, binary = functools.partial(parse_requirements, include=include), False
+        else:
+            parser, binary = _PARSERS[name]
+
+        # A manifest that fails to parse contributes nothing, the others are
+        # still read
+        deps = []
+        skipped = 0
+        try:
+            stream, bounded = _open(source, binary)
+            with stream:
+                for package, dep in parser(bounded):
+                    if not is_valid_name(package):
+                        skipped += 1
+                        continue
+                    deps.append(dep)
+                    if len(deps) >= MANIFEST_MAX_DEPENDENCIES:
+                        log.warning('manifest dependency limit reached',
+                                    extra={'manifest': name, 'limit': MANIFEST_MAX_DEPENDENCIES})
+                        break
+        except (ManifestTooLarge, ValueError, ET.ParseError, OSError) as e:
+            log.warning('invalid manifest', extra={'manifest': name, 'error': str(e)})
+            continue
+        except Exception as e:
+            log.warning('manifest parser failed', extra={'manifest': name, 'error': repr(e)}, exc_info=True)
+            continue
+        log.debug('manifest parsed', extra={'manifest': name, 'dependencies': len(deps), 'skipped': skipped})
+        yield from deps
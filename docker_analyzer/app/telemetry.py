@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Logging and per-stage timing.
+#
+# Logging is off unless DOCKER_ANALYZER_LOG_LEVEL is set (debug, info,
+# warning, error). Records are written to stderr as one JSON object per line;
+# keyword fields passed through `extra=` become keys of that object and are
+# only serialized when the level is enabled, so debug calls that carry whole
+# Dockerfiles or ASTs cost nothing when logging is off.
+#
+# `timed(stage)` records how long a stage took into a process-wide histogram
+# (served as Prometheus text on /metrics) and, inside `collect_timings()`,
+# into the per-request `timings` dict.
+#
+# The histograms belong to one process. Under a pre-fork server set
+# DOCKER_ANALYZER_METRICS_DIR (gunicorn.conf.py does): each process then
+# writes its histograms to its own file there, at most once a second and on
+# exit, and /metrics sums every file, whichever worker answers. Files of
+# exited workers are kept so the counters never go backwards.
+
+LOG_LEVEL = os.environ.get('DOCKER_ANALYZER_LOG_LEVEL', 'off').upper()
+METRICS_DIR = os.environ.get('DOCKER_ANALYZER_METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 1.0  # seconds
+
+STAGES = (
+    'dockerfile_parse',  # dockerfile.parse_string + AST construction
+    'bash_parse',        # bash parser worker round-trip
+    'jq_filters',        # filter-1/filter-2 (in-process port or jq processes)
+    'enrich',            # app.ts enrichment
+    'extract_layers',    # OS / language / dependency classification
+    'manifests',         # requirements.txt / package.json / pom.xml / lockfiles
+)
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def _configure():
+    root = logging.getLogger('docker_analyzer')
+    root.propagate = False
+    if LOG_LEVEL in ('', 'OFF', 'NONE'):
+        root.setLevel(logging.CRITICAL + 10)
+        return root
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter())
+    root.addHandler(handler)
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    return root
+
+
+_ROOT = _configure()
+
+
+def get_logger(name):
+    return _ROOT.getChild(name)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, counts, sum, count):
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.sum += sum
+        self.count += count
+
+
+_HISTOGRAMS = {stage: Histogram() for stage in STAGES}
+_LOCK = threading.Lock()
+_TIMINGS = ContextVar('timings', default=None)
+_PROCESS = {'pid': os.getpid(), 'file': None, 'flushed': 0.0}
+
+
+# A forked worker starts its own histograms (and file) instead of carrying
+# the parent's, which the parent reports itself. Call with _LOCK held.
+def _check_fork():
+    if _PROCESS['pid'] != os.getpid():
+        for stage in _HISTOGRAMS:
+            _HISTOGRAMS[stage] = Histogram()
+        _PROCESS.update(pid=os.getpid(), file=None, flushed=0.0)
+
+
+# Writes this process's histograms to METRICS_DIR. Call with _LOCK held.
+def _flush():
+    if _PROCESS['file'] is None:
+        # pid plus a token: a later process reusing the pid gets its own file
+        _PROCESS['file'] = os.path.join(METRICS_DIR, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+    snapshot = {
+        stage: {'counts': histogram.counts, 'sum': histogram.sum, 'count': histogram.count}
+        for stage, histogram in _HISTOGRAMS.items()
+    }
+    tmp = _PROCESS['file'] + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, _PROCESS['file'])
+    _PROCESS['flushed'] = time.monotonic()
+
+
+def _flush_at_exit():
+    if METRICS_DIR:
+        with _LOCK:
+            _check_fork()
+            if any(histogram.count for histogram in _HISTOGRAMS.values()):
+                try:
+                    _flush()
+                except OSError:
+                    pass
+
+
+atexit.register(_flush_at_exit)
+
+
+def observe(stage, seconds):
+    with _LOCK:
+        _check_fork()
+        histogram = _HISTOGRAMS.get(stage)
+        if histogram is None:
+            histogram = _HISTOGRAMS[stage] = Histogram()
+        histogram.observe(seconds)
+        if METRICS_DIR and time.monotonic() - _PROCESS['flushed'] >= METRICS_FLUSH_INTERVAL:
+            try:
+                _flush()
+            except OSError:
+                pass
+    timings = _TIMINGS.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+# Collects the stage timings of everything run in this context (thread);
+# yields a dict that is filled in with milliseconds per stage on exit
+@contextmanager
+def collect_timings():
+    timings = {}
+    token = _TIMINGS.set(timings)
+    start = time.perf_counter()
+    result = {}
+    try:
+        yield result
+    finally:
+        _TIMINGS.reset(token)
+        result.update({stage: round(seconds * 1000, 3) for stage, seconds in timings.items()})
+        result['total'] = round((time.perf_counter() - start) * 1000, 3)
+
+
+# Sums the histograms of every process that wrote to `directory`
+def _merged(directory):
+    histograms = {stage: Histogram() for stage in STAGES}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue  # removed or being replaced
+        for stage, data in snapshot.items():
+            histograms.setdefault(stage, Histogram()).merge(data['counts'], data['sum'], data['count'])
+    return histograms
+
+
+def render_prometheus():
+    lines = [
+        '# HELP docker_analyzer_stage_seconds Time spent per analysis stage.',
+        '# TYPE docker_analyzer_stage_seconds histogram',
+    ]
+    with _LOCK:
+        _check_fork()
+        histograms = _HISTOGRAMS
+        if METRICS_DIR:
+            _flush()
+            histograms = _merged(METRICS_DIR)
+        for stage, histogram in histograms.items():
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'docker_analyzer_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'docker_analyzer_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+            lines.append(f'docker_analyzer_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+
+import pytest
+
+import ast_store
+import bench_extract_layers
+from app import extract_layers
+from ast_store import AstStoreError, AstStoreReader, AstStoreWriter, relayer
+
+
+@pytest.fixture
+def asts():
+    return [(f'/data/{index}/Dockerfile', ast) for index, ast in enumerate(bench_extract_layers.corpus(50, seed=9))]
+
+
+def write_store(path, asts, **kwargs):
+    writer = AstStoreWriter(str(path), chunk_records=8, **kwargs)
+    for name, ast in asts:
+        writer.add(name, json.dumps(ast))
+    return writer
+
+
+def test_round_trip(tmp_path, asts):
+    write_store(tmp_path / 'a.dast', asts).close()
+    reader = AstStoreReader(str(tmp_path / 'a.dast'), cached_chunks=2)
+    try:
+        assert len(reader) == len(asts)
+        assert list(reader) == asts
+        for index in (0, 7, 8, 49, 23, 0):
+            assert reader.path(index) == asts[index][0]
+            assert reader.get(index) == asts[index][1]
+        assert reader.find('/data/42/Dockerfile') == 42
+        assert reader.find('/missing') is None
+        with pytest.raises(IndexError):
+            reader.get(50)
+    finally:
+        reader.close()
+
+
+def test_interrupted_writer_can_be_read_and_resumed(tmp_path, asts):
+    path = tmp_path / 'a.dast'
+    writer = write_store(path, asts[:20])
+    writer.sync()  # chunks of 8, 8 and 4 records
+    writer.fh.close()  # interrupted before the index was written
+
+    reader = AstStoreReader(str(path))
+    assert len(reader) == 20
+    reader.close()
+
+    # Resuming at an earlier checkpoint drops the chunks written after it
+    third_chunk = ast_store._scan_chunks(str(path))[2][0]
+    writer = AstStoreWriter(str(path), offset=third_chunk, chunk_records=8)
+    for name, ast in asts[16:]:
+        writer.add(name, json.dumps(ast))
+    writer.close()
+    reader = AstStoreReader(str(path))
+    try:
+        assert list(reader) == asts
+    finally:
+        reader.close()
+
+
+def test_relayer_matches_extract_layers(tmp_path, asts):
+    write_store(tmp_path / 'a.dast', asts).close()
+    summaries = list(relayer(str(tmp_path / 'a.dast')))
+    assert [summary['path'] for summary in summaries] == [name for name, _ in asts]
+    for summary, (_, ast) in zip(summaries, asts):
+        assert (summary['os'], summary['language'], summary['dependencies']) == extract_layers(ast)
+
+
+def test_not_a_store(tmp_path, capsys):
+    path = tmp_path / 'x.txt'
+    path.write_text('{"type": "DOCKER-FILE"}\n')
+    with pytest.raises(AstStoreError):
+        AstStoreReader(str(path))
+    assert ast_store.main(['get', str(path), '0']) == 1
+    assert 'is not an AST store' in capsys.readouterr().err
+
+
+def test_missing_pyarrow_is_reported(tmp_path, monkeypatch, capsys):
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    with pytest.raises(AstStoreError, match='requirements-parquet.txt'):
+        ast_store.SummaryTableWriter(str(tmp_path / 'summary.parquet'))
+
+    import batch
+    with pytest.raises(SystemExit):
+        batch.main(['--dir', str(tmp_path), '--summary-format', 'parquet'])
+    assert 'requirements-parquet.txt' in capsys.readouterr().err
+
+
+SUMMARIES = [
+    {'path': 'a/Dockerfile', 'os': ['alpine'], 'language': ['python3.9'], 'dependencies': ['flask']},
+    {'path': 'b/Dockerfile', 'os': [], 'language': ['c'], 'dependencies': [],
+     'packages': [{'manager': 'apt', 'package': 'curl', 'version': None}]},
+    {'path': 'c/Dockerfile', 'os': ['ubuntu'], 'language': ['node16'], 'dependencies': ['express', 'lodash']},
+]
+
+
+def test_summary_table_round_trip(tmp_path):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'summary.parquet')
+    writer = ast_store.SummaryTableWriter(path, row_group=2)
+    for summary in SUMMARIES:
+        writer.add(summary)
+    writer.close()
+    assert sorted(os.listdir(path)) == ['part-00000.parquet', 'part-00001.parquet']
+
+    rows = ast_store.read_summary_table(path).to_pylist()
+    assert [row['path'] for row in rows] == [summary['path'] for summary in SUMMARIES]
+    assert rows[1]['packages'] == SUMMARIES[1]['packages']
+    assert rows[0]['packages'] is None
+    assert rows[2]['dependencies'] == ['express', 'lodash']
+
+
+def test_summary_table_resume_drops_later_parts(tmp_path):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'summary.parquet')
+    writer = ast_store.SummaryTableWriter(path, row_group=1)
+    for summary in SUMMARIES:
+        writer.add(summary)
+    writer.close()
+
+    # Checkpointed after the first part: the later ones are written again
+    writer = ast_store.SummaryTableWriter(path, parts=1, row_group=1)
+    assert sorted(os.listdir(path)) == ['part-00000.parquet']
+    for summary in SUMMARIES[1:]:
+        writer.add(summary)
+    writer.close()
+    assert [row['path'] for row in ast_store.read_summary_table(path).to_pylist()] == [
+        summary['path'] for summary in SUMMARIES
+    ]
@@ -0,0 +1,50 @@
+import os
+import json
+import shutil
+import subprocess
+
+import pytest
+
+import bash_filters
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# parse_within_pipeline's two jq runs, over one document per line
+def jq_pipeline(raws):
+    step = ''.join(json.dumps(raw) + '\n' for raw in raws).encode('utf-8')
+    for name in ('filter-1.jq', 'filter-2.jq'):
+        step = subprocess.check_output(['jq', '-c', '--from-file', os.path.join(HERE, name)], input=step)
+    return [json.loads(line) for line in step.splitlines()]
+
+
+@pytest.mark.skipif(shutil.which('jq') is None, reason='jq is not installed')
+def test_upgrade_matches_jq_filters(raw_scripts):
+    expected = jq_pipeline(raw_scripts)
+    assert len(expected) == len(raw_scripts)
+    for raw, tree in zip(raw_scripts, expected):
+        assert bash_filters.upgrade(raw) == tree
+
+
+def test_upgrade_semantic_command(sample_scripts):
+    source, raw = sample_scripts[1]
+    tree = bash_filters.upgrade(raw)
+    assert tree['type'] == 'BASH-SCRIPT'
+    command = tree['children'][0]
+    assert command['type'] == 'MAYBE-SEMANTIC-COMMAND'
+    assert [child['type'] for child in command['children']] == [
+        'BASH-COMMAND-PREFIX', 'BASH-COMMAND-COMMAND', 'BASH-COMMAND-ARGS'
+    ]
+    assert [arg['value'] for arg in command['children'][2]['children']] == source.split()[1:]
+
+
+def test_upgrade_accepts_text():
+    raw = {'tag': 'T_Literal', 'contents': [1, 'x']}
+    assert bash_filters.upgrade(json.dumps(raw)) == bash_filters.upgrade(raw)
+
+
+def test_upgrade_without_output():
+    # jq prints nothing for `.tag?` on a string, which the old pipeline's
+    # json.loads rejected
+    with pytest.raises(bash_filters.FilterError):
+        bash_filters.upgrade('"text"')
@@ -0,0 +1,53 @@
+import sys
+
+from bash_pool import BashParserPool
+
+# A line-protocol worker: echoes {"bash": <request>, "pid": ...}; exits on
+# "die" and stops answering on "hang"
+ECHO_WORKER = [sys.executable, '-c', '''
+import os, sys, json, time
+for line in sys.stdin:
+    request = json.loads(line)
+    if request == "die":
+        sys.exit(1)
+    if request == "hang":
+        time.sleep(60)
+    sys.stdout.write(json.dumps({"bash": request, "pid": os.getpid()}) + "\\n")
+    sys.stdout.flush()
+''']
+
+
+def test_parse_answers_in_order():
+    with BashParserPool(size=2, command=ECHO_WORKER) as pool:
+        strings = [f'echo {i}' for i in range(50)] + ['multi\nline', '']
+        assert [reply['bash'] for reply in pool.map(strings)] == strings
+
+
+def test_workers_are_reused():
+    with BashParserPool(size=1, command=ECHO_WORKER) as pool:
+        pids = {pool.parse(f'echo {i}')['pid'] for i in range(10)}
+        assert len(pids) == 1
+        assert pool.restarts == 0
+
+
+def test_dead_worker_is_restarted():
+    with BashParserPool(size=1, command=ECHO_WORKER, retries=0) as pool:
+        first = pool.parse('before')['pid']
+        assert pool.parse('die') is None
+        after = pool.parse('after')
+        assert after['bash'] == 'after'
+        assert after['pid'] != first
+        assert pool.failures == 1
+
+
+def test_hung_worker_is_killed():
+    with BashParserPool(size=1, command=ECHO_WORKER, timeout=0.5, retries=0) as pool:
+        assert pool.parse('hang') is None
+        assert pool.parse('next')['bash'] == 'next'
+
+
+def test_start_spawns_every_worker():
+    with BashParserPool(size=3, command=ECHO_WORKER) as pool:
+        pool.start()
+        assert all(worker.alive() for worker in pool.workers)
+        assert pool.parse('x')['bash'] == 'x'
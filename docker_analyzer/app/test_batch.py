@@ -0,0 +1,83 @@
+import os
+import json
+
+import pytest
+
+from batch import run_batch, iter_paths
+
+DOCKERFILES = {
+    'a/Dockerfile': 'FROM python:3.9-alpine\nRUN pip install flask requests\n',
+    'b/Dockerfile': 'FROM ubuntu:20.04\nRUN apt-get install -y curl git\n',
+    'c/Dockerfile.dev': 'FROM node:16\nRUN npm install express\n',
+    'd/app.dockerfile': 'FROM golang:1.20 AS build\nRUN go build\nFROM alpine:3.18\n',
+    'e/Dockerfile': 'FROM openjdk:11-jdk-slim\n',
+    'f/README.md': '# not a Dockerfile\n',
+}
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    root = tmp_path / 'corpus'
+    for name, content in DOCKERFILES.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    return root
+
+
+def run(tmp_path, paths, **kwargs):
+    out = tmp_path / 'out'
+    out.mkdir(exist_ok=True)
+    kwargs.setdefault('checkpoint_path', str(out / 'summary.checkpoint'))
+    stats = run_batch(
+        paths, ast_path=str(out / 'ast.txt'), summary_path=str(out / 'summary.txt'),
+        workers=1, chunk_size=2, progress=False, **kwargs
+    )
+    summaries = [json.loads(line) for line in (out / 'summary.txt').read_text().splitlines()]
+    return stats, summaries, out
+
+
+def test_iter_paths_is_sorted(corpus):
+    paths = [os.path.relpath(path, corpus) for path in iter_paths(directory=str(corpus))]
+    assert paths == ['a/Dockerfile', 'b/Dockerfile', 'c/Dockerfile.dev', 'd/app.dockerfile', 'e/Dockerfile']
+
+
+def test_outputs_in_input_order(tmp_path, corpus):
+    paths = list(iter_paths(directory=str(corpus)))
+    stats, summaries, out = run(tmp_path, iter(paths + [str(corpus / 'missing/Dockerfile')]))
+    assert stats == {'done': 6, 'failed': 1}
+    assert [summary['path'] for summary in summaries] == paths
+    assert summaries[0]['os'] == ['alpine']
+    assert summaries[0]['language'] == ['python3.9']
+    assert len((out / 'ast.txt').read_text().splitlines()) == len(paths)
+
+
+def test_finished_run_removes_checkpoint(tmp_path, corpus):
+    paths = list(iter_paths(directory=str(corpus)))
+    _, first, out = run(tmp_path, iter(paths))
+    assert not (out / 'summary.checkpoint').exists()
+
+    # Resuming into the same outputs starts over instead of skipping everything
+    stats, again, _ = run(tmp_path, iter(paths), resume=True)
+    assert stats['done'] == len(paths)
+    assert again == first
+
+
+def test_resume_after_interruption(tmp_path, corpus):
+    paths = list(iter_paths(directory=str(corpus)))
+    _, expected, _ = run(tmp_path, iter(paths), checkpoint_path=str(tmp_path / 'full.checkpoint'))
+
+    def interrupted():
+        yield from paths[:3]
+        raise KeyboardInterrupt()
+
+    # One chunk in flight: the first chunk is written before the second is read
+    with pytest.raises(KeyboardInterrupt):
+        run(tmp_path, interrupted(), max_in_flight=1)
+    checkpoint = json.loads((tmp_path / 'out' / 'summary.checkpoint').read_text())
+    assert checkpoint['done'] == 2
+
+    stats, summaries, out = run(tmp_path, iter(paths), resume=True)
+    assert stats['done'] == len(paths)
+    assert summaries == expected
+    assert not (out / 'summary.checkpoint').exists()
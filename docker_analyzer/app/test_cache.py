@@ -0,0 +1,60 @@
+import copy
+
+from cache import ResultCache, content_key
+
+DOCKERFILE = '''\
+FROM python:3.9-alpine AS build
+RUN apt-get install -y gcc musl-dev && pip install flask
+FROM alpine:3.18
+COPY --from=build /usr/local /usr/local
+'''
+
+
+def test_content_key():
+    assert content_key('abc') == content_key(b'abc')
+    assert content_key('abc') != content_key('abd')
+
+
+def test_memory_tier_is_lru():
+    cache = ResultCache('test', maxsize=2, path='')
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # a is now the most recent
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    stats = cache.stats()
+    assert (stats['memory_hits'], stats['misses'], stats['size']) == (3, 1, 2)
+
+
+def test_disk_tier_is_shared(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    ResultCache('test', path=path).put('key', {'value': [1, 2]})
+
+    fresh = ResultCache('test', path=path)
+    assert fresh.get('key') == {'value': [1, 2]}
+    assert fresh.stats()['disk_hits'] == 1
+    # Namespaces and versions do not see each other's entries
+    assert ResultCache('other', path=path).get('key') is None
+    assert ResultCache('test', version=2, path=path).get('key') is None
+
+
+def test_cached_results_match_uncached(monkeypatch):
+    import app
+
+    def fresh_caches():
+        for name in ('DOCKERFILE_CACHE', 'LAYERS_CACHE', 'STAGE_LAYERS_CACHE'):
+            monkeypatch.setattr(app, name, ResultCache(name, path=''))
+
+    fresh_caches()
+    expected = app.process('Dockerfile', content=DOCKERFILE)
+    snapshot = copy.deepcopy(expected)
+    # Callers extend the returned lists; the cached copies must not change
+    expected['dependencies'].append('mutated')
+
+    cached = app.process('Dockerfile', content=DOCKERFILE)
+    assert cached == snapshot
+    assert app.LAYERS_CACHE.stats()['memory_hits'] == 1
+
+    fresh_caches()
+    assert app.process('Dockerfile', content=DOCKERFILE) == snapshot
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+import app
+import bench_extract_layers
+import bench_pipeline
+from bash_filters import upgrade
+from compact_ast import Forest
+from directives import build_ast
+
+
+def dockerfile_asts(count, seed):
+    projects = bench_pipeline.corpus(count, seed=seed, commands=bench_pipeline.FALLBACK_COMMANDS)
+    return [build_ast(files[f'proj{index}/Dockerfile'].decode()) for index, files in enumerate(projects)]
+
+
+@pytest.fixture
+def trees(raw_scripts):
+    return dockerfile_asts(300, seed=2) + bench_extract_layers.corpus(300, seed=4) + [upgrade(raw) for raw in raw_scripts]
+
+
+def test_round_trip(trees):
+    forest = Forest()
+    roots = [forest.add(tree) for tree in trees]
+    for root, tree in zip(roots, trees):
+        assert forest.to_dict(root) == tree
+        # These trees are built with keys in the order dumps writes them
+        assert forest.dumps(root) == json.dumps(tree)
+
+
+def test_key_order_is_fixed():
+    tree = {'children': [], 'value': 'x', 'extra': 1, 'type': 'T'}
+    forest = Forest()
+    text = forest.dumps(forest.add(tree))
+    assert text == '{"type": "T", "value": "x", "extra": 1, "children": []}'
+    assert json.loads(text) == tree
+
+
+def test_edge_cases_round_trip():
+    tree = {'type': 'ROOT', 'children': [
+        {'type': 'A', 'value': 1}, {'type': 'A', 'value': 1.0}, {'type': 'A', 'value': True},
+        {'type': 'NO-CHILDREN'}, {'type': 'EMPTY', 'children': []},
+        None, 'bare string', {'type': 'LIST-VALUE', 'value': [1, {'k': 'v'}], 'children': 'not a list'},
+    ]}
+    forest = Forest()
+    root = forest.add(tree)
+    restored = forest.to_dict(root)
+    assert restored == tree
+    assert [type(child.get('value')) for child in restored['children'][:3]] == [int, float, bool]
+    assert 'children' not in restored['children'][3]
+
+
+def test_interning():
+    forest = Forest()
+    for ast in bench_extract_layers.corpus(200, seed=1):
+        forest.add(ast)
+    assert len(forest.types) < 10
+    assert len(forest.values) < len(forest)
+
+
+def test_node_view_runs_extract_layers(trees):
+    forest = Forest()
+    for tree in trees:
+        if tree['type'] == 'DOCKER-FILE':
+            view = forest.node(forest.add(tree))
+            assert app.extract_layers(view) == app.extract_layers(tree)
+            assert dict(view)['type'] == tree['type'] and len(view) == len(tree)
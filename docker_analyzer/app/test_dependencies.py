@@ -0,0 +1,103 @@
+import os
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from bash_filters import upgrade
+from dependencies import extract_dependencies, word_value
+
+
+def node(node_type, *children, value=None):
+    tree = {'type': node_type, 'children': list(children)}
+    if value is not None:
+        tree['value'] = value
+    return tree
+
+
+def literal(value):
+    return node('BASH-LITERAL', value=value)
+
+
+# An enriched install command: SC-<CMD> -> SC-<CMD>-<LIST>S -> SC-<CMD>-<ITEM>
+def install(command, item, words, *options):
+    items = [node(item, literal(w) if isinstance(w, str) else w) for w in words]
+    return node(command, *options, node(item + 'S', *items))
+
+
+def records(*trees):
+    return [(r['manager'], r['package'], r['version']) for r in extract_dependencies(list(trees))]
+
+
+def test_word_value():
+    assert word_value(literal('curl')) == 'curl'
+    assert word_value(node('BASH-DOUBLE-QUOTED', literal('flask'), literal('>=2'))) == 'flask>=2'
+    assert word_value(node('BASH-CONCAT', literal('lib'), node('BASH-VARIABLE', value='V'))) == 'lib${V}'
+    assert word_value(node('BASH-CONCAT', literal('x'), node('BASH-COMMAND-SUBSTITUTION'))) is None
+
+
+def test_version_splitting():
+    assert records(install('SC-APT-GET-INSTALL', 'SC-APT-GET-PACKAGE', ['curl=7.68.0-1', 'git'])) == [
+        ('apt', 'curl', '7.68.0-1'), ('apt', 'git', None)
+    ]
+    assert records(install('SC-APK-ADD', 'SC-APK-PACKAGE', ['bash=5.1-r0', 'musl>=1.2', 'gcc~10'])) == [
+        ('apk', 'bash', '5.1-r0'), ('apk', 'musl', '>=1.2'), ('apk', 'gcc', '~10')
+    ]
+    assert records(install('SC-PIP-INSTALL', 'SC-PIP-TARGET', [
+        'flask==2.1.1', 'requests[socks]>=2.0', 'numpy', './local', 'git+https://example.com/x.git'
+    ])) == [('pip', 'flask', '2.1.1'), ('pip', 'requests', '>=2.0'), ('pip', 'numpy', None)]
+    assert records(install('SC-NPM-INSTALL', 'SC-NPM-PACKAGE', ['@types/node@18.0.0', 'express', '@scope/pkg'])) == [
+        ('npm', '@types/node', '18.0.0'), ('npm', 'express', None), ('npm', '@scope/pkg', None)
+    ]
+    assert records(install('SC-GO-INSTALL', 'SC-GO-PACKAGE', ['golang.org/x/tools/gopls@v0.11.0'])) == [
+        ('go', 'golang.org/x/tools/gopls', 'v0.11.0')
+    ]
+
+
+def test_version_option_pins_every_package():
+    version = node('SC-GEM-VERSION', literal('2.4.22'))
+    assert records(install('SC-GEM-INSTALL', 'SC-GEM-GEM', ['bundler', 'rake:13.0'], version)) == [
+        ('gem', 'bundler', '2.4.22'), ('gem', 'rake', '13.0')
+    ]
+    # A version computed at build time is unknown, not the substitution text
+    version = node('SC-GEM-VERSION', literal('$( tail -n 1 Gemfile.lock)'))
+    assert records(install('SC-GEM-INSTALL', 'SC-GEM-GEM', ['bundler'], version)) == [('gem', 'bundler', None)]
+
+
+def test_dynamic_words_are_skipped():
+    dynamic = node('BASH-CONCAT', node('BASH-COMMAND-SUBSTITUTION'))
+    assert records(install('SC-APT-GET-INSTALL', 'SC-APT-GET-PACKAGE', ['curl', dynamic])) == [('apt', 'curl', None)]
+
+
+def test_document_order_across_trees():
+    first = node('BASH-SCRIPT', node('BASH-AND-IF',
+                                     install('SC-APT-GET-INSTALL', 'SC-APT-GET-PACKAGE', ['a', 'b']),
+                                     install('SC-PIP-INSTALL', 'SC-PIP-TARGET', ['c'])))
+    second = node('BASH-SCRIPT', install('SC-YARN-ADD', 'SC-YARN-MODULE', ['d@1']))
+    assert records(first, second) == [
+        ('apt', 'a', None), ('apt', 'b', None), ('pip', 'c', None), ('yarn', 'd', '1')
+    ]
+    assert records(node('BASH-SCRIPT', node('SC-ECHO', literal('apt-get install x')))) == []
+
+
+# End to end through the compiled enricher; skipped unless ENRICH_BUILD
+# (default /build) holds one, as in test_enrich.py
+APP_JS = os.path.join(os.environ.get('ENRICH_BUILD', '/build'), 'app.js')
+
+
+@pytest.mark.skipif(not (shutil.which('node') and os.path.exists(APP_JS)),
+                    reason=f'needs node and a compiled enricher at {APP_JS}')
+def test_enriched_samples(sample_scripts):
+    lines = ''.join(json.dumps(upgrade(raw)) + '\n' for _, raw in sample_scripts)
+    done = subprocess.run(['node', APP_JS], input=lines, capture_output=True, text=True, check=True)
+    found = {
+        source: records(json.loads(line)) for (source, _), line in zip(sample_scripts, done.stdout.splitlines())
+    }
+    assert found['pip install --no-cache-dir flask==2.1.1 requests'] == [
+        ('pip', 'flask', '2.1.1'), ('pip', 'requests', None)
+    ]
+    assert found['apk add --no-cache git openssh || true'] == [('apk', 'git', None), ('apk', 'openssh', None)]
+    assert found['gem install bundler -v "$(tail -n 1 Gemfile.lock)"'] == [('gem', 'bundler', None)]
+    assert found['apt-get install -y $(cat /tmp/packages | xargs) >> /log'] == []
+    assert sum(found.values(), []).count(('apt', 'curl', None)) == 1
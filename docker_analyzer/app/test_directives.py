@@ -0,0 +1,105 @@
+import app
+import bench_extract_layers
+import bench_pipeline
+from cache import ResultCache
+from directives import build_ast, parse_image_ref, stage_graph, substitute
+
+MULTI_STAGE = '''\
+ARG BASE=python
+ARG TAG=3.9-alpine
+FROM ${BASE}:${TAG} AS build
+ARG APP=/src
+ENV HOME_DIR=/home/app
+WORKDIR ${APP}
+COPY . ${HOME_DIR}
+RUN pip install flask && echo $HOME_DIR
+FROM build AS test
+COPY --from=build ${HOME_DIR} /out
+FROM registry.example.com:5000/team/alpine:3.18@sha256:abc
+COPY --from=test /out /app
+COPY --from=nginx:1.25 /etc/nginx /etc/nginx
+RUN --mount=type=cache,from=build,target=/x apk add --no-cache curl
+'''
+
+
+def values(ast, node_type):
+    return [
+        [child.get('value') for child in node['children']]
+        for node in ast['children'] if node['type'] == node_type
+    ]
+
+
+def per_stage_layers(ast):
+    return app.merge_layers([app.scan_layers(stage) for _, stage in app.stage_asts(ast)])
+
+
+def test_stage_merge_matches_whole_file():
+    for ast in bench_extract_layers.corpus(3000, seed=11):
+        assert per_stage_layers(ast) == app.extract_layers(ast)
+
+    projects = bench_pipeline.corpus(500, seed=5, commands=bench_pipeline.FALLBACK_COMMANDS)
+    for files in projects:
+        for name, content in files.items():
+            if name.endswith('Dockerfile'):
+                ast = build_ast(content.decode())
+                assert per_stage_layers(ast) == app.extract_layers(ast)
+
+
+def test_editing_one_stage_rescans_only_that_stage(monkeypatch):
+    for name in ('DOCKERFILE_CACHE', 'LAYERS_CACHE', 'STAGE_LAYERS_CACHE'):
+        monkeypatch.setattr(app, name, ResultCache(name, path=''))
+
+    first = app.process('Dockerfile', content=MULTI_STAGE)
+    assert app.STAGE_LAYERS_CACHE.stats()['misses'] == 4  # global ARGs + 3 stages
+
+    content = MULTI_STAGE.replace('apk add --no-cache curl', 'pip install requests')
+    edited = app.process('Dockerfile', content=content)
+    stats = app.STAGE_LAYERS_CACHE.stats()
+    assert (stats['misses'], stats['memory_hits']) == (5, 3)
+    assert edited['os'] == first['os'] and edited['language'] == first['language']
+    assert edited['dependencies'] != first['dependencies']
+
+    # The merged result is the one for the whole file
+    assert (edited['os'], edited['language'], edited['dependencies']) == app.extract_layers(build_ast(content))
+
+
+def test_substitute():
+    scope = {'A': 'x', 'EMPTY': ''}
+    assert substitute('$A/${A}/\\$A', scope) == 'x/x/$A'
+    assert substitute('${EMPTY:-dflt} ${A:-dflt} ${A:+set} ${MISSING:+set}', scope) == 'dflt x set '
+    assert substitute('$MISSING ${MISSING}', scope) == '$MISSING ${MISSING}'
+
+
+def test_parse_image_ref():
+    assert parse_image_ref('python:3.9-alpine') == {
+        'registry': None, 'repo': None, 'name': 'python', 'tag': '3.9-alpine', 'digest': None
+    }
+    assert parse_image_ref('localhost:5000/team/app@sha256:abc') == {
+        'registry': 'localhost:5000', 'repo': 'localhost:5000/team', 'name': 'app', 'tag': None,
+        'digest': 'sha256:abc'
+    }
+    assert parse_image_ref('library/ubuntu:20.04')['registry'] is None
+
+
+def test_variable_scoping():
+    ast = build_ast(MULTI_STAGE)
+    froms = [node['value'] for node in ast['children'] if node['type'] == 'DOCKER-FROM']
+    assert froms[0] == 'python:3.9-alpine'
+    assert values(ast, 'DOCKER-WORKDIR') == [['/src']]
+    copies = [node for node in ast['children'] if node['type'] == 'DOCKER-COPY']
+    # ENV is inherited by a stage built FROM the stage that set it
+    assert copies[0]['children'][-1]['children'][0]['value'] == '/home/app'
+    assert copies[1]['children'][1]['children'][0]['value'] == '/home/app'
+    # RUN is left to the shell
+    runs = [node['children'][0]['value'] for node in ast['children'] if node['type'] == 'DOCKER-RUN']
+    assert runs[0] == 'pip install flask && echo $HOME_DIR'
+
+
+def test_stage_graph():
+    assert stage_graph(build_ast(MULTI_STAGE)) == [
+        {'index': 0, 'name': 'build', 'base': 'python:3.9-alpine', 'base_stage': None,
+         'copies_from': [], 'external': []},
+        {'index': 1, 'name': 'test', 'base': 'build', 'base_stage': 0, 'copies_from': [0], 'external': []},
+        {'index': 2, 'name': None, 'base': 'registry.example.com:5000/team/alpine:3.18@sha256:abc',
+         'base_stage': None, 'copies_from': [1, 0], 'external': ['nginx:1.25']},
+    ]
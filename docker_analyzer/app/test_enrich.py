@@ -0,0 +1,89 @@
+import os
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from bash_filters import upgrade
+from bash_pool import BashParserPool
+
+# These run the compiled enricher (tsc output of app.ts) and are skipped
+# unless ENRICH_BUILD (default /build) holds one and node is installed
+ENRICH_BUILD = os.environ.get('ENRICH_BUILD', '/build')
+APP_JS = os.path.join(ENRICH_BUILD, 'app.js')
+COMMANDS_JS = os.path.join(ENRICH_BUILD, 'enrich', 'commands', 'index.js')
+# An enricher built from an earlier revision, for the golden comparison
+BASELINE_BUILD = os.environ.get('ENRICH_BASELINE_BUILD')
+
+pytestmark = pytest.mark.skipif(
+    not (shutil.which('node') and os.path.exists(APP_JS)),
+    reason=f'needs node and a compiled enricher at {APP_JS}'
+)
+
+
+def enricher_input(raw_scripts):
+    return ''.join(json.dumps(upgrade(raw)) + '\n' for raw in raw_scripts)
+
+
+def run_app(*args, input, app_js=APP_JS, env=None):
+    return subprocess.run(['node', app_js, *args], input=input, capture_output=True, text=True, timeout=600,
+                          env=env and {**os.environ, **env})
+
+
+# Same tree up to key order, as app.ts --verify compares them
+def canonical(output):
+    return [json.dumps(json.loads(line), sort_keys=True) for line in output.splitlines()]
+
+
+def test_incremental_matches_full_tree(raw_scripts):
+    done = run_app('--verify', input=enricher_input(raw_scripts))
+    assert done.returncode == 0, done.stderr
+    assert json.loads(done.stdout) == {'lines': len(raw_scripts), 'mismatches': 0}
+
+
+def test_stream_protocol(raw_scripts):
+    trees = [upgrade(raw) for raw in raw_scripts]
+    expected = [json.loads(line) for line in run_app(input=enricher_input(raw_scripts)).stdout.splitlines()]
+    assert len(expected) == len(trees)
+
+    with BashParserPool(size=2, command=['node', APP_JS, '--stream']) as pool:
+        assert pool.map(trees) == expected
+        # A line the enricher cannot read gets an UNKNOWN answer, and the
+        # same process keeps answering
+        bad = pool.parse('not a tree')
+        assert bad['type'] == 'UNKNOWN'
+        assert pool.parse(trees[0]) == expected[0]
+        assert pool.restarts == 0 and pool.failures == 0
+
+
+def test_parsers_do_not_keep_state(raw_scripts):
+    # The same commands again in the same process parse the same way
+    lines = enricher_input(raw_scripts)
+    once = run_app(input=lines).stdout.splitlines()
+    twice = run_app(input=lines + lines).stdout.splitlines()
+    assert twice == once + once
+
+
+@pytest.mark.skipif(not BASELINE_BUILD, reason='set ENRICH_BASELINE_BUILD to compare with an earlier build')
+def test_matches_baseline_enricher(raw_scripts):
+    lines = enricher_input(raw_scripts)
+    expected = run_app(input=lines, app_js=os.path.join(BASELINE_BUILD, 'app.js')).stdout
+    assert canonical(run_app(input=lines).stdout) == canonical(expected)
+
+
+def test_commands_bundle(tmp_path, raw_scripts):
+    lines = enricher_input(raw_scripts[:12])
+    expected = run_app(input=lines).stdout
+
+    bundle = tmp_path / 'commands.json'
+    subprocess.run(['node', COMMANDS_JS, str(bundle)], check=True, capture_output=True)
+    assert run_app(input=lines, env={'ENRICH_COMMANDS_BUNDLE': str(bundle)}).stdout == expected
+
+    # A bundle written from other YAML specs is ignored
+    stale = json.loads(bundle.read_text())
+    stale.update(digest='0' * 64, commands=[])
+    bundle.write_text(json.dumps(stale))
+    done = run_app(input=lines, env={'ENRICH_COMMANDS_BUNDLE': str(bundle)})
+    assert done.stdout == expected
+    assert 'stale' in done.stderr
@@ -0,0 +1,139 @@
+import io
+import os
+import time
+import threading
+
+import pytest
+
+import main
+from jobs import JobQueue, QueueFull
+
+DOCKERFILE = b'FROM python:3.9-alpine\nRUN pip install flask\n'
+
+
+def wait_for(queue, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(workers=1, max_pending=2)
+    yield queue
+    queue.shutdown()
+
+
+def test_job_result_and_error(queue):
+    job = wait_for(queue, queue.submit(lambda a, b: a + b, 1, 2))
+    assert (job['status'], job['result'], job['error']) == ('done', 3, None)
+
+    def fail():
+        raise ValueError('bad input')
+
+    job = wait_for(queue, queue.submit(fail))
+    assert (job['status'], job['error']) == ('failed', 'bad input')
+    assert queue.get('unknown') is None
+
+
+def test_full_queue_is_rejected(queue):
+    release = threading.Event()
+    ids = [queue.submit(release.wait) for _ in range(2)]
+    assert queue.full()
+    with pytest.raises(QueueFull):
+        queue.submit(release.wait)
+    assert queue.stats()['running'] + queue.stats()['queued'] == 2
+
+    release.set()
+    for job_id in ids:
+        wait_for(queue, job_id)
+    # Finished jobs give their slots back
+    assert not queue.full()
+    wait_for(queue, queue.submit(lambda: None))
+
+
+def test_finished_jobs_expire():
+    queue = JobQueue(workers=1, ttl=0)
+    try:
+        job_id = queue.submit(lambda: 'x')
+        queue.executor.shutdown(wait=True)
+        time.sleep(0.01)
+        assert queue.get(job_id) is None
+    finally:
+        queue.shutdown()
+
+
+
+def test_shared_store_is_seen_by_every_worker(tmp_path):
+    # Two queues on one database stand in for two gunicorn workers
+    path = str(tmp_path / 'jobs.sqlite')
+    runner, other = JobQueue(workers=1, path=path), JobQueue(workers=1, path=path)
+    try:
+        job = wait_for(other, runner.submit(lambda: {'OS Layer': ['alpine']}))
+        assert (job['status'], job['result'], job['error']) == ('done', {'OS Layer': ['alpine']}, None)
+        assert other.stats()['done'] == 1
+        # Only the accepting worker counts the job against its queue
+        assert runner.pending() == other.pending() == 0
+
+        job = wait_for(other, runner.submit(object))
+        assert job['status'] == 'failed'
+        assert other.get('unknown') is None
+    finally:
+        runner.shutdown()
+        other.shutdown()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(main.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(main, 'JOBS', JobQueue(workers=1, max_pending=1))
+    yield main.app.test_client()
+    main.JOBS.shutdown()
+
+
+def upload(*files):
+    return {'folder_files': [(io.BytesIO(data), name) for name, data in files]}
+
+
+@pytest.mark.parametrize('in_memory', ['0', '1'])
+def test_job_matches_synchronous_analysis(client, tmp_path, in_memory):
+    files = [('project/Dockerfile', DOCKERFILE), ('project/requirements.txt', b'requests==2.31.0\n')]
+    expected = client.post(f'/analyze?in_memory={in_memory}', data=upload(*files)).get_json()
+
+    response = client.post(f'/jobs?in_memory={in_memory}', data=upload(*files))
+    assert response.status_code == 202
+    assert response.headers['Location'] == response.get_json()['status_url']
+    job = wait_for(main.JOBS, response.get_json()['job_id'])
+    assert job['status'] == 'done'
+    for result in (job['result'], expected):
+        result.pop('timings')
+    assert job['result'] == expected
+    assert 'requests==2.31.0' in expected['Dependencies Layer']
+
+    got = client.get(response.headers['Location']).get_json()
+    assert got['status'] == 'done'
+    # Scratch directories are removed once the job has run
+    assert os.listdir(tmp_path) == []
+
+
+def test_full_queue_answers_503(client, tmp_path):
+    release = threading.Event()
+    main.JOBS.submit(release.wait)
+    try:
+        response = client.post('/jobs?in_memory=0', data=upload(('project/Dockerfile', DOCKERFILE)))
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '5'
+        assert os.listdir(tmp_path) == []
+    finally:
+        release.set()
+
+
+def test_upload_outside_scratch_dir_is_rejected(client, tmp_path):
+    response = client.post('/jobs?in_memory=0', data=upload(('../escape/Dockerfile', DOCKERFILE)))
+    assert response.status_code == 400
+    assert not (tmp_path.parent / 'escape').exists()
+    assert os.listdir(tmp_path) == []
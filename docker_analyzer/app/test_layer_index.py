@@ -0,0 +1,169 @@
+import io
+import json
+import sqlite3
+
+import pytest
+
+import main
+import layer_index
+from layer_index import LayerIndex, QueryError, summary_terms
+from upload_buffers import jsonl_items
+
+SUMMARIES = [
+    {'path': 'a/Dockerfile', 'os': ['alpine'], 'language': ['python3.9'],
+     'dependencies': ['curl openssl   ca-certificates', 'flask==2.3.2']},
+    {'path': 'b/Dockerfile', 'os': ['ubuntu'], 'language': ['python3.9'],
+     'dependencies': ['-y --no-install-recommends openssl gcc ', 'requests'],
+     'packages': [{'manager': 'apt', 'package': 'openssl', 'version': None},
+                  {'manager': 'pip', 'package': 'requests', 'version': '2.31.0'}]},
+    {'path': 'c/Dockerfile', 'os': ['alpine'], 'language': ['node16'], 'dependencies': ['lodash@^4.17.21']},
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LayerIndex(str(tmp_path / 'index.sqlite'))
+    for summary in SUMMARIES:
+        index.add(summary)
+    index.commit()
+    yield index
+    index.close()
+
+
+def test_summary_terms_split_run_text():
+    assert summary_terms(SUMMARIES[1]) == {
+        ('os', 'ubuntu'), ('language', 'python3.9'),
+        ('dependency', 'openssl'), ('dependency', 'gcc'), ('dependency', 'requests'),
+        ('package', 'apt:openssl'), ('package', 'pip:requests'),
+    }
+    assert {value for layer, value in summary_terms(SUMMARIES[0]) if layer == 'dependency'} == {
+        'curl', 'openssl', 'ca-certificates', 'flask==2.3.2'
+    }
+    # Manifest entries are kept whole
+    assert ('dependency', 'lodash@^4.17.21') in summary_terms(SUMMARIES[2])
+
+
+def test_query_single_package(index):
+    assert index.find([('dependency', 'openssl')]) == {'count': 2, 'dockerfiles': ['a/Dockerfile', 'b/Dockerfile']}
+    assert index.find([('dependency', 'curl')])['dockerfiles'] == ['a/Dockerfile']
+    assert index.find([('dependency', ' lodash@^4.17.21 ')])['dockerfiles'] == ['c/Dockerfile']
+    assert index.find([('dependency', '-y')])['count'] == 0
+
+
+def test_query_intersects_terms(index):
+    assert index.find([('os', 'alpine'), ('language', 'python3.9')])['dockerfiles'] == ['a/Dockerfile']
+    assert index.find([('os', 'alpine'), ('dependency', 'gcc')]) == {'count': 0, 'dockerfiles': []}
+    assert index.find([('os', 'missing')]) == {'count': 0, 'dockerfiles': []}
+    assert index.find([], limit=2, offset=1) == {'count': 3, 'dockerfiles': ['b/Dockerfile', 'c/Dockerfile']}
+
+
+def test_top(index):
+    assert index.top('os') == [{'value': 'alpine', 'count': 2}, {'value': 'ubuntu', 'count': 1}]
+    # One os/language filter is answered from the co-occurrence counts ...
+    assert index.top('dependency', [('language', 'python3.9')], limit=1) == [{'value': 'openssl', 'count': 2}]
+    # ... the others from the postings
+    assert index.top('dependency', [('language', 'python3.9'), ('os', 'ubuntu')], prefix='o') == [
+        {'value': 'openssl', 'count': 1}
+    ]
+    assert index.top('package', prefix='pip:') == [{'value': 'pip:requests', 'count': 1}]
+    with pytest.raises(QueryError):
+        index.top('unknown')
+
+
+def test_re_adding_replaces(index):
+    before = index.stats()
+    index.add(SUMMARIES[0])
+    assert index.stats() == before
+
+    index.add({'path': 'a/Dockerfile', 'os': ['debian'], 'language': [], 'dependencies': ['curl']})
+    assert index.find([('dependency', 'openssl')])['dockerfiles'] == ['b/Dockerfile']
+    assert index.top('os') == [{'value': 'alpine', 'count': 1}, {'value': 'debian', 'count': 1},
+                               {'value': 'ubuntu', 'count': 1}]
+    assert index.top('dependency', [('os', 'alpine')]) == [{'value': 'lodash@^4.17.21', 'count': 1}]
+
+    assert index.remove('a/Dockerfile')
+    assert not index.remove('a/Dockerfile')
+    assert index.stats()['dockerfiles'] == 2
+    assert index.top('os', prefix='d') == []
+
+
+def test_add_with_commit_rolls_back_on_error(index):
+    with pytest.raises(KeyError):
+        index.add({'os': ['alpine']}, commit=True)
+    index.add({'path': 'd/Dockerfile', 'os': ['fedora'], 'language': [], 'dependencies': []}, commit=True)
+    assert not index.conn.in_transaction
+    assert index.find([('os', 'fedora')])['dockerfiles'] == ['d/Dockerfile']
+
+
+def test_batch_results_are_committed_per_item(tmp_path, monkeypatch):
+    db = str(tmp_path / 'index.sqlite')
+    index = LayerIndex(db)
+    monkeypatch.setattr(main, 'get_index', lambda: index)
+    monkeypatch.setattr(main, 'BATCH_WORKERS', 1)
+    body = ''.join(
+        json.dumps({'id': name, 'dockerfile': f'FROM {name}:latest\nRUN pip install flask requests\n'}) + '\n'
+        for name in ('alpine', 'ubuntu', 'debian')
+    ).encode()
+    lines = main.run_batch(jsonl_items(io.BytesIO(body)))
+    next(lines)
+    # The streaming response is suspended: what it indexed is visible to
+    # other connections and no write transaction is left open
+    assert not index.conn.in_transaction
+    reader = sqlite3.connect(db)
+    assert reader.execute('SELECT COUNT(*) FROM dockerfiles').fetchone()[0] >= 1
+    list(lines)
+    assert reader.execute('SELECT COUNT(*) FROM dockerfiles').fetchone()[0] == 3
+    reader.close()
+    assert index.find([('dependency', 'requests')])['count'] == 3
+    index.close()
+
+
+def test_batch_items_are_indexed_by_caller_names(tmp_path, monkeypatch):
+    index = LayerIndex(str(tmp_path / 'index.sqlite'))
+    monkeypatch.setattr(main, 'get_index', lambda: index)
+    client = main.app.test_client()
+
+    def batch(lines, source=None):
+        body = ''.join(json.dumps(line) + '\n' for line in lines)
+        query = f'?source={source}' if source else ''
+        return client.post('/analyze/batch' + query, data=body, content_type='application/x-ndjson').get_data()
+
+    # Line numbers and in-upload paths repeat across batches: not indexed on their own ...
+    batch([{'dockerfile': 'FROM alpine:3.18\n'}])
+    assert index.stats()['dockerfiles'] == 0
+    # ... but under a source, or when the caller names the item
+    batch([{'dockerfile': 'FROM alpine:3.18\n'}], source='team-a')
+    batch([{'dockerfile': 'FROM ubuntu:22.04\n'}], source='team-b')
+    batch([{'id': 'svc/web', 'dockerfile': 'FROM debian:12\n'}])
+    assert index.find([])['dockerfiles'] == ['team-a/0', 'team-b/0', 'svc/web']
+    index.close()
+
+
+def test_query_endpoint(index, monkeypatch):
+    monkeypatch.setattr(main, 'get_index', lambda: index)
+    client = main.app.test_client()
+    response = client.get('/query?dependency=openssl&os=alpine')
+    assert response.get_json() == {'filters': [['os', 'alpine'], ['dependency', 'openssl']], 'count': 1,
+                                   'dockerfiles': ['a/Dockerfile']}
+    response = client.get('/query?top=package&prefix=apt:')
+    assert response.get_json()['values'] == [{'value': 'apt:openssl', 'count': 1}]
+    assert client.get('/query?top=nope').status_code == 400
+    # Negative limits are not "no limit"
+    assert client.get('/query?os=alpine&limit=-1').get_json()['dockerfiles'] == ['a/Dockerfile']
+    assert len(client.get('/query?limit=-1').get_json()['dockerfiles']) == 1
+    assert len(client.get('/query?top=os&limit=-1').get_json()['values']) == 1
+    assert client.get('/query?offset=-1').status_code == 400
+
+    monkeypatch.setattr(main, 'get_index', lambda: None)
+    assert client.get('/query?os=alpine').status_code == 404
+
+
+def test_cli(tmp_path, capsys):
+    summaries = tmp_path / 'dockerfile_summary.txt'
+    summaries.write_text(''.join(json.dumps(summary) + '\n' for summary in SUMMARIES))
+    db = str(tmp_path / 'index.sqlite')
+    assert layer_index.main(['--db', db, 'build', str(summaries), '--commit-every', '2']) == 0
+    assert json.loads(capsys.readouterr().out)['dockerfiles'] == 3
+
+    assert layer_index.main(['--db', db, 'query', '--dependency', 'ca-certificates']) == 0
+    assert json.loads(capsys.readouterr().out) == {'count': 1, 'dockerfiles': ['a/Dockerfile']}
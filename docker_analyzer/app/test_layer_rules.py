@@ -0,0 +1,47 @@
+from app import extract_layers
+from bench_extract_layers import corpus, legacy_extract_layers, clear_memos
+from layer_rules import KeywordMatcher, RuleTable, classify_run, classify_tag, classify_image
+
+
+def test_matches_legacy_extract_layers():
+    clear_memos()
+    for ast in corpus(3000, seed=7):
+        assert tuple(extract_layers(ast)) == tuple(legacy_extract_layers(ast))
+
+
+def test_memoized_results_are_stable():
+    asts = corpus(300, seed=3)
+    clear_memos()
+    cold = [extract_layers(ast) for ast in asts]
+    warm = [extract_layers(ast) for ast in asts]
+    assert cold == warm
+    assert classify_run.cache_info().hits > 0
+
+
+def test_matcher_finds_overlapping_keywords():
+    matcher = KeywordMatcher({'python', 'python3', 'python3-pip', 'node', 'nodejs', 'go', 'golang'})
+    assert matcher.find('apt-get install python3-pip nodejs') == {
+        'python', 'python3', 'python3-pip', 'node', 'nodejs'
+    }
+    assert matcher.find('golang') == {'go', 'golang'}
+    assert matcher.find('ruby') == frozenset()
+
+
+def test_rule_table_first_rule_wins():
+    table = RuleTable([(('openjdk', 'java'), 'java'), (('python3',), 'python3'), (('python',), 'python')])
+    assert table.match({'python', 'python3'}) == 'python3'
+    assert table.match({'python', 'java'}) == 'java'
+    assert table.match(set()) is None
+
+
+def test_classifiers():
+    assert classify_tag('3.9-ALPINE') == 'alpine'
+    assert classify_tag('buster-slim') == 'debian-slim'
+    assert classify_image('Ubuntu') == ('ubuntu', None)
+    assert classify_image('python') == (None, 'python')
+    language, dependencies, languages = classify_run('apt-get install -y python3-pip curl')
+    assert language == 'python3'
+    assert dependencies == ('python3-pip curl',)
+    assert languages == ('python3',)
+    assert classify_run('pip3 install flask') == (None, ('flask',), ())
+    assert classify_run('echo hi') == (None, (), ())
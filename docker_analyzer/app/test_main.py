@@ -0,0 +1,97 @@
+import io
+import json
+import tarfile
+
+import pytest
+
+import main
+
+PROJECTS = {
+    'a/Dockerfile': b'FROM python:3.9-alpine\nRUN pip install flask\n',
+    'a/requirements.txt': b'requests==2.31.0\n',
+    'b/api.dockerfile': b'FROM node:16\nRUN npm install express\n',
+    'b/package.json': b'{"dependencies": {"lodash": "^4.17.21"}}',
+    'c/Dockerfile': b'FROM ubuntu:20.04\nRUN apt-get install -y curl\n',
+}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(main.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(main, 'BATCH_WORKERS', 2)
+    return main.app.test_client()
+
+
+def ndjson(response):
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    for line in lines:
+        line.pop('timings', None)
+    return sorted(lines, key=lambda line: line['index'])
+
+
+def single(client, dockerfile, manifests):
+    files = [(io.BytesIO(dockerfile), 'project/Dockerfile')]
+    files += [(io.BytesIO(data), f'project/{name}') for name, data in manifests.items()]
+    result = client.post('/analyze', data={'folder_files': files}).get_json()
+    result.pop('timings')
+    return result
+
+
+def tar_bytes(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_jsonl_batch_matches_single_requests(client):
+    entries = [
+        {'id': 'a', 'dockerfile': PROJECTS['a/Dockerfile'].decode(),
+         'manifests': {'requirements.txt': PROJECTS['a/requirements.txt'].decode()}},
+        {'id': 'c', 'dockerfile': PROJECTS['c/Dockerfile'].decode()},
+    ]
+    body = '\n'.join(json.dumps(entry) for entry in entries) + '\nnot json\n'
+    lines = ndjson(client.post('/analyze/batch', data=body, content_type='application/x-ndjson'))
+
+    assert [(line['index'], line['id']) for line in lines] == [(0, 'a'), (1, 'c'), (2, None)]
+    assert lines[2]['error'].startswith('Invalid JSON')
+    expected = single(client, PROJECTS['a/Dockerfile'], {'requirements.txt': PROJECTS['a/requirements.txt']})
+    assert {key: lines[0][key] for key in expected} == expected
+    assert {key: lines[1][key] for key in expected} == single(client, PROJECTS['c/Dockerfile'], {})
+
+
+def test_archive_batch(client):
+    expected = ndjson(client.post('/analyze/batch', data=tar_bytes(PROJECTS), content_type='application/x-tar'))
+    assert [line['id'] for line in expected] == ['a/Dockerfile', 'b/api.dockerfile', 'c/Dockerfile']
+    assert 'requests==2.31.0' in expected[0]['Dependencies Layer']
+    assert 'lodash@^4.17.21' in expected[1]['Dependencies Layer']
+
+    # The same archive as a multipart field
+    form = {'archive': (io.BytesIO(tar_bytes(PROJECTS)), 'projects.tar')}
+    assert ndjson(client.post('/analyze/batch', data=form)) == expected
+
+
+def test_failed_item_does_not_fail_the_batch(client, monkeypatch):
+    real_process = main.process
+
+    def process(path, content=None):
+        if path == 'broken':
+            raise RuntimeError('parser crashed')
+        return real_process(path, content=content)
+
+    monkeypatch.setattr(main, 'process', process)
+    body = '\n'.join(json.dumps({'id': name, 'dockerfile': 'FROM alpine:3.18\n'}) for name in ('ok', 'broken', 'ok2'))
+    lines = ndjson(client.post('/analyze/batch', data=body, content_type='application/x-ndjson'))
+    assert [line.get('error') for line in lines] == [None, 'parser crashed', None]
+    assert lines[2]['OS Layer'] == ['alpine']
+
+
+def test_empty_batch_is_rejected(client):
+    response = client.post('/analyze/batch', data={})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'No batch uploaded'}
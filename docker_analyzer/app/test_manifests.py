@@ -0,0 +1,251 @@
+import io
+import json
+
+import pytest
+
+import main
+import manifests
+from manifests import (
+    find_manifests, iter_dependencies, parse_gemfile_lock, parse_go_mod, parse_package_json, parse_package_lock,
+    parse_poetry_lock, parse_pom, parse_requirements,
+)
+
+# npm 6
+LOCK_V1 = '''{
+  "name": "web",
+  "version": "1.0.0",
+  "lockfileVersion": 1,
+  "requires": true,
+  "dependencies": {
+    "accepts": {
+      "version": "1.3.8",
+      "resolved": "https://registry.npmjs.org/accepts/-/accepts-1.3.8.tgz",
+      "integrity": "sha512-PYAthTa2m2VKxuvSD3DPC/Gy+U+sOA1LAuT8mkmRuvw+NACSaeXEQ+NHcVF7rONl6qcaxV3Uuemwawk+7+SJLw==",
+      "requires": {
+        "mime-types": "~2.1.34",
+        "negotiator": "0.6.3"
+      }
+    },
+    "debug": {
+      "version": "2.6.9",
+      "resolved": "https://registry.npmjs.org/debug/-/debug-2.6.9.tgz",
+      "requires": {
+        "ms": "2.0.0"
+      },
+      "dependencies": {
+        "ms": {
+          "version": "2.0.0",
+          "resolved": "https://registry.npmjs.org/ms/-/ms-2.0.0.tgz"
+        }
+      }
+    },
+    "express": {
+      "version": "4.18.2",
+      "resolved": "https://registry.npmjs.org/express/-/express-4.18.2.tgz",
+      "requires": {
+        "accepts": "~1.3.8",
+        "debug": "2.6.9"
+      }
+    }
+  }
+}
+'''
+
+# npm 9: no "dependencies" section
+LOCK_V3 = '''{
+  "name": "web",
+  "version": "1.0.0",
+  "lockfileVersion": 3,
+  "requires": true,
+  "packages": {
+    "": {
+      "name": "web",
+      "version": "1.0.0",
+      "dependencies": {
+        "express": "^4.18.2"
+      }
+    },
+    "node_modules/accepts": {
+      "version": "1.3.8",
+      "resolved": "https://registry.npmjs.org/accepts/-/accepts-1.3.8.tgz",
+      "dependencies": {
+        "mime-types": "~2.1.34"
+      },
+      "engines": {
+        "node": ">= 0.6"
+      }
+    },
+    "node_modules/debug/node_modules/ms": {
+      "version": "2.0.0",
+      "resolved": "https://registry.npmjs.org/ms/-/ms-2.0.0.tgz"
+    },
+    "node_modules/express": {
+      "version": "4.18.2",
+      "resolved": "https://registry.npmjs.org/express/-/express-4.18.2.tgz"
+    }
+  }
+}
+'''
+
+
+def parsed(parser, text, binary=False):
+    _, bounded = manifests._open(text, binary)
+    return [dep for _, dep in parser(bounded)]
+
+
+def test_package_lock_v1():
+    assert parsed(parse_package_lock, LOCK_V1) == ['accepts@1.3.8', 'debug@2.6.9', 'ms@2.0.0', 'express@4.18.2']
+
+
+def test_package_lock_v3():
+    assert parsed(parse_package_lock, LOCK_V3) == ['accepts@1.3.8', 'ms@2.0.0', 'express@4.18.2']
+
+
+def test_package_lock_v2_is_read_once():
+    # npm 7/8 write both sections; only "packages" is read, in either order
+    lock = json.loads(LOCK_V3)
+    lock['lockfileVersion'] = 2
+    lock['dependencies'] = json.loads(LOCK_V1)['dependencies']
+    expected = ['accepts@1.3.8', 'ms@2.0.0', 'express@4.18.2']
+    assert parsed(parse_package_lock, json.dumps(lock)) == expected
+
+    reordered = {'dependencies': lock['dependencies'], 'packages': lock['packages']}
+    assert parsed(parse_package_lock, json.dumps(reordered)) == expected
+
+
+def test_malformed_manifest_is_dropped_alone(monkeypatch):
+    def broken(stream):
+        yield 'left-pad', 'left-pad@1.3.0'
+        raise KeyError('boom')
+
+    monkeypatch.setitem(manifests._PARSERS, 'go.mod', (broken, False))
+    deps = list(iter_dependencies({
+        'package.json': '{"dependencies": {"lodash": "^4.17.21"}}',
+        'go.mod': 'module x\n',
+        'poetry.lock': '[[package]]\nname = "flask"\nversion = "2.3.2"\n',
+        'pom.xml': b'<project><dependencies>',
+    }))
+    assert deps == ['lodash@^4.17.21', 'flask==2.3.2']
+
+
+def test_analyze_with_v1_lockfile(tmp_path, monkeypatch):
+    monkeypatch.setitem(main.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    files = [
+        (io.BytesIO(b'FROM node:16\nRUN npm ci\n'), 'project/Dockerfile'),
+        (io.BytesIO(LOCK_V1.encode()), 'project/package-lock.json'),
+    ]
+    response = main.app.test_client().post('/analyze', data={'folder_files': files})
+    assert response.status_code == 200
+    assert 'express@4.18.2' in response.get_json()['Dependencies Layer']
+
+
+def test_requirements():
+    text = '''\
+# pinned
+requests==2.31.0  # http
+Flask[async] >= 2.0, <3 ; python_version >= "3.8"
+numpy \\
+    ==1.26.0
+-e git+https://github.com/org/repo.git#egg=repo
+--index-url https://pypi.example.com/simple
+django @ https://example.com/django.tar.gz
+./local/package
+uvicorn
+'''
+    assert parsed(parse_requirements, text) == ['requests==2.31.0', 'Flask>=2.0,<3', 'numpy==1.26.0', 'django',
+                                                 'uvicorn']
+
+
+def test_requirements_includes():
+    deps = list(iter_dependencies({
+        'requirements.txt': '-r requirements/base.txt\npytest\n',
+        'requirements/base.txt': '-r ../requirements.txt\nflask==2.3.2\n',
+    }))
+    assert deps == ['flask==2.3.2', 'pytest']
+
+
+def test_requirements_includes_on_disk(tmp_path):
+    (tmp_path / 'requirements.txt').write_text('-r dev.txt\n-r ../outside.txt\nflask\n')
+    (tmp_path / 'dev.txt').write_text('pytest==7.4.0\n')
+    (tmp_path.parent / 'outside.txt').write_text('secret\n')
+    assert list(iter_dependencies(find_manifests(str(tmp_path)))) == ['pytest==7.4.0', 'flask']
+
+
+def test_package_json():
+    text = '{"name": "web", "dependencies": {"express": "^4.18.2", "nested": {"x": "1"}}, ' \
+           '"devDependencies": {"jest": "^29.0.0"}}'
+    assert parsed(parse_package_json, text) == ['express@^4.18.2']
+
+
+def test_pom():
+    text = b'''<?xml version="1.0"?>
+<project xmlns="http://maven.apache.org/POM/4.0.0">
+  <parent><artifactId>spring-boot-starter-parent</artifactId></parent>
+  <dependencies>
+    <dependency><groupId>org.springframework.boot</groupId><artifactId>spring-boot-starter-web</artifactId></dependency>
+    <dependency><groupId>junit</groupId><artifactId>junit</artifactId><version>4.13.2</version></dependency>
+  </dependencies>
+  <build><plugins><plugin><artifactId>maven-compiler-plugin</artifactId></plugin></plugins></build>
+</project>
+'''
+    assert parsed(parse_pom, text, binary=True) == ['spring-boot-starter-web', 'junit']
+
+
+def test_go_mod():
+    text = '''module example.com/app
+
+go 1.21
+
+require github.com/gin-gonic/gin v1.9.1
+
+require (
+\tgolang.org/x/net v0.17.0 // indirect
+\tgithub.com/stretchr/testify v1.8.4
+)
+'''
+    assert parsed(parse_go_mod, text) == ['github.com/gin-gonic/gin@v1.9.1', 'golang.org/x/net@v0.17.0',
+                                          'github.com/stretchr/testify@v1.8.4']
+
+
+def test_gemfile_lock():
+    text = '''GEM
+  remote: https://rubygems.org/
+  specs:
+    actionpack (7.0.8)
+      rack (~> 2.0)
+    rack (2.2.8)
+
+PLATFORMS
+  ruby
+
+DEPENDENCIES
+  rails
+'''
+    assert parsed(parse_gemfile_lock, text) == ['actionpack@7.0.8', 'rack@2.2.8']
+
+
+def test_poetry_lock():
+    text = '''[[package]]
+name = "flask"
+version = "2.3.2"
+description = "A simple framework"
+
+[package.dependencies]
+click = ">=8.1.3"
+
+[[package]]
+name = "click"
+version = "8.1.7"
+'''
+    assert parsed(parse_poetry_lock, text) == ['flask==2.3.2', 'click==8.1.7']
+
+
+def test_limits(monkeypatch):
+    monkeypatch.setattr(manifests, 'MANIFEST_MAX_DEPENDENCIES', 2)
+    assert list(iter_dependencies({'requirements.txt': 'a1\nb2\nc3\n'})) == ['a1', 'b2']
+
+    monkeypatch.setattr(manifests, 'MANIFEST_MAX_DEPENDENCIES', 100)
+    monkeypatch.setattr(manifests, 'MANIFEST_SIZE_LIMIT', 16)
+    with pytest.raises(manifests.ManifestTooLarge):
+        parsed(parse_requirements, 'flask\n' * 10)
+    assert list(iter_dependencies({'requirements.txt': 'flask\n' * 10, 'go.mod': 'require a v1\n'})) == ['a@v1']
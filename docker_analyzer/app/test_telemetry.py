@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import logging
+import threading
+import subprocess
+
+import telemetry
+from telemetry import Histogram, JsonFormatter, collect_timings, observe, render_prometheus, timed
+
+
+def test_histogram_buckets_are_upper_bounds():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 1.0, 3.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 2, 1]
+    assert histogram.count == 5
+    assert abs(histogram.sum - 4.65) < 1e-9
+
+
+def test_render_prometheus_is_cumulative(monkeypatch):
+    monkeypatch.setattr(telemetry, '_HISTOGRAMS', {'parse': Histogram(buckets=(0.1, 1.0))})
+    observe('parse', 0.05)
+    observe('parse', 0.5)
+    observe('parse', 5.0)
+    text = render_prometheus()
+    assert 'docker_analyzer_stage_seconds_bucket{stage="parse",le="0.1"} 1\n' in text
+    assert 'docker_analyzer_stage_seconds_bucket{stage="parse",le="1.0"} 2\n' in text
+    assert 'docker_analyzer_stage_seconds_bucket{stage="parse",le="+Inf"} 3\n' in text
+    assert 'docker_analyzer_stage_seconds_count{stage="parse"} 3\n' in text
+    # Stages not declared up front get their own histogram
+    observe('other', 0.2)
+    assert 'stage="other"' in render_prometheus()
+
+
+def test_metrics_are_summed_across_processes(tmp_path, monkeypatch):
+    env = dict(os.environ, DOCKER_ANALYZER_METRICS_DIR=str(tmp_path))
+    code = 'import telemetry; telemetry.observe("enrich", 0.2)'
+    for _ in range(2):
+        subprocess.run([sys.executable, '-c', code], env=env, check=True, cwd=os.path.dirname(telemetry.__file__))
+    monkeypatch.setattr(telemetry, 'METRICS_DIR', str(tmp_path))
+    monkeypatch.setattr(telemetry, '_HISTOGRAMS', {stage: Histogram() for stage in telemetry.STAGES})
+    monkeypatch.setattr(telemetry, '_PROCESS', {'pid': os.getpid(), 'file': None, 'flushed': 0.0})
+    observe('enrich', 0.3)
+    text = render_prometheus()
+    assert 'docker_analyzer_stage_seconds_count{stage="enrich"} 3\n' in text
+    assert 'docker_analyzer_stage_seconds_sum{stage="enrich"} 0.700000\n' in text
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_forked_process_starts_empty(monkeypatch):
+    monkeypatch.setattr(telemetry, '_HISTOGRAMS', {'parse': Histogram()})
+    observe('parse', 0.1)
+    # As seen from a worker forked after that observation
+    monkeypatch.setattr(telemetry, '_PROCESS', {'pid': -1, 'file': None, 'flushed': 0.0})
+    observe('parse', 0.1)
+    assert telemetry._HISTOGRAMS['parse'].count == 1
+
+
+def test_collect_timings_is_per_thread():
+    results = {}
+
+    def work(name, stages):
+        with collect_timings() as timings:
+            for stage in stages:
+                with timed(stage):
+                    pass
+        results[name] = timings
+
+    threads = [threading.Thread(target=work, args=(name, stages))
+               for name, stages in (('a', ['enrich', 'enrich']), ('b', ['manifests']))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert set(results['a']) == {'enrich', 'total'}
+    assert set(results['b']) == {'manifests', 'total'}
+
+
+def test_json_formatter_keeps_extra_fields():
+    record = logging.makeLogRecord({'name': 'docker_analyzer.app', 'levelname': 'INFO', 'msg': 'parsed %s',
+                                    'args': ('x',), 'path': 'Dockerfile', 'stages': 2})
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['msg'] == 'parsed x'
+    assert (entry['logger'], entry['level'], entry['path'], entry['stages']) == ('docker_analyzer.app', 'info',
+                                                                                 'Dockerfile', 2)
+
+
+def run_logged(level):
+    code = ('from telemetry import get_logger\n'
+            'log = get_logger("t")\n'
+            'log.debug("debug line", extra={"n": 1})\n'
+            'log.warning("warning line")\n')
+    env = dict(os.environ)
+    env.pop('DOCKER_ANALYZER_LOG_LEVEL', None)
+    if level:
+        env['DOCKER_ANALYZER_LOG_LEVEL'] = level
+    done = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, env=env)
+    return done.stdout, [json.loads(line) for line in done.stderr.splitlines()]
+
+
+def test_log_levels():
+    stdout, records = run_logged(None)
+    assert (stdout, records) == ('', [])
+
+    _, records = run_logged('warning')
+    assert [record['msg'] for record in records] == ['warning line']
+
+    _, records = run_logged('debug')
+    assert [(record['msg'], record.get('n')) for record in records] == [('debug line', 1), ('warning line', None)]
+
+
+def test_analysis_prints_nothing(capsys, monkeypatch):
+    import app
+    from cache import ResultCache
+
+    for name in ('DOCKERFILE_CACHE', 'LAYERS_CACHE', 'STAGE_LAYERS_CACHE'):
+        monkeypatch.setattr(app, name, ResultCache(name, path=''))
+    with collect_timings() as timings:
+        app.process('Dockerfile', content='FROM python:3.9-alpine\nRUN pip install flask\n')
+    assert capsys.readouterr().out == ''
+    assert {'dockerfile_parse', 'extract_layers', 'total'} <= set(timings)
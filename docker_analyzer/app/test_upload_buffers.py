@@ -0,0 +1,190 @@
+import io
+import sys
+import tarfile
+import zipfile
+import subprocess
+
+import pytest
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+import main
+import upload_buffers
+from upload_buffers import (
+    CappedBuffer, is_wanted, is_batch_wanted, read_archive, select_project_files, archive_items, jsonl_items
+)
+
+DOCKERFILE = b'FROM python:3.9-alpine\nRUN pip install flask\n'
+PROJECT = {
+    'project/Dockerfile': DOCKERFILE,
+    'project/requirements.txt': b'-r requirements/base.txt\nrequests==2.31.0\n',
+    'project/requirements/base.txt': b'click==8.1.7\n',
+    'project/package.json': b'{"dependencies": {"express": "^4.18.0"}}',
+    'project/src/app.py': b'print("hi")\n',
+    'project/node_modules/left-pad/package.json': b'{"dependencies": {"evil": "1"}}',
+    'project/vendor/lib/requirements.txt': b'evil==1\n',
+}
+
+
+@pytest.mark.parametrize('path, wanted', [
+    ('project/Dockerfile', True),
+    ('Dockerfile', True),
+    ('project/docker/Dockerfile', True),
+    ('project/package.json', True),
+    ('package.json', True),
+    ('project/requirements-dev.txt', True),
+    ('project/requirements/base.txt', True),
+    ('project/src/app.py', False),
+    ('project/frontend/package.json', False),
+    ('project/node_modules/left-pad/package.json', False),
+    ('project/node_modules/x/Dockerfile', False),
+    ('project/vendor/lib/requirements.txt', False),
+    ('project/a/b/requirements.txt', False),
+    ('project\\package.json', True),
+    ('', False),
+    (None, False),
+])
+def test_is_wanted(path, wanted):
+    assert is_wanted(path) is wanted
+
+
+def test_is_batch_wanted():
+    assert is_batch_wanted('svc/api/Dockerfile.prod')
+    assert is_batch_wanted('svc/api/package.json')
+    assert is_batch_wanted('svc/api/requirements.txt')
+    assert not is_batch_wanted('svc/api/node_modules/x/package.json')
+    assert not is_batch_wanted('svc/api/main.go')
+
+
+def test_web_app_does_not_load_the_batch_cli():
+    code = 'import sys, main; print("batch" in sys.modules)'
+    done = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert done.stdout.splitlines()[-1] == 'False'
+
+
+def tar_bytes(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def zip_bytes(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('pack, suffix', [(tar_bytes, '.tar.gz'), (zip_bytes, '.zip')])
+def test_read_archive_keeps_wanted_members(pack, suffix):
+    files = read_archive(io.BytesIO(pack(PROJECT)), suffix)
+    assert sorted(files) == [
+        'project/Dockerfile', 'project/package.json', 'project/requirements.txt', 'project/requirements/base.txt'
+    ]
+    assert files['project/Dockerfile'] == DOCKERFILE
+
+
+def test_archive_paths_cannot_escape():
+    with pytest.raises(BadRequest):
+        read_archive(io.BytesIO(tar_bytes({'../Dockerfile': DOCKERFILE})), '.tar')
+
+
+@pytest.mark.parametrize('pack, suffix', [(tar_bytes, '.tar.gz'), (zip_bytes, '.zip')])
+def test_wanted_members_are_capped_in_total(pack, suffix, monkeypatch):
+    monkeypatch.setattr(upload_buffers, 'UPLOAD_ARCHIVE_LIMIT', 2 * len(DOCKERFILE))
+    archive = pack({f'{name}/Dockerfile': DOCKERFILE for name in 'abc'})
+    with pytest.raises(RequestEntityTooLarge):
+        read_archive(io.BytesIO(archive), suffix, is_batch_wanted)
+    # Unwanted members do not count
+    archive = pack({'a/Dockerfile': DOCKERFILE, 'a/big.bin': DOCKERFILE * 10})
+    assert list(read_archive(io.BytesIO(archive), suffix, is_batch_wanted)) == ['a/Dockerfile']
+
+
+def test_chunked_tar_body_is_capped(monkeypatch):
+    archive = tar_bytes(PROJECT)
+
+    # No Content-Length: the body is counted as it is read
+    def post():
+        return main.app.test_client().post(
+            '/analyze', input_stream=io.BytesIO(archive), content_type='application/gzip',
+            headers={'Transfer-Encoding': 'chunked'}, environ_overrides={'wsgi.input_terminated': True}
+        )
+
+    monkeypatch.setattr(upload_buffers, 'UPLOAD_ARCHIVE_LIMIT', len(archive) - 1)
+    assert post().status_code == 413
+    monkeypatch.setattr(upload_buffers, 'UPLOAD_ARCHIVE_LIMIT', len(archive))
+    assert post().status_code == 200
+
+
+def test_capped_buffer():
+    buffer = CappedBuffer(4, 'x')
+    buffer.write(b'abcd')
+    with pytest.raises(RequestEntityTooLarge):
+        buffer.write(b'e')
+
+
+def test_select_project_files():
+    files = read_archive(io.BytesIO(tar_bytes(PROJECT)), '.tar.gz')
+    dockerfile, content, manifests = select_project_files(files)
+    assert dockerfile == 'project/Dockerfile'
+    assert content == DOCKERFILE.decode()
+    assert sorted(manifests) == ['package.json', 'requirements.txt', 'requirements/base.txt']
+
+
+def test_batch_items():
+    files = {
+        'a/Dockerfile': DOCKERFILE,
+        'a/requirements.txt': b'flask\n',
+        'b/api.dockerfile': b'FROM node:16\n',
+        'b/sub/package.json': b'{}',
+    }
+    items = list(archive_items(files))
+    assert [(item['path'], sorted(item['manifests'])) for item in items] == [
+        ('a/Dockerfile', ['requirements.txt']), ('b/api.dockerfile', [])
+    ]
+
+    lines = [b'{"id": "x", "dockerfile": "FROM alpine", "manifests": {"Go.mod": "module x"}}\n', b'not json\n', b'{}\n']
+    items = list(jsonl_items(io.BytesIO(b''.join(lines))))
+    assert items[0] == {'index': 0, 'id': 'x', 'path': 'x', 'key': 'x', 'dockerfile': 'FROM alpine',
+                        'manifests': {'go.mod': 'module x'}}
+    assert items[1]['error'].startswith('Invalid JSON')
+    assert items[2]['error'] == 'Missing "dockerfile" text'
+
+
+def test_oversized_jsonl_line_is_skipped(monkeypatch):
+    monkeypatch.setattr(upload_buffers, 'UPLOAD_FILE_LIMIT', 64)
+    lines = [b'{"id": "big", "dockerfile": "' + b'x' * 200 + b'"}\n', b'{"id": "y", "dockerfile": "FROM alpine"}\n']
+    stream = io.BytesIO(b''.join(lines))
+    reads = []
+    readline = stream.readline
+    monkeypatch.setattr(stream, 'readline', lambda size=-1: reads.append(size) or readline(size))
+    items = list(jsonl_items(stream))
+    assert items[0] == {'index': 0, 'id': None, 'error': 'line is larger than 64 bytes'}
+    assert (items[1]['index'], items[1]['id']) == (1, 'y')
+    assert -1 not in reads
+
+
+def without_timings(result):
+    result.pop('timings')
+    return result
+
+
+def test_in_memory_upload_matches_disk_upload(tmp_path, monkeypatch):
+    monkeypatch.setitem(main.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    client = main.app.test_client()
+
+    def form():
+        return {'folder_files': [(io.BytesIO(data), name) for name, data in PROJECT.items()]}
+
+    on_disk = without_timings(client.post('/analyze?in_memory=0', data=form()).get_json())
+    in_memory = without_timings(client.post('/analyze?in_memory=1', data=form()).get_json())
+    assert in_memory == on_disk
+    assert 'evil' not in ' '.join(in_memory['Dependencies Layer'])
+    assert 'click==8.1.7' in in_memory['Dependencies Layer']
+
+    archive = client.post('/analyze', data=tar_bytes(PROJECT), content_type='application/gzip').get_json()
+    assert without_timings(archive) == on_disk
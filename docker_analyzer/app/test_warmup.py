@@ -0,0 +1,51 @@
+import sys
+import shlex
+
+import pytest
+
+import bash_pool
+import bash_worker
+import warmup
+
+# Answers every request with an empty parser tree
+TREE_WORKER = [sys.executable, '-c', '''
+import sys, json
+for line in sys.stdin:
+    sys.stdout.write(json.dumps({"type": "Script", "commands": []}) + "\\n")
+    sys.stdout.flush()
+''']
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    monkeypatch.setattr(bash_pool, '_POOLS', {})
+    monkeypatch.setattr(bash_worker, 'BASH_PARSER', ['/nonexistent/bash-parser'])
+    yield
+    for pool in bash_pool._POOLS.values():
+        pool.close()
+
+
+def test_custom_worker_does_not_need_bash_parser(pools, monkeypatch):
+    monkeypatch.setenv('BASH_PARSER_WORKER', shlex.join(TREE_WORKER))
+    assert warmup._warm_bash_parser() == {'type': 'Script', 'commands': []}
+
+
+def test_missing_custom_worker(pools, monkeypatch):
+    monkeypatch.setenv('BASH_PARSER_WORKER', '/nonexistent/worker --stream')
+    with pytest.raises(FileNotFoundError, match='worker /nonexistent/worker'):
+        warmup._warm_bash_parser()
+
+
+def test_default_worker_needs_bash_parser(pools, monkeypatch):
+    monkeypatch.delenv('BASH_PARSER_WORKER', raising=False)
+    with pytest.raises(FileNotFoundError, match='bash parser /nonexistent/bash-parser'):
+        warmup._warm_bash_parser()
+    assert bash_pool._POOLS == {}
+
+
+def test_forked_worker_reports_its_own_start(monkeypatch):
+    # As seen from a worker forked from a master started long ago
+    monkeypatch.setattr(warmup, 'PROCESS_STARTED', 1.0)
+    monkeypatch.setitem(warmup._STATE, 'pid', -1)
+    warmup.readiness()
+    assert warmup.PROCESS_STARTED == pytest.approx(warmup._process_started(), abs=1)
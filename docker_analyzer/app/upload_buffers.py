@@ -0,0 +1,336 @@
+import io
+import os
+import json
+import zipfile
+import tarfile
+import posixpath
+
+from flask import Request
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+from dockerfiles import is_dockerfile
+from manifests import MANIFEST_NAMES, is_requirements_file
+
+# In-memory upload handling.
+#
+# Users upload whole project folders (node_modules included), but analysis
+# only ever reads the Dockerfile and a few manifests. InMemoryUploadRequest
+# hooks werkzeug's per-file stream factory so that, while the multipart body
+# is being parsed, wanted files go to capped in-memory buffers and every
+# other file is dropped as it streams past; nothing touches the disk.
+# A project can also be sent as one tar/zip archive, from which only the
+# wanted members are read.
+#
+# Batch requests (many Dockerfiles per request) arrive as JSONL or as an
+# archive; both are turned into the same item dicts:
+#   {'index', 'id', 'path', 'key', 'dockerfile', 'manifests'}   or   {'index', 'id', 'error'}
+# `key` is the name the caller gave the item (JSONL "path" or "id"), or None
+# when it only has a position in the upload; see run_batch in main.py.
+
+# Dependency trees and tool caches inside a project; their manifests and
+# Dockerfiles describe other projects
+SKIP_DIRS = {
+    'node_modules', 'bower_components', 'jspm_packages', 'vendor', 'site-packages',
+    '.git', '.hg', '.svn', '.venv', 'venv', '.tox', '.nox', '__pycache__',
+}
+UPLOAD_FILE_LIMIT = int(os.environ.get('UPLOAD_FILE_LIMIT', str(1024 * 1024)))
+UPLOAD_ARCHIVE_LIMIT = int(os.environ.get('UPLOAD_ARCHIVE_LIMIT', str(256 * 1024 * 1024)))
+# Default for requests that do not pass ?in_memory=0/1
+UPLOAD_IN_MEMORY = os.environ.get('UPLOAD_IN_MEMORY', '1') == '1'
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+# Request bodies that are a whole archive rather than a multipart form
+ARCHIVE_MIMETYPES = {
+    'application/x-tar': '.tar',
+    'application/gzip': '.tar.gz',
+    'application/x-gzip': '.tar.gz',
+    'application/zip': '.zip',
+}
+
+
+def _path_parts(path):
+    return [part for part in (path or '').replace('\\', '/').split('/') if part not in ('', '.')]
+
+
+def _skipped(parts):
+    return any(part.lower() in SKIP_DIRS for part in parts[:-1])
+
+
+# Decided from the whole upload path ('project/api/package.json'): Dockerfiles
+# anywhere, manifests in the upload's root folder, and requirements files up to
+# one folder below it, where requirements.txt can include them with -r;
+# nothing under node_modules/, vendor/ and the like
+def is_wanted(path):
+    parts = _path_parts(path)
+    if not parts or _skipped(parts):
+        return False
+    name = parts[-1].lower()
+    if name == 'dockerfile':
+        return True
+    if is_requirements_file(path):
+        return len(parts) <= 3
+    return name in MANIFEST_NAMES and len(parts) <= 2
+
+
+# Batch archives hold many projects: Dockerfile.prod, api.dockerfile, ... and
+# the manifests next to them at any depth
+def is_batch_wanted(path):
+    parts = _path_parts(path)
+    if not parts or _skipped(parts):
+        return False
+    name = parts[-1].lower()
+    return is_dockerfile(name) or name in MANIFEST_NAMES or is_requirements_file(path)
+
+
+def is_archive(path):
+    return bool(path) and path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+class CappedBuffer(io.BytesIO):
+    def __init__(self, limit, name=None):
+        super().__init__()
+        self.limit = limit
+        self.name = name
+
+    def write(self, data):
+        if self.tell() + len(data) > self.limit:
+            raise RequestEntityTooLarge(f'{self.name or "upload"} is larger than {self.limit} bytes')
+        return super().write(data)
+
+
+class CappedReader:
+    # Counts the bytes read from a stream of unknown length (a request body
+    # without Content-Length) against the same limit as CappedBuffer
+
+    def __init__(self, stream, limit, name=None):
+        self.stream = stream
+        self.limit = limit
+        self.name = name
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.count += len(data)
+        if self.count > self.limit:
+            raise RequestEntityTooLarge(f'{self.name or "upload"} is larger than {self.limit} bytes')
+        return data
+
+
+class DiscardStream(io.RawIOBase):
+    # Sink for uploaded files nobody will read
+
+    def writable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        return len(data)
+
+    def readinto(self, buffer):
+        return 0
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return 0
+
+
+class InMemoryUploadRequest(Request):
+    @property
+    def in_memory_upload(self):
+        flag = self.args.get('in_memory')
+        return UPLOAD_IN_MEMORY if flag is None else flag not in ('0', 'false', 'no')
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if not self.in_memory_upload:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        if is_wanted(filename):
+            return CappedBuffer(UPLOAD_FILE_LIMIT, filename)
+        if is_archive(filename):
+            return CappedBuffer(UPLOAD_ARCHIVE_LIMIT, filename)
+        return DiscardStream()
+
+
+def _normalize(path):
+    path = posixpath.normpath(path.replace('\\', '/')).lstrip('/')
+    if path == '.' or path.startswith('../'):
+        raise BadRequest(f'Invalid upload path {path}')
+    return path
+
+
+# Reads one wanted member. `total` is the size of those read before it; it
+# is capped at UPLOAD_ARCHIVE_LIMIT too, so a small compressed archive cannot
+# expand into an unbounded number of wanted files.
+def _read_member(read, name, size, total):
+    if size > UPLOAD_FILE_LIMIT:
+        raise RequestEntityTooLarge(f'{name} is larger than {UPLOAD_FILE_LIMIT} bytes')
+    if total + size > UPLOAD_ARCHIVE_LIMIT:
+        raise RequestEntityTooLarge(f'wanted files in the archive are larger than {UPLOAD_ARCHIVE_LIMIT} bytes')
+    return read()
+
+
+# {relative path: bytes} for the wanted members of a tar or zip archive
+def read_archive(fileobj, filename='', wanted=is_wanted):
+    files = {}
+    total = 0
+    if filename.lower().endswith('.zip'):
+        try:
+            archive = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile as e:
+            raise BadRequest(f'Invalid zip archive: {e}')
+        with archive:
+            for info in archive.infolist():
+                if not info.is_dir() and wanted(info.filename):
+                    data = files[_normalize(info.filename)] = _read_member(
+                        lambda: archive.read(info), info.filename, info.file_size, total
+                    )
+                    total += len(data)
+        return files
+
+    # Tar members are read in a single forward pass ('r|*'), so an archive
+    # can be consumed straight from the request body
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+            for member in archive:
+                if member.isfile() and wanted(member.name):
+                    data = files[_normalize(member.name)] = _read_member(
+                        lambda: archive.extractfile(member).read(), member.name, member.size, total
+                    )
+                    total += len(data)
+    except tarfile.TarError as e:
+        raise BadRequest(f'Invalid tar archive: {e}')
+    return files
+
+
+# {relative path: bytes} for the wanted files of a multipart upload; an
+# uploaded archive is unpacked the same way
+def read_uploads(storages, wanted=is_wanted):
+    files = {}
+    for storage in storages:
+        if wanted(storage.filename):
+            files[_normalize(storage.filename)] = storage.stream.read()
+        elif is_archive(storage.filename):
+            files.update(read_archive(storage.stream, storage.filename, wanted))
+    return files
+
+
+# {relative path: bytes} for the wanted members of an archive sent as the
+# raw request body. Tar is read straight off the socket, counting bytes as
+# they arrive; zip keeps its index at the end, so the body is buffered
+# (capped) first.
+def read_request_archive(request, wanted=is_wanted):
+    suffix = ARCHIVE_MIMETYPES[request.mimetype]
+    if request.content_length is not None and request.content_length > UPLOAD_ARCHIVE_LIMIT:
+        raise RequestEntityTooLarge(f'archive is larger than {UPLOAD_ARCHIVE_LIMIT} bytes')
+    stream = request.stream
+    if suffix == '.zip':
+        buffer = CappedBuffer(UPLOAD_ARCHIVE_LIMIT, 'archive')
+        for chunk in iter(lambda: stream.read(64 * 1024), b''):
+            buffer.write(chunk)
+        buffer.seek(0)
+        stream = buffer
+    else:
+        stream = CappedReader(stream, UPLOAD_ARCHIVE_LIMIT, 'archive')
+    return read_archive(stream, suffix, wanted)
+
+
+# Shallowest Dockerfile and the manifests next to the top of the upload
+def select_project_files(files):
+    dockerfiles = sorted(
+        (path for path in files if posixpath.basename(path).lower() == 'dockerfile'),
+        key=lambda path: (path.count('/'), path)
+    )
+    if not dockerfiles:
+        return None, None, {}
+    dockerfile = dockerfiles[0]
+
+    # Same rule as a saved folder: manifests live in the upload's root folder;
+    # requirements files below it are kept by relative path for -r includes
+    tops = {path.split('/', 1)[0] for path in files if '/' in path}
+    root = tops.pop() if len(tops) == 1 and all('/' in path for path in files) else ''
+    prefix = root + '/' if root else ''
+    manifests = {}
+    for path, data in files.items():
+        if posixpath.basename(path).lower() == 'dockerfile' or not path.startswith(prefix):
+            continue
+        if posixpath.dirname(path) == root:
+            manifests[posixpath.basename(path).lower()] = data.decode('utf-8', errors='replace')
+        elif is_requirements_file(path):
+            manifests[path[len(prefix):].lower()] = data.decode('utf-8', errors='replace')
+    return dockerfile, files[dockerfile].decode('utf-8', errors='replace'), manifests
+
+
+def _manifests(files, paths):
+    return {
+        posixpath.basename(path).lower(): files[path].decode('utf-8', errors='replace')
+        for path in paths
+    }
+
+
+# One batch item per Dockerfile in the archive, with the manifests found in
+# the same directory
+def archive_items(files):
+    by_dir = {}
+    for path in files:
+        name = posixpath.basename(path).lower()
+        if name in MANIFEST_NAMES or is_requirements_file(path):
+            by_dir.setdefault(posixpath.dirname(path), []).append(path)
+
+    dockerfiles = sorted(path for path in files if is_dockerfile(posixpath.basename(path)))
+    for index, path in enumerate(dockerfiles):
+        yield {
+            'index': index,
+            'id': path,
+            'path': path,
+            'key': None,
+            'dockerfile': files[path].decode('utf-8', errors='replace'),
+            'manifests': _manifests(files, by_dir.get(posixpath.dirname(path), ())),
+        }
+
+
+# One batch item per JSONL line:
+#   {"id": "svc-a", "path": "svc-a/Dockerfile", "dockerfile": "FROM ...",
+#    "manifests": {"requirements.txt": "..."}}
+# Only "dockerfile" is required. Malformed lines become error items. A line
+# is never held in memory past UPLOAD_FILE_LIMIT bytes: the rest of an
+# oversized line is read and dropped in chunks.
+def jsonl_items(stream):
+    lines = iter(lambda: stream.readline(UPLOAD_FILE_LIMIT + 1), b'')
+    for index, line in enumerate(lines):
+        if len(line) > UPLOAD_FILE_LIMIT:
+            yield {'index': index, 'id': None, 'error': f'line is larger than {UPLOAD_FILE_LIMIT} bytes'}
+            while not line.endswith(b'\n'):
+                line = stream.readline(64 * 1024)
+                if not line:
+                    break
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError as e:
+            yield {'index': index, 'id': None, 'error': f'Invalid JSON: {e}'}
+            continue
+        if not isinstance(entry, dict) or not isinstance(entry.get('dockerfile'), str):
+            item_id = entry.get('id') if isinstance(entry, dict) else None
+            yield {'index': index, 'id': item_id, 'error': 'Missing "dockerfile" text'}
+            continue
+        manifests = entry.get('manifests') or {}
+        if not isinstance(manifests, dict):
+            yield {'index': index, 'id': entry.get('id'), 'error': '"manifests" must be an object'}
+            continue
+        key = entry.get('path') or entry.get('id')
+        yield {
+            'index': index,
+            'id': entry.get('id', index),
+            'path': str(entry.get('path') or entry.get('id', index)),
+            'key': None if key is None or key == '' else str(key),
+            'dockerfile': entry['dockerfile'],
+            'manifests': {
+                str(name).lower(): text for name, text in manifests.items() if isinstance(text, str)
+            },
+        }
@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import threading
+
+from telemetry import get_logger
+
+# Startup warm-up and readiness.
+#
+# A cold worker pays for the first Dockerfile parse, the first pass over the
+# layer rules and manifest parsers and, in DEPENDENCY_MODE=semantic, for
+# starting the bash parser and app.ts enricher processes (the enricher loads
+# every command spec on its first tree). Warm-up does all of that once, up
+# front, on a small sample project, and times every phase.
+#
+# It has two halves so that pre-fork servers can share the first one:
+#
+#   warm_shared()   in-process work only (no threads, no child processes);
+#                   safe in a gunicorn master before it forks, so every
+#                   worker starts with the warmed pages via copy-on-write
+#   warm_workers()  the parser/enricher pools, which belong to one process
+#                   and are started after the fork
+#
+# readiness() reports ready only once both halves succeeded in the calling
+# process; main.py serves it on /ready (503 until then). With the Flask dev
+# server or another WSGI server warm-up runs in a background thread, started
+# at launch or by the first /ready probe. gunicorn.conf.py wires the halves
+# into gunicorn's hooks.
+#
+#   python warmup.py [--first-request]    print the startup report
+
+log = get_logger('warmup')
+
+# background: warm in a thread while serving; blocking: warm before serving;
+# off: never warm (readiness is reported once the process is up)
+WARMUP = os.environ.get('WARMUP', 'background')
+
+SAMPLE_DOCKERFILE = '''\
+ARG PYTHON=3.11
+FROM python:${PYTHON}-slim AS build
+ENV PIP_NO_CACHE_DIR=1
+RUN apt-get update && apt-get install -y --no-install-recommends curl gcc \\
+    && rm -rf /var/lib/apt/lists/*
+COPY requirements.txt /app/
+RUN pip install -r /app/requirements.txt
+FROM build
+WORKDIR /app
+COPY --from=build /app /app
+CMD ["python", "app.py"]
+'''
+SAMPLE_MANIFESTS = {
+    'requirements.txt': 'flask==2.1.1\nrequests>=2.0\n',
+    'package.json': '{"dependencies": {"express": "^4.18.0"}}',
+    'pom.xml': '<project><dependencies><dependency><artifactId>guava</artifactId></dependency></dependencies></project>',
+}
+SAMPLE_BASH = 'apt-get update && apt-get install -y --no-install-recommends curl gcc'
+
+_LOCK = threading.Lock()
+_STATE = {
+    'status': 'cold',   # cold / warming / ready / failed
+    'pid': os.getpid(),
+    'shared_pid': None,  # process that ran warm_shared (the master, if preloaded)
+    'shared': False,
+    'workers': False,
+    'phases': {},        # phase -> ms
+    'errors': {},        # phase -> message
+    'started': None,
+    'finished': None,
+}
+_THREAD = None
+
+
+def _process_started():
+    # Wall-clock start of this process (fork time for a forked worker)
+    try:
+        with open('/proc/self/stat') as fh:
+            ticks = int(fh.read().rpartition(')')[2].split()[19])
+        with open('/proc/uptime') as fh:
+            uptime = float(fh.read().split()[0])
+        return time.time() - uptime + ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+PROCESS_STARTED = _process_started()
+
+
+def _check_fork():
+    # A forked worker inherits the master's state: keep its shared phases,
+    # redo everything that belongs to a process, its start time included
+    global PROCESS_STARTED
+    if _STATE['pid'] != os.getpid():
+        PROCESS_STARTED = _process_started()
+        _STATE['pid'] = os.getpid()
+        _STATE['workers'] = False
+        _STATE['status'] = 'cold'
+        _STATE['started'] = _STATE['finished'] = None
+        for phase in ('bash_parser', 'enricher'):
+            _STATE['phases'].pop(phase, None)
+            _STATE['errors'].pop(phase, None)
+
+
+def _phase(name, fn):
+    start = time.perf_counter()
+    try:
+        result = fn()
+    except Exception as e:
+        _STATE['errors'][name] = f'{e.__class__.__name__}: {e}'
+        log.warning('warm-up phase failed', extra={'phase': name, 'error': str(e)})
+        result = None
+    else:
+        _STATE['errors'].pop(name, None)
+    _STATE['phases'][name] = round((time.perf_counter() - start) * 1000, 3)
+    return result
+
+
+def warm_shared():
+    from app import extract_layers
+    from directives import build_ast
+    from manifests import iter_dependencies
+
+    with _LOCK:
+        _check_fork()
+        if _STATE['shared']:
+            return
+        ast = _phase('dockerfile_parse', lambda: build_ast(SAMPLE_DOCKERFILE))
+        if ast is not None:
+            _phase('extract_layers', lambda: extract_layers(ast))
+        _phase('manifests', lambda: list(iter_dependencies(SAMPLE_MANIFESTS)))
+        _STATE['shared'] = not any(
+            phase in _STATE['errors'] for phase in ('dockerfile_parse', 'extract_layers', 'manifests')
+        )
+        _STATE['shared_pid'] = os.getpid()
+
+
+def _warm_bash_parser():
+    import bash_filters
+    from bash_pool import DEFAULT_WORKER, get_pool, worker_command
+    from bash_worker import BASH_PARSER
+
+    # The pool runs BASH_PARSER_WORKER; only the default worker wraps
+    # BASH_PARSER
+    command = worker_command()
+    if shutil.which(command[0]) is None:
+        raise FileNotFoundError(f'bash parser worker {command[0]} not found')
+    if command == DEFAULT_WORKER and shutil.which(BASH_PARSER[0]) is None:
+        raise FileNotFoundError(f'bash parser {BASH_PARSER[0]} not found')
+    pool = get_pool()
+    pool.start()
+    raw = pool.parse(SAMPLE_BASH)
+    if raw is None:
+        raise RuntimeError('bash parser returned no tree')
+    return bash_filters.upgrade(raw)
+
+
+def _warm_enricher(tree):
+    from bash_pool import get_enrich_pool
+
+    pool = get_enrich_pool()
+    pool.start()
+    # The first tree makes the enricher load its command specs
+    if pool.parse(tree) is None:
+        raise RuntimeError('enricher returned no tree')
+
+
+def warm_workers():
+    from app import DEPENDENCY_MODE
+
+    with _LOCK:
+        _check_fork()
+        if _STATE['workers']:
+            return
+        # The parser and enricher pools are only used for semantic dependencies
+        if DEPENDENCY_MODE == 'semantic':
+            tree = _phase('bash_parser', _warm_bash_parser)
+            if tree is not None:
+                _phase('enricher', lambda: _warm_enricher(tree))
+            elif 'enricher' not in _STATE['errors']:
+                _STATE['errors']['enricher'] = 'skipped: no parser tree to enrich'
+        _STATE['workers'] = not any(phase in _STATE['errors'] for phase in ('bash_parser', 'enricher'))
+
+
+def warm():
+    with _LOCK:
+        _check_fork()
+        _STATE['status'] = 'warming'
+        _STATE['started'] = time.time()
+    warm_shared()
+    warm_workers()
+    with _LOCK:
+        _STATE['finished'] = time.time()
+        _STATE['status'] = 'ready' if _STATE['shared'] and _STATE['workers'] else 'failed'
+    report = readiness()
+    log.info('warm-up finished', extra={'startup': report})
+    return report
+
+
+# Starts warm-up once per process according to WARMUP (or `mode`)
+def start_warmup(mode=None):
+    global _THREAD
+    mode = mode or WARMUP
+    with _LOCK:
+        _check_fork()
+        if _STATE['status'] != 'cold' or mode == 'off':
+            return
+        if mode == 'background':
+            _STATE['status'] = 'warming'
+            _THREAD = threading.Thread(target=warm, name='warmup', daemon=True)
+            _THREAD.start()
+            return
+    warm()
+
+
+def readiness():
+    with _LOCK:
+        _check_fork()
+        state = dict(_STATE)
+    if WARMUP == 'off':
+        state['status'] = 'ready'
+    report = {
+        'ready': state['status'] == 'ready',
+        'status': state['status'],
+        'pid': state['pid'],
+        'preloaded': state['shared_pid'] is not None and state['shared_pid'] != state['pid'],
+        'phases': dict(state['phases']),
+        'errors': dict(state['errors']),
+    }
+    if state['started'] and state['finished']:
+        report['warmup_ms'] = round((state['finished'] - state['started']) * 1000, 3)
+    if PROCESS_STARTED and state['finished']:
+        report['ready_after_ms'] = round((state['finished'] - PROCESS_STARTED) * 1000, 3)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Warm up the analyzer and print the startup report')
+    parser.add_argument('--first-request', action='store_true',
+                        help='also time one analysis of the sample project after warm-up')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    import main as service  # noqa: F401  (Flask app, routes, pools)
+    imported = time.perf_counter()
+    report = warm()
+    report['import_ms'] = round((imported - start) * 1000, 3)
+    if args.first_request:
+        files = {'sample/Dockerfile': SAMPLE_DOCKERFILE.encode('utf-8')}
+        files.update({f'sample/{name}': text.encode('utf-8') for name, text in SAMPLE_MANIFESTS.items()})
+        first = time.perf_counter()
+        service.analyze_buffers(files)
+        report['first_request_ms'] = round((time.perf_counter() - first) * 1000, 3)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0 if report['ready'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())